@@ -11,4 +11,7 @@ cd $ANALYTICS_ZOO_ROOT/python/chronos/benchmark/tsdataset_processing/
 echo "Chronos_Perf: Running TSDataset Processing Baseline"
 source bigdl-nano-init
 python tsdataset_processing.py --name "TSDataset Processing Baseline on nyc_taxi"
+
+echo "Chronos_Perf: Running TSDataset Roll Peak Memory"
+python tsdataset_roll_memory.py --length 200000 --lookback 336 --horizon 24
 source bigdl-nano-unset-env
@@ -0,0 +1,112 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Compare the peak RSS of TSDataset.roll between the strided rolling engine
+# and the previous shift-and-concatenate implementation on synthetic data.
+
+import json
+import time
+import resource
+import argparse
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+
+parser = argparse.ArgumentParser(description="TSDataset roll peak memory")
+parser.add_argument("--num_id", default=1, type=int)
+parser.add_argument("--length", default=200000, type=int)
+parser.add_argument("--num_feature", default=4, type=int)
+parser.add_argument("--lookback", default=336, type=int)
+parser.add_argument("--horizon", default=24, type=int)
+
+
+def _legacy_shift(arr, num, fill_value=np.nan):
+    result = np.empty_like(arr)
+    if num > 0:
+        result[:num] = fill_value
+        result[num:] = arr[:-num]
+    elif num < 0:
+        result[num:] = fill_value
+        result[:num] = arr[-num:]
+    else:
+        result[:] = arr
+    return result
+
+
+def _legacy_roll_timeseries_ndarray(data, window):
+    data = np.expand_dims(data, axis=1)
+    window_size = window if isinstance(window, int) else max(window)
+    if isinstance(window, int):
+        window_idx = np.arange(window)
+    else:
+        window_idx = np.array(window) - 1
+    roll_data = np.concatenate([_legacy_shift(data, i) for i in range(0, -window_size, -1)],
+                               axis=1)
+    if data.shape[0] >= window_size:
+        roll_data = roll_data[:data.shape[0]-window_size+1, window_idx, :]
+    else:
+        roll_data = roll_data[:0, window_idx, :]
+    mask = ~np.any(np.isnan(roll_data), axis=(1, 2))
+    return roll_data, mask
+
+
+def generate_tsdata(args):
+    from bigdl.chronos.data import TSDataset
+    np.random.seed(0)
+    df = pd.DataFrame(np.random.randn(args.num_id * args.length, args.num_feature + 1),
+                      columns=["value"] + [f"f{i}" for i in range(args.num_feature)])
+    df["id"] = np.repeat(np.arange(args.num_id), args.length)
+    df["datetime"] = np.tile(pd.date_range("1/1/2019", periods=args.length, freq="H"),
+                             args.num_id)
+    return TSDataset.from_pandas(df, dt_col="datetime", target_col="value", id_col="id",
+                                 extra_feature_col=[f"f{i}" for i in range(args.num_feature)])
+
+
+def run(args, engine, queue):
+    import bigdl.chronos.data.utils.roll as roll_utils
+    if engine == "legacy":
+        roll_utils._roll_timeseries_ndarray = _legacy_roll_timeseries_ndarray
+    tsdata = generate_tsdata(args)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    tsdata.roll(lookback=args.lookback, horizon=args.horizon)
+    x, y = tsdata.to_numpy()
+    # touch the result so that lazily mapped pages are counted as well
+    checksum = float(x.sum() + y.sum())
+    roll_time = time.time() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({"engine": engine,
+               "roll_time": roll_time,
+               "peak_rss_mb": peak_rss / 1024,
+               "roll_peak_rss_increment_mb": (peak_rss - base_rss) / 1024,
+               "x_shape": list(x.shape),
+               "checksum": checksum})
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    ctx = mp.get_context("spawn")
+    records = []
+    for engine in ["legacy", "strided"]:
+        # run each engine in a fresh process so that ru_maxrss is not shared
+        queue = ctx.Queue()
+        p = ctx.Process(target=run, args=(args, engine, queue))
+        p.start()
+        records.append(queue.get())
+        p.join()
+
+    output = json.dumps({"config": vars(args), "records": records})
+    print(f'>>>{output}<<<')
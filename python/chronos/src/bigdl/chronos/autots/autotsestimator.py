@@ -59,6 +59,7 @@ class AutoTSEstimator:
                  cpus_per_trial=1,
                  name="autots_estimator",
                  remote_dir=None,
+                 roll_cache_dir=None,
                  ):
         """
         AutoTSEstimator trains a model for time series forecasting.
@@ -124,6 +125,10 @@ class AutoTSEstimator:
         :param remote_dir: String. Remote directory to sync training results and checkpoints. It
                defaults to None and doesn't take effects while running in local. While running in
                cluster, it defaults to "hdfs:///tmp/{name}".
+        :param roll_cache_dir: String. Local directory to cache the rolled TSDataset. It
+               defaults to None, which means each trial rolls the TSDataset by itself. If set,
+               trials with the same past_seq_len and selected features will load the rolled
+               ndarrays from the memory-mapped cache in this directory instead of rolling again.
         """
         from bigdl.nano.utils.common import invalidInputError
 
@@ -188,6 +193,7 @@ class AutoTSEstimator:
         # save selected features setting for data creator generation
         self.selected_features = selected_features
         self.backend = backend
+        self.roll_cache_dir = roll_cache_dir
         self._scaler = None
         self._scaler_index = None
 
@@ -349,7 +355,8 @@ class AutoTSEstimator:
 
                 x, y = train_d.roll(lookback=config.get('past_seq_len'),
                                     horizon=self._future_seq_len,
-                                    feature_col=config['selected_features']) \
+                                    feature_col=config['selected_features'],
+                                    cache_dir=self.roll_cache_dir) \
                               .to_numpy()
 
                 return DataLoader(TensorDataset(torch.from_numpy(x).float(),
@@ -362,7 +369,8 @@ class AutoTSEstimator:
 
                 x, y = val_d.roll(lookback=config.get('past_seq_len'),
                                   horizon=self._future_seq_len,
-                                  feature_col=config['selected_features']) \
+                                  feature_col=config['selected_features'],
+                                  cache_dir=self.roll_cache_dir) \
                             .to_numpy()
 
                 return DataLoader(TensorDataset(torch.from_numpy(x).float(),
@@ -378,7 +386,8 @@ class AutoTSEstimator:
 
                 train_d.roll(lookback=config.get('past_seq_len'),
                              horizon=self._future_seq_len,
-                             feature_col=config['selected_features'])
+                             feature_col=config['selected_features'],
+                             cache_dir=self.roll_cache_dir)
 
                 return train_d.to_tf_dataset(batch_size=config["batch_size"],
                                              shuffle=True)
@@ -388,7 +397,8 @@ class AutoTSEstimator:
 
                 val_d.roll(lookback=config.get('past_seq_len'),
                            horizon=self._future_seq_len,
-                           feature_col=config['selected_features'])
+                           feature_col=config['selected_features'],
+                           cache_dir=self.roll_cache_dir)
 
                 return val_d.to_tf_dataset(batch_size=config["batch_size"],
                                            shuffle=False)
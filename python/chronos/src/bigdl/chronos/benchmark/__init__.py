@@ -16,4 +16,5 @@
 
 from .models import generate_forecaster
 from .utils_data import generate_data
-from .env_check import get_CPU_info, check_nano_env
\ No newline at end of file
+from .env_check import get_CPU_info, check_nano_env
+from .suite import BenchmarkSuite, save_records, load_records, compare_records
@@ -0,0 +1,390 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import csv
+import json
+import time
+import threading
+import itertools
+
+import numpy as np
+
+SUPPORTED_MODELS = ("lstm", "tcn", "seq2seq", "nbeats")
+SUPPORTED_ACCELERATORS = ("original", "jit", "onnx", "openvino", "int8")
+# the fields identifying a benchmark record
+RECORD_KEYS = ("model", "accelerator", "batch_size", "thread_num")
+# the metrics compared with a baseline, and whether a larger value is better
+REGRESSION_METRICS = {"throughput": True,
+                      "latency_p50": False,
+                      "latency_p90": False,
+                      "latency_p99": False,
+                      "peak_memory": False}
+
+
+class _PeakMemoryMonitor:
+    '''
+    Sample the resident memory (in MB) of the current process in a background thread, and
+    keep the peak.
+    '''
+    def __init__(self, interval=0.005):
+        import psutil
+        self.interval = interval
+        self.peak = None
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while True:
+            rss = self._process.memory_info().rss / 2**20
+            self.peak = rss if self.peak is None else max(self.peak, rss)
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+
+def _create_forecaster(model, lookback, horizon, input_feature_num, output_feature_num):
+    from bigdl.nano.utils.common import invalidInputError
+    if model == "lstm":
+        invalidInputError(horizon == 1, "LSTMForecaster only supports horizon=1.")
+        from bigdl.chronos.forecaster import LSTMForecaster
+        return LSTMForecaster(past_seq_len=lookback,
+                              input_feature_num=input_feature_num,
+                              output_feature_num=output_feature_num)
+    if model == "tcn":
+        from bigdl.chronos.forecaster import TCNForecaster
+        return TCNForecaster(past_seq_len=lookback,
+                             future_seq_len=horizon,
+                             input_feature_num=input_feature_num,
+                             output_feature_num=output_feature_num)
+    if model == "seq2seq":
+        from bigdl.chronos.forecaster import Seq2SeqForecaster
+        return Seq2SeqForecaster(past_seq_len=lookback,
+                                 future_seq_len=horizon,
+                                 input_feature_num=input_feature_num,
+                                 output_feature_num=output_feature_num)
+    if model == "nbeats":
+        invalidInputError(input_feature_num == 1 and output_feature_num == 1,
+                          "NBeatsForecaster only supports univariate data.")
+        from bigdl.chronos.forecaster import NBeatsForecaster
+        return NBeatsForecaster(past_seq_len=lookback,
+                                future_seq_len=horizon)
+    invalidInputError(False,
+                      f"model should be one of {SUPPORTED_MODELS}, but found {model}.")
+
+
+def _get_predict_fn(forecaster, accelerator, thread_num, calib_data):
+    # build the accelerated model if needed, and return a function to predict a batch
+    if accelerator == "original":
+        import torch
+        torch.set_num_threads(thread_num)
+        return lambda x: forecaster.predict(x, batch_size=len(x), acceleration=False)
+    if accelerator == "jit":
+        forecaster.build_jit(thread_num=thread_num)
+        return lambda x: forecaster.predict_with_jit(x, batch_size=len(x))
+    if accelerator == "onnx":
+        forecaster.build_onnx(thread_num=thread_num)
+        return lambda x: forecaster.predict_with_onnx(x, batch_size=len(x))
+    if accelerator == "openvino":
+        forecaster.build_openvino(thread_num=thread_num)
+        return lambda x: forecaster.predict_with_openvino(x, batch_size=len(x))
+    forecaster.quantize(calib_data, framework="pytorch_fx", thread_num=thread_num)
+    return lambda x: forecaster.predict(x, batch_size=len(x), quantize=True)
+
+
+def _get_latency_stats(latency, batch_size):
+    # latency in seconds to a dict of milliseconds
+    latency = np.asarray(latency) * 1000
+    p50, p90, p99 = np.percentile(latency, [50, 90, 99])
+    return {"latency_mean": float(latency.mean()),
+            "latency_p50": float(p50),
+            "latency_p90": float(p90),
+            "latency_p99": float(p99),
+            "throughput": float(batch_size * 1000 / latency.mean())}
+
+
+class BenchmarkSuite:
+    """
+        Example:
+            >>> suite = BenchmarkSuite(models=["tcn", "lstm"],
+            >>>                        accelerators=["original", "onnx", "jit"],
+            >>>                        batch_sizes=[1, 32], thread_nums=[1, 4])
+            >>> records = suite.run()
+            >>> suite.save("benchmark.json")
+            >>> # in a later run, e.g. after an upgrade
+            >>> regressions = suite.compare(BenchmarkSuite.load("benchmark.json"),
+            >>>                             tolerance=0.1)
+    """
+
+    def __init__(self,
+                 models=("tcn",),
+                 accelerators=("original",),
+                 batch_sizes=(1,),
+                 thread_nums=(1,),
+                 lookback=48,
+                 horizon=1,
+                 input_feature_num=1,
+                 output_feature_num=1,
+                 num_running=100,
+                 num_warmup=10,
+                 train_epochs=1,
+                 num_train_samples=256,
+                 forecaster_fn=None,
+                 seed=0):
+        """
+        Build a benchmark suite, which sweeps model x accelerator x batch size x thread
+        number on synthetic data, and records the throughput, p50/p90/p99 latency and peak
+        memory of the prediction in each setting.
+
+        :param models: a list of forecaster names in "lstm", "tcn", "seq2seq", "nbeats",
+               or any names if forecaster_fn is set.
+        :param accelerators: a list of accelerators in "original" (the pytorch model),
+               "jit", "onnx", "openvino" and "int8" (pytorch_fx static quantization).
+        :param batch_sizes: a list of the number of samples predicted in each call.
+        :param thread_nums: a list of the number of threads used by the prediction.
+        :param lookback: the lookback of the synthetic data.
+        :param horizon: the horizon of the synthetic data.
+        :param input_feature_num: the feature number of the synthetic input.
+        :param output_feature_num: the target number of the synthetic output.
+        :param num_running: the number of timed prediction calls in each setting.
+        :param num_warmup: the number of untimed prediction calls before timing.
+        :param train_epochs: the number of epochs to fit the forecasters before prediction.
+        :param num_train_samples: the number of synthetic samples to fit the forecasters.
+        :param forecaster_fn: an optional function which takes a model name and returns a
+               new forecaster, to benchmark forecasters with other configurations.
+        :param seed: the random seed of the synthetic data.
+        """
+        from bigdl.nano.utils.common import invalidInputError
+        for accelerator in accelerators:
+            invalidInputError(accelerator in SUPPORTED_ACCELERATORS,
+                              f"accelerator should be one of {SUPPORTED_ACCELERATORS}, "
+                              f"but found {accelerator}.")
+        invalidInputError(num_running > 0,
+                          f"num_running should be positive, but found {num_running}.")
+        self.models = list(models)
+        self.accelerators = list(accelerators)
+        self.batch_sizes = list(batch_sizes)
+        self.thread_nums = list(thread_nums)
+        self.lookback = lookback
+        self.horizon = horizon
+        self.input_feature_num = input_feature_num
+        self.output_feature_num = output_feature_num
+        self.num_running = num_running
+        self.num_warmup = num_warmup
+        self.train_epochs = train_epochs
+        self.num_train_samples = num_train_samples
+        self.forecaster_fn = forecaster_fn
+        self.seed = seed
+        self.records = []
+
+    def _generate_data(self, num_samples):
+        rng = np.random.default_rng(self.seed)
+        x = rng.standard_normal((num_samples, self.lookback, self.input_feature_num),
+                                dtype=np.float32)
+        y = rng.standard_normal((num_samples, self.horizon, self.output_feature_num),
+                                dtype=np.float32)
+        return x, y
+
+    def _create_forecaster(self, model):
+        if self.forecaster_fn is not None:
+            return self.forecaster_fn(model)
+        return _create_forecaster(model, self.lookback, self.horizon,
+                                  self.input_feature_num, self.output_feature_num)
+
+    def _run_one(self, predict_fn, x):
+        for _ in range(self.num_warmup):
+            predict_fn(x)
+        latency = []
+        with _PeakMemoryMonitor() as monitor:
+            for _ in range(self.num_running):
+                start = time.perf_counter()
+                predict_fn(x)
+                latency.append(time.perf_counter() - start)
+        stats = _get_latency_stats(latency, len(x))
+        stats["peak_memory"] = monitor.peak
+        return stats
+
+    def run(self):
+        """
+        Run all the settings. A setting which fails (e.g. the accelerator is not installed)
+        is recorded with its error and the others keep running.
+
+        :return: a list of records, each is a dict of "model", "accelerator", "batch_size",
+                 "thread_num", "throughput" (samples per second), "latency_mean",
+                 "latency_p50", "latency_p90", "latency_p99" (in milliseconds) and
+                 "peak_memory" (resident memory in MB), or "error" if failed.
+        """
+        train_data = self._generate_data(self.num_train_samples)
+        test_x, _ = self._generate_data(max(self.batch_sizes))
+        self.records = []
+        for model in self.models:
+            try:
+                forecaster = self._create_forecaster(model)
+                forecaster.fit(train_data, epochs=self.train_epochs)
+                model_error = None
+            except Exception as e:
+                # all the settings of this model fail with the error
+                model_error = f"{type(e).__name__}: {e}"
+            for accelerator, thread_num in itertools.product(self.accelerators,
+                                                             self.thread_nums):
+                if model_error is not None:
+                    predict_fn, error = None, model_error
+                else:
+                    try:
+                        predict_fn = _get_predict_fn(forecaster, accelerator, thread_num,
+                                                     train_data)
+                    except Exception as e:
+                        predict_fn, error = None, f"{type(e).__name__}: {e}"
+                for batch_size in self.batch_sizes:
+                    record = {"model": model, "accelerator": accelerator,
+                              "batch_size": batch_size, "thread_num": thread_num}
+                    if predict_fn is None:
+                        record["error"] = error
+                    else:
+                        try:
+                            record.update(self._run_one(predict_fn, test_x[:batch_size]))
+                        except Exception as e:
+                            record["error"] = f"{type(e).__name__}: {e}"
+                    self.records.append(record)
+        return self.records
+
+    def save(self, path):
+        """
+        Save the records to a json or csv file, according to the extension of path.
+
+        :param path: the file path, ends with ".json" or ".csv".
+        """
+        save_records(self.records, path)
+
+    @staticmethod
+    def load(path):
+        """
+        Load the records saved by `save`.
+
+        :param path: the file path, ends with ".json" or ".csv".
+
+        :return: a list of records.
+        """
+        return load_records(path)
+
+    def compare(self, baseline, tolerance=0.1, metrics=None):
+        """
+        Compare the records of the latest `run` with baseline records, please refer to
+        `compare_records` for details.
+        """
+        return compare_records(self.records, baseline, tolerance=tolerance, metrics=metrics)
+
+
+def save_records(records, path):
+    """
+    Save benchmark records to a json or csv file, according to the extension of path.
+    """
+    from bigdl.nano.utils.common import invalidInputError
+    ext = os.path.splitext(path)[1].lower()
+    invalidInputError(ext in (".json", ".csv"),
+                      f"path should end with '.json' or '.csv', but found {path}.")
+    if ext == ".json":
+        with open(path, "w") as f:
+            json.dump(records, f, indent=2)
+    else:
+        fields = list(RECORD_KEYS)
+        for record in records:
+            fields += [k for k in record if k not in fields]
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(records)
+
+
+def load_records(path):
+    """
+    Load benchmark records from a json or csv file saved by `save_records`.
+    """
+    from bigdl.nano.utils.common import invalidInputError
+    ext = os.path.splitext(path)[1].lower()
+    invalidInputError(ext in (".json", ".csv"),
+                      f"path should end with '.json' or '.csv', but found {path}.")
+    with open(path, newline="" if ext == ".csv" else None) as f:
+        if ext == ".json":
+            return json.load(f)
+        records = []
+        for row in csv.DictReader(f):
+            record = {}
+            for k, v in row.items():
+                if v == "":
+                    continue
+                try:
+                    record[k] = int(v) if k in ("batch_size", "thread_num") else float(v)
+                except ValueError:
+                    record[k] = v
+            records.append(record)
+        return records
+
+
+def compare_records(records, baseline, tolerance=0.1, metrics=None):
+    """
+    Compare benchmark records with baseline records of the same settings (model,
+    accelerator, batch_size and thread_num), and flag the regressions, i.e. throughput
+    lower than (1 - tolerance) of the baseline, latency/peak memory higher than
+    (1 + tolerance) of the baseline, or a setting which fails but succeeded in the
+    baseline.
+
+    :param records: a list of benchmark records.
+    :param baseline: a list of baseline benchmark records.
+    :param tolerance: the tolerable relative change. Defaults to 0.1.
+    :param metrics: a list of metrics to compare, defaults to throughput, latency_p50,
+           latency_p90, latency_p99 and peak_memory.
+
+    :return: a list of regressions, each is a dict of the setting, "metric", "baseline",
+             "current" and "ratio" (current / baseline). A failed setting is reported with
+             "metric" as "error", "current" as the error and "baseline"/"ratio" as None.
+    """
+    metrics = list(REGRESSION_METRICS) if metrics is None else metrics
+    baseline_map = {tuple(r.get(k) for k in RECORD_KEYS): r for r in baseline}
+    regressions = []
+    for record in records:
+        base = baseline_map.get(tuple(record.get(k) for k in RECORD_KEYS))
+        if base is None:
+            continue
+        if "error" in record and "error" not in base:
+            regression = {k: record[k] for k in RECORD_KEYS}
+            regression.update({"metric": "error", "baseline": None,
+                               "current": record["error"], "ratio": None})
+            regressions.append(regression)
+            continue
+        for metric in metrics:
+            current, expected = record.get(metric), base.get(metric)
+            if current is None or expected is None or expected == 0:
+                continue
+            ratio = current / expected
+            if REGRESSION_METRICS.get(metric, False):
+                regressed = ratio < 1 - tolerance
+            else:
+                regressed = ratio > 1 + tolerance
+            if regressed:
+                regression = {k: record[k] for k in RECORD_KEYS}
+                regression.update({"metric": metric, "baseline": expected,
+                                   "current": current, "ratio": ratio})
+                regressions.append(regression)
+    return regressions
@@ -15,4 +15,5 @@
 #
 
 from .tsdataset import TSDataset
+from .incremental_tsdataset import IncrementalTSDataset
 from .repo_dataset import get_public_dataset, gen_synthetic_data
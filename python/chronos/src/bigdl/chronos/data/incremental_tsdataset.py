@@ -0,0 +1,221 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import numpy as np
+import pandas as pd
+
+from bigdl.chronos.data.tsdataset import _DEFAULT_ID_PLACEHOLDER
+from bigdl.chronos.data.utils.feature import generate_dt_features
+from bigdl.chronos.data.utils.scale import unscale_timeseries_numpy, scale_timeseries_numpy
+from bigdl.chronos.data.utils.utils import _check_col_within
+
+
+class IncrementalTSDataset:
+    def __init__(self, lookback, **schema):
+        '''
+        IncrementalTSDataset keeps a bounded ring buffer of the last `lookback` processed
+        records of each id, so that newly arrived records could be imputed, featured,
+        scaled and rolled for prediction without reprocessing the whole history.
+        Please use IncrementalTSDataset.from_tsdataset to create an instance.
+        '''
+        self.lookback = lookback
+        self.id_col = schema["id_col"]
+        self.dt_col = schema["dt_col"]
+        self.target_col = schema["target_col"].copy()
+        self.feature_col = schema["feature_col"].copy()
+        self.raw_feature_col = schema["raw_feature_col"].copy()
+        self.scaler = schema["scaler"]
+        self.scaled_col = schema["scaled_col"]
+        self.dt_feature_args = schema["dt_feature_args"]
+        self.freq = schema["freq"]
+        self.scaler_index = [i for i in range(len(self.target_col))]
+
+        self.roll_col = self.target_col + self.feature_col
+        self._scaled_idx = [] if self.scaled_col is None else \
+            [self.roll_col.index(col) for col in self.scaled_col]
+        self._id_list = []
+        self._id_index = {}
+        # ring buffer in shape (num_id, lookback, num_col), the record of k-th id with
+        # position i is located at _buffer[k, (_next_pos[k] + i) % lookback]
+        self._buffer = np.zeros((0, lookback, len(self.roll_col)), dtype=np.float32)
+        self._next_pos = np.zeros(0, dtype=np.int64)
+        self._count = np.zeros(0, dtype=np.int64)
+
+    @staticmethod
+    def from_tsdataset(tsdataset, lookback):
+        '''
+        Initialize an IncrementalTSDataset from a processed TSDataset. The imputation
+        ("last"), datetime features generated by `gen_dt_feature` and the fitted scaler of
+        `tsdataset` will be applied to the records appended later, and the last `lookback`
+        records of each id in `tsdataset` are kept as history.
+
+        :param tsdataset: a TSDataset which has been imputed, featured and scaled (all
+               optional) as the training data.
+        :param lookback: int, the lookback used to roll the data for prediction.
+
+        :return: an IncrementalTSDataset instance.
+
+        Create an IncrementalTSDataset instance and predict on appended records by:
+
+        >>> tsdata.impute("last").gen_dt_feature().scale(scaler)
+        >>> inc_tsdata = IncrementalTSDataset.from_tsdataset(tsdata, lookback=lookback)
+        >>> # new records of some ids, with the same columns as the raw dataframe of tsdata
+        >>> x = inc_tsdata.append(new_df).to_numpy()
+        >>> pred = inc_tsdata.unscale_numpy(forecaster.predict(x))
+        '''
+        from bigdl.nano.utils.common import invalidInputError
+        invalidInputError(isinstance(lookback, int) and lookback > 0,
+                          f"lookback should be a positive int, but found {lookback}.")
+        invalidInputError(not tsdataset._has_generate_agg_feature,
+                          "IncrementalTSDataset does not support 'gen_global_feature' and "
+                          "'gen_rolling_feature' methods.")
+        dt_feature_args = tsdataset.dt_feature_args
+        generated = [] if dt_feature_args is None else dt_feature_args["features_generated"]
+        inc_tsdata = IncrementalTSDataset(lookback=lookback,
+                                          id_col=tsdataset.id_col,
+                                          dt_col=tsdataset.dt_col,
+                                          target_col=tsdataset.target_col,
+                                          feature_col=tsdataset.feature_col,
+                                          raw_feature_col=[col for col in tsdataset.feature_col
+                                                           if col not in generated],
+                                          scaler=tsdataset.scaler,
+                                          scaled_col=tsdataset.scaled_col,
+                                          dt_feature_args=dt_feature_args,
+                                          freq=tsdataset._freq)
+        # the records in tsdataset have been processed
+        df = tsdataset.df.groupby(tsdataset.id_col, sort=False).tail(lookback)
+        values = df[inc_tsdata.roll_col].values.astype(np.float32)
+        inc_tsdata._push(inc_tsdata._impute(values, df[inc_tsdata.id_col].values))
+        return inc_tsdata
+
+    def append(self, df):
+        '''
+        Append new records, only these records will be processed in the same way as the
+        TSDataset used to initialize this instance.
+
+        :param df: a pandas dataframe with the dt_col, target_col, id_col (optional for
+               single id) and extra feature columns of the raw data. The records of each id
+               should be sorted by dt_col and later than the records appended before.
+
+        :return: the IncrementalTSDataset instance.
+        '''
+        from bigdl.nano.utils.common import invalidInputError
+        invalidInputError(isinstance(df, pd.DataFrame),
+                          f"df should be a pandas dataframe, but found {type(df)}.")
+        if len(df) == 0:
+            return self
+        if self.id_col not in df.columns:
+            df = df.assign(**{self.id_col: _DEFAULT_ID_PLACEHOLDER})
+        for col in [self.dt_col] + self.target_col + self.raw_feature_col:
+            _check_col_within(df, col)
+
+        if self.dt_feature_args is not None:
+            df = generate_dt_features(input_df=df,
+                                      dt_col=self.dt_col,
+                                      features=self.dt_feature_args["features"],
+                                      one_hot_features=self.dt_feature_args["one_hot_features"],
+                                      freq=self.freq,
+                                      features_generated=[])
+        arr = df[self.roll_col].values.astype(np.float32)
+        if self.scaler is not None:
+            # N/A is kept by scaling, so the records could be imputed after scaling
+            arr[:, self._scaled_idx] = scale_timeseries_numpy(arr[:, self._scaled_idx],
+                                                              self.scaler)
+        self._push(self._impute(arr, df[self.id_col].values))
+        return self
+
+    def to_numpy(self):
+        '''
+        Export the latest `lookback` records of each id as a rolled prediction input.
+
+        :return: a 3d numpy ndarray in shape (num_id, lookback, num_target + num_feature),
+                 the ids are in the order of `get_id_list()`. Only the ids with at least
+                 `lookback` records are included.
+        '''
+        ready = np.flatnonzero(self._count >= self.lookback)
+        ring_idx = (self._next_pos[ready, None] + np.arange(self.lookback)) % self.lookback
+        return self._buffer[ready[:, None], ring_idx]
+
+    def get_id_list(self):
+        '''
+        :return: the ids (with at least `lookback` records) of the rows returned by
+                 `to_numpy()`.
+        '''
+        return [self._id_list[i] for i in np.flatnonzero(self._count >= self.lookback)]
+
+    def unscale_numpy(self, data):
+        '''
+        Unscale the forecaster's numpy prediction result.
+
+        :param data: a numpy ndarray with 3 dim whose last dim is num_target.
+
+        :return: the unscaled numpy ndarray.
+        '''
+        if self.scaler is None:
+            return data
+        return unscale_timeseries_numpy(data, self.scaler, self.scaler_index)
+
+    def _get_id_idxes(self, ids):
+        new_ids = [i for i in pd.unique(ids) if i not in self._id_index]
+        if new_ids:
+            for i in new_ids:
+                self._id_index[i] = len(self._id_list)
+                self._id_list.append(i)
+            num_new = len(new_ids)
+            self._buffer = np.concatenate([self._buffer,
+                                           np.zeros((num_new,) + self._buffer.shape[1:],
+                                                    dtype=self._buffer.dtype)])
+            self._next_pos = np.concatenate([self._next_pos, np.zeros(num_new, np.int64)])
+            self._count = np.concatenate([self._count, np.zeros(num_new, np.int64)])
+        return np.array([self._id_index[i] for i in ids], dtype=np.int64)
+
+    def _impute(self, arr, ids):
+        # "last" imputation, N/A is filled by the last record of the same id, or 0 if
+        # there is no record before, which is the same as TSDataset.impute("last")
+        id_idxes = self._get_id_idxes(ids)
+        filled = pd.DataFrame(arr).groupby(id_idxes).ffill().values
+        nan_row, nan_col = np.nonzero(np.isnan(filled))
+        if nan_row.size > 0:
+            nan_id = id_idxes[nan_row]
+            has_history = self._count[nan_id] > 0
+            last_pos = (self._next_pos[nan_id] - 1) % self.lookback
+            zero = np.zeros((1, arr.shape[1]), dtype=np.float32)
+            if self.scaler is not None:
+                zero[:, self._scaled_idx] = scale_timeseries_numpy(zero[:, self._scaled_idx],
+                                                                   self.scaler)
+            filled[nan_row, nan_col] = np.where(has_history,
+                                                self._buffer[nan_id, last_pos, nan_col],
+                                                zero[0, nan_col])
+        return filled.astype(np.float32), id_idxes
+
+    def _push(self, imputed):
+        arr, id_idxes = imputed
+        # position of each record in the records of the same id appended this time
+        order = np.argsort(id_idxes, kind="stable")
+        sorted_idxes = id_idxes[order]
+        id_start = np.flatnonzero(np.r_[True, sorted_idxes[1:] != sorted_idxes[:-1]])
+        num_new = np.diff(np.r_[id_start, len(sorted_idxes)])
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order)) - np.repeat(id_start, num_new)
+        num_new = np.bincount(id_idxes, minlength=len(self._id_list))
+
+        # only the last `lookback` records of each id are written to the ring buffer
+        keep = rank >= num_new[id_idxes] - self.lookback
+        ring_idx = (self._next_pos[id_idxes[keep]] + rank[keep]) % self.lookback
+        self._buffer[id_idxes[keep], ring_idx] = arr[keep]
+
+        self._next_pos = (self._next_pos + num_new) % self.lookback
+        self._count += num_new
@@ -22,12 +22,17 @@ import logging
 from bigdl.chronos.data.utils.feature import generate_dt_features, generate_global_features
 from bigdl.chronos.data.utils.impute import impute_timeseries_dataframe
 from bigdl.chronos.data.utils.deduplicate import deduplicate_timeseries_dataframe
-from bigdl.chronos.data.utils.roll import roll_timeseries_dataframe
-from bigdl.chronos.data.utils.time_feature import time_features, gen_time_enc_arr
+from bigdl.chronos.data.utils.roll import roll_timeseries_dataframe, \
+    roll_timeseries_ndarray_by_id, _get_id_offsets, _check_roll_params, _is_test_roll
+from bigdl.chronos.data.utils.time_feature import time_features, gen_time_enc_arr, \
+    gen_time_enc_arr_by_id
+from bigdl.chronos.data.utils.roll_cache import get_roll_cache_key, load_roll_cache, \
+    save_roll_cache
 from bigdl.chronos.data.utils.scale import unscale_timeseries_numpy, scale_timeseries_numpy
 from bigdl.chronos.data.utils.resample import resample_timeseries_dataframe
+from bigdl.chronos.data.utils.columnar import run_preprocess_plan, PREPROCESS_STAGES
 from bigdl.chronos.data.utils.split import split_timeseries_dataframe
-from bigdl.chronos.data.utils.cycle_detection import cycle_length_est
+from bigdl.chronos.data.utils.cycle_detection import cycle_length_est_batch
 from bigdl.chronos.data.utils.quality_inspection import quality_check_timeseries_dataframe,\
     _abnormal_value_repair
 from bigdl.chronos.data.utils.utils import _to_list, _check_type,\
@@ -38,6 +43,14 @@ _DEFAULT_ID_COL_NAME = "id"
 _DEFAULT_ID_PLACEHOLDER = "0"
 
 
+def _concat_rolled_arrays(arrs, axis):
+    # a single id is returned as is, so that the strided (read-only) view
+    # from rolling is kept instead of being copied by concatenate/astype
+    if len(arrs) == 1:
+        return arrs[0].astype(np.float32, copy=False)
+    return np.concatenate(arrs, axis=axis).astype(np.float32, copy=False)
+
+
 class TSDataset:
     def __init__(self, data, repair=False, **schema):
         '''
@@ -68,6 +81,9 @@ class TSDataset:
         self.roll_feature_df = None
         self.roll_additional_feature = None
         self.scaler = None
+        self.scaled_col = None  # contains the columns transformed by scale
+        self.dt_feature_args = None  # contains the arguments of gen_dt_feature
+        self.preprocess_timings = None  # time spent on each stage of preprocess
         self.scaler_index = [i for i in range(len(self.target_col))]
         self.id_sensitive = None
         self._has_generate_agg_feature = False
@@ -396,16 +412,7 @@ class TSDataset:
                               "The time series data does not have a Pandas datetime format "
                               "(you can use pandas.to_datetime to convert a string"
                               " into a datetime format).")
-            from pandas.api.types import is_numeric_dtype
-            type_error_list = [val for val in self.target_col + self.feature_col
-                               if not is_numeric_dtype(self.df[val])]
-            try:
-                for val in type_error_list:
-                    self.df[val] = self.df[val].astype(np.float32)
-            except Exception:
-                invalidInputError(False,
-                                  "All the columns of target_col "
-                                  "and extra_feature_col should be of numeric type.")
+            self._cast_numeric_col()
         self.df = self.df.groupby([self.id_col]) \
             .apply(lambda df: resample_timeseries_dataframe(df=df,
                                                             dt_col=self.dt_col,
@@ -420,6 +427,83 @@ class TSDataset:
         self.df.reset_index(drop=True, inplace=True)
         return self
 
+    def _cast_numeric_col(self):
+        from bigdl.nano.utils.common import invalidInputError
+        from pandas.api.types import is_numeric_dtype
+        type_error_list = [val for val in self.target_col + self.feature_col
+                           if not is_numeric_dtype(self.df[val])]
+        try:
+            for val in type_error_list:
+                self.df[val] = self.df[val].astype(np.float32)
+        except Exception:
+            invalidInputError(False,
+                              "All the columns of target_col "
+                              "and extra_feature_col should be of numeric type.")
+
+    def preprocess(self, steps):
+        '''
+        Run a chain of deduplicate, resample, impute and scale as one plan. Instead of
+        calling the methods one by one (each of them copies the dataframe, and some of them
+        apply a function on each id through groupby), the plan works on the numpy arrays
+        of the columns with the offsets of each id, and the dataframe is only built once
+        at the end. The result is the same as calling the methods in the same order, while
+        the index of the dataframe is always reset.
+
+        :param steps: a list of steps, each step is a tuple of (stage, kwargs) or just
+               the stage name. stage should be one of "deduplicate", "resample", "impute"
+               and "scale", kwargs are the parameters of the corresponding method.
+
+        :return: the tsdataset instance. The time (in seconds) spent on each stage is
+                 recorded in `preprocess_timings` of the tsdataset instance.
+
+        >>> from sklearn.preprocessing import StandardScaler
+        >>> tsdata.preprocess(["deduplicate",
+        >>>                    ("resample", {"interval": "1h"}),
+        >>>                    ("impute", {"mode": "last"}),
+        >>>                    ("scale", {"scaler": StandardScaler()})])
+        >>> tsdata.preprocess_timings
+        {'load': 0.01, 'deduplicate': 0.2, 'resample': 0.3, ...}
+        '''
+        from bigdl.nano.utils.common import invalidInputError
+        plan = []
+        for step in steps:
+            stage, kwargs = (step, {}) if isinstance(step, str) else step
+            invalidInputError(stage in PREPROCESS_STAGES,
+                              f"stage should be one of {list(PREPROCESS_STAGES)},"
+                              f" but found {stage}.")
+            kwargs = dict(kwargs)
+            if stage == "resample":
+                invalidInputError(self._is_pd_datetime,
+                                  "The time series data does not have a Pandas datetime format "
+                                  "(you can use pandas.to_datetime to convert a string"
+                                  " into a datetime format).")
+            if stage == "scale":
+                kwargs["scale_col"] = [col for col in self.target_col + self.feature_col
+                                       if not self.roll_additional_feature or
+                                       col not in self.roll_additional_feature]
+                if not kwargs.get("fit", True):
+                    from sklearn.utils.validation import check_is_fitted
+                    try:
+                        invalidInputError(not check_is_fitted(kwargs["scaler"]),
+                                          "scaler is not fittedd")
+                    except Exception:
+                        invalidInputError(False,
+                                          "When calling scale for the first time, "
+                                          "you need to set fit=True.")
+            plan.append((stage, kwargs))
+        self._cast_numeric_col()
+
+        self.df, self.preprocess_timings = run_preprocess_plan(self.df, self.dt_col,
+                                                               self.id_col, plan)
+        for stage, kwargs in plan:
+            if stage == "resample":
+                self._freq = pd.Timedelta(kwargs["interval"])
+                self._freq_certainty = True
+            if stage == "scale":
+                self.scaler = kwargs["scaler"]
+                self.scaled_col = kwargs["scale_col"]
+        return self
+
     def repair_abnormal_data(self, mode="relative", threshold=3.0):
         '''
         Repair the tsdataset by replacing abnormal data detected based on threshold
@@ -487,6 +571,9 @@ class TSDataset:
                                        freq=self._freq,
                                        features_generated=features_generated)
         self.feature_col += features_generated
+        self.dt_feature_args = {"features": features,
+                                "one_hot_features": one_hot_features,
+                                "features_generated": features_generated}
         return self
 
     def gen_global_feature(self, settings="comprehensive", full_settings=None, n_jobs=1):
@@ -636,7 +723,8 @@ class TSDataset:
              id_sensitive=False,
              time_enc=False,
              label_len=0,
-             is_predict=False):
+             is_predict=False,
+             cache_dir=None):
         '''
         Sampling by rolling for machine learning/deep learning models.
 
@@ -679,9 +767,18 @@ class TSDataset:
         :param is_predict: bool.
                This parameter indicates if the dataset will be sampled as a prediction dataset
                (without groud truth).
+        :param cache_dir: str, a local directory to cache the rolled ndarrays. Default to None,
+               which means no cache is used. If set, the rolled ndarrays will be saved to
+               cache_dir, and a later roll (also from other processes) on the same data with
+               the same parameters and scaler will load them as read-only memory-mapped
+               ndarrays instead of rolling again.
 
         :return: the tsdataset instance.
 
+        Note: To save memory, the rolled ndarrays are read-only strided views on the
+        underlying data whenever no copy is needed (e.g. single id without N/A). Please
+        copy them (e.g. `x = x.copy()`) before any in-place modification.
+
         roll() can be called by:
 
         >>> # Here is a df example:
@@ -729,9 +826,6 @@ class TSDataset:
             self.roll_feature = feature_col
 
         self.roll_target = target_col
-        num_id = len(self._id_list)
-        num_feature_col = len(self.roll_feature)
-        num_target_col = len(self.roll_target)
         self.id_sensitive = id_sensitive
         roll_feature_df = None if self.roll_feature_df is None \
             else self.roll_feature_df[additional_feature_col]
@@ -748,46 +842,134 @@ class TSDataset:
 
         if self.lookback == 'auto':
             self.lookback = self.get_cycle_length('mode', top_k=3)
-        groups = self.df.groupby([self.id_col])
-        rolling_result = []
-        for _, group in groups:
-            rolling_result.append(roll_timeseries_dataframe(df=group,
-                                                            roll_feature_df=roll_feature_df,
-                                                            lookback=self.lookback,
-                                                            horizon=self.horizon,
-                                                            feature_col=feature_col,
-                                                            target_col=target_col,
-                                                            label_len=label_len,
-                                                            deploy_mode=self.deploy_mode))
+        if cache_dir is not None:
+            # the rolled arrays only depend on the data of these columns and the parameters
+            cache_cols = [self.id_col, self.dt_col] + target_col + feature_col
+            cache_key = get_roll_cache_key(self.df,
+                                           cols=cache_cols,
+                                           roll_feature_df=roll_feature_df,
+                                           scaler=self.scaler,
+                                           lookback=self.lookback,
+                                           horizon=self.horizon,
+                                           horizon_time=horizon_time,
+                                           feature_col=self.roll_feature,
+                                           target_col=target_col,
+                                           id_sensitive=id_sensitive,
+                                           time_enc=time_enc,
+                                           label_len=label_len,
+                                           is_predict=is_predict,
+                                           deploy_mode=self.deploy_mode)
+            cached_arrays = load_roll_cache(cache_dir, cache_key)
+        if cache_dir is not None and cached_arrays is not None:
+            self.numpy_x, self.numpy_y, self.numpy_x_timeenc, self.numpy_y_timeenc = \
+                (cached_arrays[name] for name in ("numpy_x", "numpy_y",
+                                                  "numpy_x_timeenc", "numpy_y_timeenc"))
+        else:
+            self._roll_numpy(feature_col=feature_col,
+                             target_col=target_col,
+                             roll_feature_df=roll_feature_df,
+                             lookback=lookback,
+                             horizon=horizon,
+                             horizon_time=horizon_time,
+                             label_len=label_len,
+                             time_enc=time_enc,
+                             is_predict=is_predict,
+                             id_sensitive=id_sensitive)
+            if cache_dir is not None:
+                save_roll_cache(cache_dir, cache_key, {"numpy_x": self.numpy_x,
+                                                       "numpy_y": self.numpy_y,
+                                                       "numpy_x_timeenc": self.numpy_x_timeenc,
+                                                       "numpy_y_timeenc": self.numpy_y_timeenc})
 
-        # concat the result on required axis
+        # scaler index
+        num_roll_target = len(self.roll_target)
+        repeat_factor = len(self._id_list) if self.id_sensitive else 1
+        scaler_index = [self.target_col.index(self.roll_target[i])
+                        for i in range(num_roll_target)] * repeat_factor
+        self.scaler_index = scaler_index
+
+        return self
+
+    def _roll_numpy(self, feature_col, target_col, roll_feature_df, lookback, horizon,
+                    horizon_time, label_len, time_enc, is_predict, id_sensitive):
+        '''
+        Roll self.df into self.numpy_x, self.numpy_y, self.numpy_x_timeenc and
+        self.numpy_y_timeenc, the parameters have been checked and resolved by roll().
+        '''
+        num_id = len(self._id_list)
+        num_feature_col = len(self.roll_feature)
+        num_target_col = len(self.roll_target)
         concat_axis = 2 if id_sensitive else 0
-        self.numpy_x = np.concatenate([rolling_result[i][0]
-                                       for i in range(len(self._id_list))],
-                                      axis=concat_axis).astype(np.float32)
+        if roll_feature_df is None:
+            # roll all the ids in one vectorized pass
+            if not self.deploy_mode:
+                _check_roll_params(self.lookback, self.horizon, feature_col, target_col)
+            id_offsets, order = self._get_id_offsets()
+            arr = self.df.loc[:, target_col + feature_col].values
+            arr = (arr if order is None else arr[order]).astype(np.float32, copy=False)
+            is_test = self.deploy_mode or _is_test_roll(self.horizon, label_len)
+            x, y, roll_start_idxes = roll_timeseries_ndarray_by_id(arr,
+                                                                   id_offsets,
+                                                                   lookback=self.lookback,
+                                                                   horizon=self.horizon,
+                                                                   target_num=len(target_col),
+                                                                   label_len=label_len,
+                                                                   is_test=is_test)
+            if id_sensitive:
+                id_sample_offsets = np.searchsorted(roll_start_idxes, id_offsets[1:-1])
+                rolling_result = list(zip(np.split(x, id_sample_offsets),
+                                          np.split(y, id_sample_offsets)
+                                          if y is not None else [None] * num_id))
+            else:
+                rolling_result = [(x, y)]
+        else:
+            groups = self.df.groupby([self.id_col])
+            rolling_result = []
+            for _, group in groups:
+                rolling_result.append(roll_timeseries_dataframe(df=group,
+                                                                roll_feature_df=roll_feature_df,
+                                                                lookback=self.lookback,
+                                                                horizon=self.horizon,
+                                                                feature_col=feature_col,
+                                                                target_col=target_col,
+                                                                label_len=label_len,
+                                                                deploy_mode=self.deploy_mode))
+
+        # concat the result on required axis
+        self.numpy_x = _concat_rolled_arrays([res[0] for res in rolling_result],
+                                             axis=concat_axis)
         if (horizon != 0 and is_predict is False) or time_enc:
-            self.numpy_y = np.concatenate([rolling_result[i][1]
-                                           for i in range(len(self._id_list))],
-                                          axis=concat_axis).astype(np.float32)
+            self.numpy_y = _concat_rolled_arrays([res[1] for res in rolling_result],
+                                                 axis=concat_axis)
         else:
             self.numpy_y = None
 
         # time_enc
         if time_enc:
-            time_enc_arr = []
-            for _, group in groups:
-                time_enc_arr.append(gen_time_enc_arr(df=group,
-                                                     dt_col=self.dt_col,
-                                                     freq=self._freq,
-                                                     horizon_time=horizon_time,
-                                                     is_predict=is_predict,
-                                                     lookback=lookback,
-                                                     label_len=label_len))
-            self.numpy_x_timeenc = np.concatenate([time_enc_arr[i][0]
-                                                   for i in range(len(self._id_list))],
+            if roll_feature_df is None:
+                dt_values = self.df[self.dt_col].values
+                dt_values = dt_values if order is None else dt_values[order]
+                time_enc_arr = [gen_time_enc_arr_by_id(dt_values,
+                                                       id_offsets,
+                                                       roll_start_idxes,
+                                                       freq=self._freq,
+                                                       horizon_time=horizon_time,
+                                                       is_predict=is_predict,
+                                                       lookback=self.lookback,
+                                                       label_len=label_len)]
+            else:
+                time_enc_arr = []
+                for _, group in groups:
+                    time_enc_arr.append(gen_time_enc_arr(df=group,
+                                                         dt_col=self.dt_col,
+                                                         freq=self._freq,
+                                                         horizon_time=horizon_time,
+                                                         is_predict=is_predict,
+                                                         lookback=lookback,
+                                                         label_len=label_len))
+            self.numpy_x_timeenc = np.concatenate([arrs[0] for arrs in time_enc_arr],
                                                   axis=0).astype(np.float32)
-            self.numpy_y_timeenc = np.concatenate([time_enc_arr[i][1]
-                                                   for i in range(len(self._id_list))],
+            self.numpy_y_timeenc = np.concatenate([arrs[1] for arrs in time_enc_arr],
                                                   axis=0).astype(np.float32)
         else:
             self.numpy_x_timeenc = None
@@ -805,15 +987,6 @@ class TSDataset:
             sorted_index = sorted(range(len(reindex_list)), key=reindex_list.__getitem__)
             self.numpy_x = self.numpy_x[:, :, sorted_index]
 
-        # scaler index
-        num_roll_target = len(self.roll_target)
-        repeat_factor = len(self._id_list) if self.id_sensitive else 1
-        scaler_index = [self.target_col.index(self.roll_target[i])
-                        for i in range(num_roll_target)] * repeat_factor
-        self.scaler_index = scaler_index
-
-        return self
-
     def to_torch_data_loader(self,
                              batch_size=32,
                              roll=True,
@@ -900,7 +1073,7 @@ class TSDataset:
             if horizon is None:
                 invalidInputError(False,
                                   "You must input horizon if roll is True (default roll=True)!")
-            from bigdl.chronos.data.utils.roll_dataset import RollDataset
+            from bigdl.chronos.data.utils.roll_dataset import RollDataset, roll_batch_collate_fn
             feature_col = _to_list(feature_col, "feature_col") if feature_col is not None \
                 else self.feature_col
             target_col = _to_list(target_col, "target_col") if target_col is not None \
@@ -947,7 +1120,8 @@ class TSDataset:
             batch_size = 32 if batch_size is None else batch_size  # _pytorch_fashion_inference
             return DataLoader(torch_dataset,
                               batch_size=batch_size,
-                              shuffle=shuffle)
+                              shuffle=shuffle,
+                              collate_fn=roll_batch_collate_fn)
         else:
             if self.numpy_x is None:
                 invalidInputError(False,
@@ -1079,6 +1253,7 @@ class TSDataset:
             self.df[self.target_col + feature_col] = \
                 scale_timeseries_numpy(self.df[self.target_col + feature_col].values, scaler)
         self.scaler = scaler
+        self.scaled_col = self.target_col + feature_col
         return self
 
     def unscale(self):
@@ -1108,6 +1283,20 @@ class TSDataset:
         '''
         return unscale_timeseries_numpy(data, self.scaler, self.scaler_index)
 
+    def _get_id_offsets(self):
+        '''
+        Get the start row of each id (ordered as groupby) and the row order to gather
+        self.df so that rows of same id are consecutive. The order is None if self.df
+        is already in this order.
+        '''
+        id_codes, _ = pd.factorize(self.df[self.id_col], sort=True)
+        if (np.diff(id_codes) >= 0).all():
+            order = None
+        else:
+            order = np.argsort(id_codes, kind='stable')
+            id_codes = id_codes[order]
+        return _get_id_offsets(id_codes), order
+
     def _check_basic_invariants(self, strict_check=False):
         '''
         This function contains a bunch of assertions to make sure strict rules(the invariants)
@@ -1140,7 +1329,8 @@ class TSDataset:
         if strict_check:
             _check_dt_is_sorted(self.df, self.dt_col)
 
-    def get_cycle_length(self, aggregate='mode', top_k=3):
+    def get_cycle_length(self, aggregate='mode', top_k=3, sample_id_num=None, seed=None,
+                         n_jobs=1):
         """
         Calculate the cycle length of the time series in this TSDataset.
 
@@ -1150,6 +1340,13 @@ class TSDataset:
                 The value is default to 3.
             aggregate (str): Select the mode of calculation time period,
                 We only support 'min', 'max', 'mode', 'median', 'mean'.
+            sample_id_num (int): If set, the cycle length is only estimated on the time
+                series of sample_id_num randomly sampled ids, which is much faster for a
+                TSDataset with a large number of ids. The value is default to None,
+                i.e. all ids are used.
+            seed (int): The random seed used to sample the ids.
+            n_jobs (int): The number of threads used to calculate the fft of the
+                time series. The value is default to 1.
 
         Returns:
             Describe the value of the time period distribution.
@@ -1162,22 +1359,31 @@ class TSDataset:
         invalidInputError(aggregate.lower().strip() in ['min', 'max', 'mode', 'median', 'mean'],
                           f"We Only support 'min' 'max' 'mode' 'median' 'mean',"
                           f" but found {aggregate}.")
-
-        if len(self.target_col) == 1:
-            res = []
-            groups = self.df.groupby(self.id_col)
-            for _, group in groups:
-                res.append(cycle_length_est(group[self.target_col[0]].values, top_k))
-            res = pd.Series(res)
-        else:
-            res = []
-            groups = self.df.groupby(self.id_col)
-            for _, group in groups:
-                res.append(pd.DataFrame({'cycle_length':
-                           [cycle_length_est(group[col].values,
-                                             top_k)for col in self.target_col]}))
-            res = pd.concat(res, axis=0)
-            res = res.cycle_length
+        invalidInputError(sample_id_num is None or
+                          (isinstance(sample_id_num, int) and sample_id_num > 0),
+                          f"sample_id_num should be a positive int, but found {sample_id_num}.")
+
+        id_offsets, order = self._get_id_offsets()
+        values = self.df[self.target_col].values
+        if order is not None:
+            values = values[order]
+        id_lens = np.diff(id_offsets)
+        id_idxes = np.arange(len(id_lens))
+        if sample_id_num is not None and sample_id_num < len(id_lens):
+            rng = np.random.default_rng(seed)
+            id_idxes = np.sort(rng.choice(len(id_lens), sample_id_num, replace=False))
+
+        # time series of the same length are estimated in one batch, in the order of
+        # (id, target) as the result of a groupby on id_col
+        res = np.empty((len(id_idxes), len(self.target_col)), dtype=np.int64)
+        for id_len in np.unique(id_lens[id_idxes]):
+            batch_idxes = np.flatnonzero(id_lens[id_idxes] == id_len)
+            rows = id_offsets[id_idxes[batch_idxes], None] + np.arange(id_len)
+            # (num_id, id_len, num_target) -> (num_id * num_target, id_len)
+            batch = values[rows].transpose(0, 2, 1).reshape(-1, id_len)
+            cycle_lengths = cycle_length_est_batch(batch, top_k, workers=n_jobs)
+            res[batch_idxes] = cycle_lengths.reshape(len(batch_idxes), -1)
+        res = pd.Series(res.ravel())
 
         if aggregate.lower().strip() == 'mode':
             self.best_cycle_length = int(res.value_counts().index[0])
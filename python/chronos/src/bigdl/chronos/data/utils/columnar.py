@@ -0,0 +1,277 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+from bigdl.chronos.data.utils.roll import _get_id_offsets
+from bigdl.chronos.data.utils.scale import scale_timeseries_numpy
+
+PREPROCESS_STAGES = ("deduplicate", "resample", "impute", "scale")
+_DAY_NS = 24 * 3600 * 10**9
+
+
+def _hash_column(arr):
+    if arr.dtype.kind == 'f':
+        # -0.0 and 0.0, as well as N/As, are the same in DataFrame.duplicated
+        arr = np.where(np.isnan(arr), np.nan, arr + 0.0)
+    return pd.util.hash_array(arr)
+
+
+def _is_same(arr, idx, ref_idx):
+    same = arr[idx] == arr[ref_idx]
+    if arr.dtype.kind == 'f':
+        same |= np.isnan(arr[idx]) & np.isnan(arr[ref_idx])
+    return same.all()
+
+
+def _duplicated(arrays):
+    '''
+    The same as DataFrame.duplicated on the columns, but the rows are compared by a
+    combined hash of the columns, which is much faster for a large dataframe. The
+    duplicates found by hash are checked, and DataFrame.duplicated is used instead if
+    there is any hash collision.
+    '''
+    row_hash = np.zeros(len(arrays[0]), dtype=np.uint64)
+    for arr in arrays:
+        row_hash = row_hash * np.uint64(1000003) ^ _hash_column(arr)
+    # codes are assigned in the order of first appearance
+    codes, _ = pd.factorize(row_hash)
+    prev_max = np.maximum.accumulate(codes)
+    is_first = codes > np.concatenate([[-1], prev_max[:-1]])
+    dup_idx = np.flatnonzero(~is_first)
+    ref_idx = np.flatnonzero(is_first)[codes[dup_idx]]
+    if all(_is_same(arr, dup_idx, ref_idx) for arr in arrays):
+        return ~is_first
+    return pd.DataFrame(dict(enumerate(arrays)), copy=False).duplicated().values
+
+
+class ColumnarTimeSeries:
+    '''
+    The columns of a time series dataframe as numpy arrays, with the start offsets of
+    each id once the rows are grouped by id. The preprocessing stages work on the arrays
+    in place of the dataframe and the dataframe is only built once at the end.
+    '''
+
+    def __init__(self, df, dt_col, id_col):
+        from bigdl.nano.utils.common import invalidInputError
+        self.dt_col = dt_col
+        self.id_col = id_col
+        self.columns = list(df.columns)
+        self.value_col = [col for col in self.columns if col not in (dt_col, id_col)]
+        non_numeric_col = [col for col in self.value_col if not is_numeric_dtype(df[col])]
+        invalidInputError(len(non_numeric_col) == 0,
+                          f"All the columns except dt_col and id_col should be of numeric "
+                          f"type, but found {non_numeric_col}.")
+        self.dt = df[dt_col].values
+        self.ids = df[id_col].values
+        self.values = {col: df[col].values for col in self.value_col}
+        # None until the rows are grouped by id
+        self.id_offsets = None
+
+    def _take(self, idxes):
+        self.dt = self.dt[idxes]
+        self.ids = self.ids[idxes]
+        self.values = {col: arr[idxes] for col, arr in self.values.items()}
+
+    def group(self):
+        '''
+        Reorder the rows by id (stably, in the same order as groupby on id_col).
+        '''
+        if self.id_offsets is not None:
+            return
+        id_codes, _ = pd.factorize(self.ids, sort=True)
+        if not (np.diff(id_codes) >= 0).all():
+            order = np.argsort(id_codes, kind='stable')
+            id_codes = id_codes[order]
+            self._take(order)
+        self.id_offsets = _get_id_offsets(id_codes)
+
+    def deduplicate(self):
+        keep = ~_duplicated([self.dt, self.ids, *self.values.values()])
+        if keep.all():
+            return
+        if self.id_offsets is not None:
+            kept_num = np.concatenate([[0], np.cumsum(keep)])
+            self.id_offsets = kept_num[self.id_offsets]
+        self._take(keep)
+
+    def impute(self, mode="last", const_num=0):
+        from bigdl.nano.utils.common import invalidInputError
+        invalidInputError(mode in ['last', 'const', 'linear'],
+                          f"mode should be one of ['last', 'const', 'linear'], but found {mode}.")
+        self.group()
+        for col, arr in self.values.items():
+            nan_mask = np.isnan(arr)
+            if not nan_mask.any():
+                continue
+            if mode == "const":
+                arr = np.where(nan_mask, const_num, arr)
+            elif mode == "last":
+                arr = arr.copy()
+                # the first record of each id is 0 if it is N/A
+                id_start = self.id_offsets[:-1]
+                arr[id_start[nan_mask[id_start]]] = 0
+                nan_mask[id_start] = False
+                last_idx = np.where(nan_mask, 0, np.arange(len(arr)))
+                arr = arr[np.maximum.accumulate(last_idx)]
+            else:
+                arr = self._linear_impute(arr, nan_mask)
+            self.values[col] = arr
+
+    def _linear_impute(self, arr, nan_mask):
+        # the same as interpolate(method='linear', limit_direction='both') on each id
+        num = len(arr)
+        pos = np.arange(num)
+        id_len = np.diff(self.id_offsets)
+        id_start = np.repeat(self.id_offsets[:-1], id_len)
+        id_end = np.repeat(self.id_offsets[1:], id_len)
+        prev_idx = np.maximum.accumulate(np.where(nan_mask, -1, pos))
+        next_idx = np.minimum.accumulate(np.where(nan_mask, num, pos)[::-1])[::-1]
+        has_prev = prev_idx >= id_start
+        has_next = next_idx < id_end
+        prev_val = arr[np.clip(prev_idx, 0, num - 1)]
+        next_val = arr[np.clip(next_idx, 0, num - 1)]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            interp_val = prev_val + (next_val - prev_val) * (pos - prev_idx) / (next_idx - prev_idx)
+        filled = np.where(has_prev & has_next, interp_val,
+                          np.where(has_prev, prev_val, np.where(has_next, next_val, np.nan)))
+        return np.where(nan_mask, filled, arr).astype(arr.dtype, copy=False)
+
+    def resample(self, interval, start_time=None, end_time=None, merge_mode="mean"):
+        from bigdl.nano.utils.common import invalidInputError
+        invalidInputError(merge_mode in ['max', 'min', 'mean', 'sum'],
+                          "merge_mode should be one of ['max', 'min', 'mean', 'sum'],"
+                          f" but found {merge_mode}.")
+        self.group()
+        interval_ns = pd.Timedelta(interval).value
+        t = self.dt.astype("datetime64[ns]").view(np.int64)
+        id_start = self.id_offsets[:-1]
+        id_len = np.diff(self.id_offsets)
+
+        # bins are anchored at the midnight of the first record of each id, as the
+        # default origin ("start_day") of pandas resample
+        first_t = np.minimum.reduceat(t, id_start)
+        origin = np.repeat(first_t // _DAY_NS * _DAY_NS, id_len)
+        label = t - (t - origin) % interval_ns
+        first_label = np.minimum.reduceat(label, id_start)
+        last_label = np.maximum.reduceat(label, id_start)
+
+        start = np.full_like(first_label, pd.Timestamp(start_time).value) \
+            if start_time else first_label
+        end = np.full_like(last_label, pd.Timestamp(end_time).value) \
+            if end_time else last_label
+        invalidInputError((start <= end).all(), "end time must be later than start time.")
+        new_start = start - (start - first_label) % interval_ns
+        out_len = np.maximum((end - new_start) // interval_ns + 1, 0)
+        out_offsets = np.concatenate([[0], np.cumsum(out_len)])
+        out_num = out_offsets[-1]
+
+        # the index of the output row of each record, -1 if out of range
+        pos = (label - np.repeat(new_start, id_len)) // interval_ns
+        in_range = (pos >= 0) & (pos < np.repeat(out_len, id_len))
+        out_idx = np.where(in_range, np.repeat(out_offsets[:-1], id_len) + pos, -1)
+        order = np.argsort(out_idx, kind='stable')
+        order = order[in_range[order]]
+        bin_idx = out_idx[order]
+        bin_start = np.flatnonzero(np.r_[True, bin_idx[1:] != bin_idx[:-1]]) \
+            if len(bin_idx) else np.zeros(0, dtype=np.int64)
+        bin_out = bin_idx[bin_start]
+
+        # the output rows out of [first_label, last_label] of each id are N/A even for sum
+        out_pos = np.arange(out_num) - np.repeat(out_offsets[:-1], out_len)
+        out_t = np.repeat(new_start, out_len) + out_pos * interval_ns
+        within_data = (out_t >= np.repeat(first_label, out_len)) & \
+            (out_t <= np.repeat(last_label, out_len))
+
+        values = {}
+        for col, arr in self.values.items():
+            out_dtype = np.float32 if arr.dtype == np.float32 else np.float64
+            sorted_arr = arr[order].astype(np.float64)
+            if merge_mode in ("sum", "mean"):
+                nan_mask = np.isnan(sorted_arr)
+                bin_sum = np.add.reduceat(np.where(nan_mask, 0, sorted_arr), bin_start) \
+                    if len(bin_start) else np.zeros(0)
+                res = np.zeros(out_num)
+                res[bin_out] = bin_sum
+                if merge_mode == "sum":
+                    res[~within_data] = np.nan
+                else:
+                    count = np.zeros(out_num)
+                    count[bin_out] = np.add.reduceat(~nan_mask, bin_start) \
+                        if len(bin_start) else 0
+                    with np.errstate(divide="ignore", invalid="ignore"):
+                        res = np.where(count > 0, res / count, np.nan)
+            else:
+                reduce_fn = np.fmax if merge_mode == "max" else np.fmin
+                res = np.full(out_num, np.nan)
+                if len(bin_start):
+                    res[bin_out] = reduce_fn.reduceat(sorted_arr, bin_start)
+            values[col] = res.astype(out_dtype)
+
+        self.values = values
+        self.dt = out_t.astype("datetime64[ns]")
+        self.ids = np.repeat(self.ids[id_start], out_len)
+        self.id_offsets = out_offsets
+        # a non-numeric id_col is dropped by pandas resample mean/sum and appended at last
+        if merge_mode in ("mean", "sum") and not is_numeric_dtype(self.ids.dtype):
+            self.columns = [self.dt_col] + self.value_col + [self.id_col]
+        else:
+            self.columns = [self.dt_col] + [col for col in self.columns if col != self.dt_col]
+
+    def scale(self, scaler, fit=True, scale_col=None):
+        scale_col = self.value_col if scale_col is None else scale_col
+        data = np.stack([self.values[col] for col in scale_col], axis=1)
+        if fit:
+            data = scaler.fit_transform(data)
+        else:
+            data = scale_timeseries_numpy(data, scaler)
+        for i, col in enumerate(scale_col):
+            self.values[col] = data[:, i]
+
+    def to_pandas(self):
+        arrays = {self.dt_col: self.dt, self.id_col: self.ids, **self.values}
+        return pd.DataFrame({col: arrays[col] for col in self.columns})
+
+
+def run_preprocess_plan(df, dt_col, id_col, steps):
+    '''
+    Run the preprocessing steps on the numpy columns of df and build the result dataframe
+    once at the end.
+
+    :param df: input dataframe.
+    :param dt_col: name of datetime column.
+    :param id_col: name of id column.
+    :param steps: a list of (stage, kwargs), stage should be one of "deduplicate",
+           "resample", "impute" and "scale", kwargs are passed to the stage.
+    :return: the result dataframe and a dict of the time (in seconds) spent on each stage,
+             including "load" and "build" for the conversions between dataframe and columns.
+    '''
+    timings = {}
+    start = time.perf_counter()
+    columnar = ColumnarTimeSeries(df, dt_col, id_col)
+    timings["load"] = time.perf_counter() - start
+    for stage, kwargs in steps:
+        start = time.perf_counter()
+        getattr(columnar, stage)(**kwargs)
+        timings[stage] = timings.get(stage, 0) + time.perf_counter() - start
+    start = time.perf_counter()
+    res_df = columnar.to_pandas()
+    timings["build"] = time.perf_counter() - start
+    return res_df, timings
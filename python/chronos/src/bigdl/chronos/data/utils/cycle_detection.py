@@ -60,6 +60,54 @@ def cycle_length_est(data, top_k=3, adjust=False):
     return cycle_length_est
 
 
+def cycle_length_est_batch(data, top_k=3, adjust=False, workers=1):
+    '''
+    Detect the cycles of a batch of time series with the same length at once, the result of
+    each time series is the same as cycle_length_est.
+
+    :param data: 2 dim ndarray in shape (num_series, length).
+    :param top_k: The freq with top top_k power after fft will be
+           used to check the autocorrelation. The value is default to 3.
+    :param adjust: if normalization is applied to the final result.
+    :param workers: the number of threads used by fft over the batch.
+
+    :return: 1 dim int ndarray of the cycle length of each time series.
+    '''
+    from scipy.fft import rfft
+    from bigdl.nano.utils.common import invalidInputError
+    data = np.asarray(data, dtype=np.float64)
+    length = data.shape[1]
+    invalidInputError((length//2) > abs(top_k)+1,
+                      "top_k must be less than half the length of the time series,"
+                      f" but top_k and data length are {top_k} and {length} respectively.")
+
+    # positive freqs of fft are k / length, for k = 1, ..., (length - 1) // 2
+    powers = np.abs(rfft(data, axis=1, workers=workers))[:, 1:(length - 1) // 2 + 1]
+    top_k_idxs = np.argpartition(powers, -top_k, axis=1)[:, -top_k:]
+    fft_periods = (1 / ((top_k_idxs + 1) * (1.0 / length))).astype(int)
+
+    # acf of the top_k lags, padded with zeros so that the window starting at lag of
+    # each series is its lagged series, gathering rows of a strided view copies
+    # contiguous memory which is much faster than gathering elements
+    centered = data - data.mean(axis=1, keepdims=True)
+    padded = np.zeros((data.shape[0], 2 * length))
+    padded[:, :length] = centered
+    lagged = np.lib.stride_tricks.sliding_window_view(padded, length, axis=1)
+    series_idxs = np.arange(data.shape[0])
+    acf_scores = np.empty(fft_periods.shape)
+    for k in range(fft_periods.shape[1]):
+        acf_scores[:, k] = np.einsum("ij,ij->i", centered,
+                                     lagged[series_idxs, fft_periods[:, k]])
+    if adjust:
+        var = np.square(centered).mean(axis=1, keepdims=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            acf_scores = np.where(var == 0, 0, acf_scores / ((length - fft_periods) * var))
+        acf_scores[np.isnan(acf_scores)] = -np.inf
+
+    # the first lag with the largest score, as cycle_length_est does
+    return np.take_along_axis(fft_periods, acf_scores.argmax(axis=1)[:, None], axis=1)[:, 0]
+
+
 def acf(x, lag, adjust):
     '''
     generate acf score as in statsmodels.tsa.stattools.acf
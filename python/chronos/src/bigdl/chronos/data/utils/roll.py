@@ -64,19 +64,9 @@ def roll_timeseries_dataframe(df,
 
     from bigdl.nano.utils.common import invalidInputError
     invalidInputError(isinstance(df, pd.DataFrame), "df is expected to be pandas dataframe")
-    invalidInputError(isinstance(lookback, int), "lookback is expected to be int")
-    invalidInputError(isinstance(feature_col, list), "feature_col is expected to be list")
-    invalidInputError(isinstance(target_col, list), "target_col is expected to be list")
-    is_horizon_int = isinstance(horizon, int)
-    is_horizon_list = isinstance(horizon, list) and\
-        isinstance(horizon[0], int) and\
-        min(horizon) > 0
-    invalidInputError(is_horizon_int or is_horizon_list,
-                      "horizon is expected to be a list or int")
+    _check_roll_params(lookback, horizon, feature_col, target_col)
 
-    # don't enter test mode if label_len!=0
-    # TODO: change to use is_predict.
-    is_test = True if (is_horizon_int and horizon == 0 and label_len == 0) else False
+    is_test = _is_test_roll(horizon, label_len)
     if not is_test:
         return _roll_timeseries_dataframe_train(df,
                                                 roll_feature_df,
@@ -97,6 +87,25 @@ def roll_timeseries_dataframe(df,
                                                contain_id=contain_id)
 
 
+def _check_roll_params(lookback, horizon, feature_col, target_col):
+    from bigdl.nano.utils.common import invalidInputError
+    invalidInputError(isinstance(lookback, int), "lookback is expected to be int")
+    invalidInputError(isinstance(feature_col, list), "feature_col is expected to be list")
+    invalidInputError(isinstance(target_col, list), "target_col is expected to be list")
+    is_horizon_int = isinstance(horizon, int)
+    is_horizon_list = isinstance(horizon, list) and\
+        isinstance(horizon[0], int) and\
+        min(horizon) > 0
+    invalidInputError(is_horizon_int or is_horizon_list,
+                      "horizon is expected to be a list or int")
+
+
+def _is_test_roll(horizon, label_len):
+    # don't enter test mode if label_len!=0
+    # TODO: change to use is_predict.
+    return isinstance(horizon, int) and horizon == 0 and label_len == 0
+
+
 def _append_rolling_feature_df(rolling_result,
                                roll_feature_df):
     if roll_feature_df is None:
@@ -123,7 +132,7 @@ def _roll_timeseries_dataframe_test(df,
     output_x, mask_x = _roll_timeseries_ndarray(x, lookback)
     mask = (mask_x == 1)
 
-    x = _append_rolling_feature_df(output_x[mask], roll_feature_df)
+    x = _append_rolling_feature_df(_take_valid_window(output_x, mask), roll_feature_df)
 
     if contain_id:
         return x, None, df.loc[:, [id_col]].values
@@ -158,27 +167,139 @@ def _roll_timeseries_dataframe_train(df,
         output_y, mask_y = _roll_timeseries_ndarray(y, horizon+label_len)
     mask = (mask_x == 1) & (mask_y == 1)
 
-    x = _append_rolling_feature_df(output_x[mask], roll_feature_df)
+    x = _append_rolling_feature_df(_take_valid_window(output_x, mask), roll_feature_df)
+    y = _take_valid_window(output_y, mask)
 
     if contain_id:
-        return x, output_y[mask], df.loc[:, [id_col]].values
+        return x, y, df.loc[:, [id_col]].values
     else:
-        return x, output_y[mask]
-
-
-def _shift(arr, num, fill_value=np.nan):
-    # this function is adapted from
-    # https://stackoverflow.com/questions/30399534/shift-elements-in-a-numpy-array
-    result = np.empty_like(arr)
-    if num > 0:
-        result[:num] = fill_value
-        result[num:] = arr[:-num]
-    elif num < 0:
-        result[num:] = fill_value
-        result[:num] = arr[-num:]
+        return x, y
+
+
+def _get_id_offsets(id_arr):
+    '''
+    Return the start offset of each run of consecutive same id in id_arr,
+    followed by the length of id_arr.
+    '''
+    id_arr = np.asarray(id_arr)
+    if id_arr.shape[0] == 0:
+        return np.zeros(1, dtype=np.int64)
+    change_idxes = np.flatnonzero(id_arr[1:] != id_arr[:-1]) + 1
+    return np.concatenate([[0], change_idxes, [id_arr.shape[0]]]).astype(np.int64)
+
+
+def _get_roll_start_idx_by_offsets(id_offsets, window_size):
+    # number of windows of each id, ids shorter than window_size have none
+    num_windows = np.maximum(np.diff(id_offsets) - window_size + 1, 0)
+    total = num_windows.sum()
+    # position of each window inside its own id
+    inner_idxes = np.arange(total, dtype=np.int64) - \
+        np.repeat(np.cumsum(num_windows) - num_windows, num_windows)
+    return np.repeat(id_offsets[:-1], num_windows) + inner_idxes
+
+
+def get_roll_start_idx(df, id_col, window_size):
+    if not id_col:
+        id_offsets = np.array([0, len(df.index)], dtype=np.int64)
     else:
-        result[:] = arr
-    return result
+        id_offsets = _get_id_offsets(df[id_col].values)
+    return _get_roll_start_idx_by_offsets(id_offsets, window_size)
+
+
+def _sliding_window(data, window_size):
+    # (num_window, window_size, num_feature) read-only view on data
+    if data.shape[0] < window_size:
+        return np.empty((0, window_size) + data.shape[1:], dtype=data.dtype)
+    return np.lib.stride_tricks.sliding_window_view(data, window_size, axis=0)\
+        .transpose(0, 2, 1)
+
+
+def _take_window(roll_data, idxes):
+    # continuous windows are sliced so that the strided view is kept
+    if idxes.size > 0 and idxes[-1] - idxes[0] + 1 == idxes.size:
+        return roll_data[idxes[0]:idxes[-1] + 1]
+    return roll_data[idxes]
+
+
+def _nan_count(data):
+    nan_row = np.isnan(data).any(axis=1)
+    return np.concatenate([[0], np.cumsum(nan_row, dtype=np.int64)])
+
+
+def roll_timeseries_ndarray_by_id(arr,
+                                  id_offsets,
+                                  lookback,
+                                  horizon,
+                                  target_num,
+                                  label_len=0,
+                                  is_test=False):
+    """
+    roll all the ids of a 2-d ndarray in one vectorized pass.
+
+    :param arr: 2-d ndarray in format (num_timestep, target_num + feature_num), target first.
+           The rows of same id should be consecutive.
+    :param id_offsets: 1-d int ndarray, the start row of each id followed by the row number
+           of arr.
+    :param lookback: the length of the past sequence
+    :param horizon: int or list, same as `roll_timeseries_dataframe`.
+    :param target_num: int, the number of target columns in arr.
+    :param label_len: This parameter is only for transformer-based model.
+    :param is_test: bool, if True, only x will be rolled and y will be None.
+    :return: x, y, roll_start_idxes
+        x: 3-d numpy array in format (no. of samples, lookback, arr.shape[1])
+        y: 3-d numpy array in format (no. of samples, horizon + label_len, target_num)
+        roll_start_idxes: 1-d numpy array, the start row in arr of each sample.
+    Windows containing N/A are dropped, samples are ordered by id then by time.
+    """
+    from bigdl.nano.utils.common import invalidInputError
+    if not is_test and label_len != 0 and isinstance(horizon, list):
+        invalidInputError(False,
+                          "horizon should be an integer if label_len is set to larger than 0.")
+    max_horizon = 0 if is_test else (horizon if isinstance(horizon, int) else max(horizon))
+    roll_start_idxes = _get_roll_start_idx_by_offsets(id_offsets, lookback + max_horizon)
+
+    # drop the windows with N/A in x or y
+    nan_cnt = _nan_count(arr)
+    valid = nan_cnt[roll_start_idxes + lookback] == nan_cnt[roll_start_idxes]
+    if not is_test:
+        target_arr = arr[:, :target_num]
+        if isinstance(horizon, int):
+            nan_cnt = _nan_count(target_arr)
+            valid &= nan_cnt[roll_start_idxes + lookback + horizon] == \
+                nan_cnt[roll_start_idxes + lookback - label_len]
+        else:
+            nan_row = np.isnan(target_arr).any(axis=1)
+            for h in horizon:
+                valid &= ~nan_row[roll_start_idxes + lookback + h - 1]
+    if not valid.all():
+        roll_start_idxes = roll_start_idxes[valid]
+
+    x = _take_window(_sliding_window(arr, lookback), roll_start_idxes)
+    if is_test:
+        return x, None, roll_start_idxes
+    if isinstance(horizon, int):
+        y = _take_window(_sliding_window(target_arr, horizon + label_len),
+                         roll_start_idxes + lookback - label_len)
+    else:
+        y = target_arr[roll_start_idxes[:, None] + lookback - 1 + np.array(horizon)[None, :]]
+    return x, y, roll_start_idxes
+
+
+def _nan_free_window_mask(data, window_size, window_idx=None):
+    '''
+    Return a bool ndarray of length (num_timestep - window_size + 1) which is True when the
+    window starting at that timestep (or the offsets in window_idx of it) contains no NaN.
+    Only O(num_timestep) extra memory is used, instead of checking the rolled array.
+    '''
+    num_window = max(data.shape[0] - window_size + 1, 0)
+    nan_row = np.isnan(data).any(axis=tuple(range(1, data.ndim)))
+    if window_idx is None:
+        nan_cnt = np.concatenate([[0], np.cumsum(nan_row, dtype=np.int64)])
+        return (nan_cnt[window_size:window_size + num_window] - nan_cnt[:num_window]) == 0
+    mask = np.ones(num_window, dtype=bool)
+    for offset in window_idx:
+        mask &= ~nan_row[offset:offset + num_window]
+    return mask
 
 
 def _roll_timeseries_ndarray(data, window):
@@ -186,24 +307,30 @@ def _roll_timeseries_ndarray(data, window):
     data should be a ndarray with num_dim = 2
     first dim is timestamp
     second dim is feature
+
+    The rolled result is a read-only strided view on data when window is an int,
+    so no (num_timestep, window, num_feature) copy is made until the caller
+    selects samples from it.
     '''
     from bigdl.nano.utils.common import invalidInputError
     invalidInputError(data.ndim == 2,
                       "data dim is expected to be 2")  # (num_timestep, num_feature)
-    data = np.expand_dims(data, axis=1)  # (num_timestep, 1, num_feature)
 
     # window index and capacity
     window_size = window if isinstance(window, int) else max(window)
     if isinstance(window, int):
-        window_idx = np.arange(window)
+        window_idx = None
     else:
         window_idx = np.array(window) - 1
 
-    roll_data = np.concatenate([_shift(data, i) for i in range(0, -window_size, -1)], axis=1)
-    if data.shape[0] >= window_size:
-        roll_data = roll_data[:data.shape[0]-window_size+1, window_idx, :]
-    else:
-        roll_data = roll_data[:0, window_idx, :]  # no sample will be sampled
-    mask = ~np.any(np.isnan(roll_data), axis=(1, 2))
+    roll_data = _sliding_window(data, window_size)
+    if window_idx is not None:
+        roll_data = roll_data[:, window_idx, :]
+    mask = _nan_free_window_mask(data, window_size, window_idx)
 
     return roll_data, mask
+
+
+def _take_valid_window(roll_data, mask):
+    # boolean indexing always copies, keep the strided view when every window is valid
+    return roll_data if mask.all() else roll_data[mask]
@@ -0,0 +1,130 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+# bump this when the layout of rolled arrays or the cache files changes
+ROLL_CACHE_VERSION = 1
+_ROLL_CACHE_META = "meta.json"
+_ROLL_CACHE_ARRAYS = ("numpy_x", "numpy_y", "numpy_x_timeenc", "numpy_y_timeenc")
+
+
+def _update_with_array(sha, arr):
+    arr = np.ascontiguousarray(arr)
+    sha.update(str(arr.dtype).encode())
+    sha.update(str(arr.shape).encode())
+    if arr.dtype == object:
+        sha.update(pd.util.hash_array(arr.ravel()).tobytes())
+    else:
+        sha.update(arr.tobytes())
+
+
+def _update_with_scaler(sha, scaler):
+    if scaler is None:
+        sha.update(b"None")
+        return
+    sha.update(type(scaler).__name__.encode())
+    # fitted attributes of sklearn scalers end with "_", e.g. mean_, scale_
+    for name, value in sorted(vars(scaler).items()):
+        sha.update(name.encode())
+        if isinstance(value, np.ndarray):
+            _update_with_array(sha, value)
+        else:
+            sha.update(repr(value).encode())
+
+
+def get_roll_cache_key(df, cols, roll_feature_df=None, scaler=None, **roll_params):
+    """
+    Get the key of a rolling result, which is a fingerprint of the data (cols of df and
+    roll_feature_df), the scaler state and the roll parameters.
+
+    :param df: the dataframe to roll on.
+    :param cols: list, the columns of df that the rolling result depends on.
+    :param roll_feature_df: the additional rolling feature dataframe, if any.
+    :param scaler: the scaler which has been applied to df, if any.
+    :param roll_params: other parameters of roll, e.g. lookback, horizon, feature_col.
+    :return: a hex str.
+    """
+    sha = hashlib.sha256()
+    sha.update(f"v{ROLL_CACHE_VERSION}".encode())
+    sha.update(json.dumps(roll_params, sort_keys=True, default=str).encode())
+    sha.update(json.dumps(cols).encode())
+    _update_with_array(sha, pd.util.hash_pandas_object(df[cols], index=False).values)
+    if roll_feature_df is not None:
+        sha.update(json.dumps(list(roll_feature_df.columns)).encode())
+        _update_with_array(sha,
+                           pd.util.hash_pandas_object(roll_feature_df, index=False).values)
+    _update_with_scaler(sha, scaler)
+    return sha.hexdigest()
+
+
+def _get_roll_cache_path(cache_dir, key):
+    return os.path.join(cache_dir, f"v{ROLL_CACHE_VERSION}", key)
+
+
+def load_roll_cache(cache_dir, key):
+    """
+    Load the rolled arrays of key from cache_dir as read-only memory-mapped ndarrays.
+
+    :return: a dict of array name to ndarray (None for arrays that were None when saved),
+             or None if key is not found in cache_dir.
+    """
+    path = _get_roll_cache_path(cache_dir, key)
+    meta_path = os.path.join(path, _ROLL_CACHE_META)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            if name in meta["arrays"] else None
+            for name in _ROLL_CACHE_ARRAYS}
+
+
+def save_roll_cache(cache_dir, key, arrays):
+    """
+    Save the rolled arrays of key to cache_dir. The files are written into a temporary
+    directory and then renamed, so that other processes never see a partial result.
+
+    :param arrays: a dict of array name to ndarray or None.
+    """
+    path = _get_roll_cache_path(cache_dir, key)
+    if os.path.exists(path):
+        return
+    tmp_path = f"{path}.tmp-{os.getpid()}-{uuid.uuid4().hex}"
+    os.makedirs(tmp_path)
+    try:
+        saved = []
+        for name in _ROLL_CACHE_ARRAYS:
+            if arrays.get(name) is not None:
+                np.save(os.path.join(tmp_path, f"{name}.npy"), arrays[name])
+                saved.append(name)
+        # meta file is written last, it marks the cache as complete
+        with open(os.path.join(tmp_path, _ROLL_CACHE_META), "w") as f:
+            json.dump({"version": ROLL_CACHE_VERSION, "arrays": saved}, f)
+        os.rename(tmp_path, path)
+    except OSError:
+        # another process has saved the same key
+        if not os.path.exists(os.path.join(path, _ROLL_CACHE_META)):
+            raise
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
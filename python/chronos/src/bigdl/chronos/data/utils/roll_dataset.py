@@ -14,25 +14,18 @@
 # limitations under the License.
 #
 
+from collections.abc import Sequence
+
 import numpy as np
 from torch.utils.data import Dataset
+from torch.utils.data.dataloader import default_collate
 import torch
 import pandas as pd
 
 from bigdl.chronos.data.utils.utils import _check_cols_no_na, _to_list
-from bigdl.chronos.data.utils.time_feature import time_features, gen_time_enc_arr
-
-
-def get_roll_start_idx(df, id_col, window_size):
-    import itertools
-    if not id_col:
-        id_start_idxes = [0, len(df.index)]
-    else:
-        id_start_idxes = df.index[df[id_col] != df[id_col].shift(1)].tolist() + [len(df.index)]
-    roll_start_idx_iter = ((range(id_start_idxes[i], id_start_idxes[i+1] - window_size + 1))
-                           for i in range(len(id_start_idxes) - 1))
-    roll_start_idxes = np.fromiter(itertools.chain.from_iterable(roll_start_idx_iter), np.int)
-    return roll_start_idxes
+from bigdl.chronos.data.utils.time_feature import gen_time_stamp_by_id
+from bigdl.chronos.data.utils.roll import get_roll_start_idx, _get_id_offsets, \
+    _get_roll_start_idx_by_offsets
 
 
 class RollDataset(Dataset):
@@ -88,9 +81,15 @@ class RollDataset(Dataset):
         cols = cols[0] if len(cols) == 1 else cols
         self.arr = df.loc[:, cols].to_numpy()
         self.arr = np.expand_dims(self.arr, axis=1) if self.arr.ndim == 1 else self.arr
+        # cast once here instead of per sample/batch
+        self.arr = np.ascontiguousarray(self.arr, dtype=np.float32)
         max_horizon = horizon if isinstance(horizon, int) else max(horizon)
         window_size = lookback + max_horizon
-        self.roll_start_idxes = get_roll_start_idx(df, id_col, window_size=window_size)
+        if not id_col:
+            id_offsets = np.array([0, len(df.index)], dtype=np.int64)
+        else:
+            id_offsets = _get_id_offsets(df[id_col].values)
+        self.roll_start_idxes = _get_roll_start_idx_by_offsets(id_offsets, window_size)
         self.lookback = lookback
         self.horizon = horizon
         self.target_num = len(target_col)
@@ -100,15 +99,26 @@ class RollDataset(Dataset):
         self.time_enc = time_enc
         self.label_len = label_len
         if self.time_enc:
-            df_stamp = pd.DataFrame(columns=[dt_col])
-            if is_predict:
-                pred_dates = pd.date_range(df[dt_col].values[-1], periods=self.horizon_time + 1,
-                                           freq=freq)
-                df_stamp.loc[:, dt_col] = list(df[dt_col].values) + list(pred_dates[1:])
-            else:
-                df_stamp.loc[:, dt_col] = list(df[dt_col].values)
-            data_stamp = time_features(pd.to_datetime(df_stamp[dt_col].values), freq=freq)
-            self.data_stamp_arr = data_stamp.transpose(1, 0)
+            # future timestamps are appended after each id when is_predict is True
+            self.data_stamp_arr, stamp_shift = gen_time_stamp_by_id(df[dt_col].values,
+                                                                    id_offsets,
+                                                                    freq=freq,
+                                                                    horizon_time=self.horizon_time,
+                                                                    is_predict=is_predict)
+            self.data_stamp_arr = np.ascontiguousarray(self.data_stamp_arr, dtype=np.float32)
+            id_idxes = np.searchsorted(id_offsets, self.roll_start_idxes, side='right') - 1
+            self.stamp_start_idxes = self.roll_start_idxes + stamp_shift[id_idxes]
+
+        # window offsets (relative to start idx) used to gather a batch
+        self.x_offsets = np.arange(self.lookback)
+        if isinstance(self.horizon, int):
+            self.y_offsets = np.arange(self.lookback - self.label_len,
+                                       self.lookback + self.horizon)
+        else:
+            self.y_offsets = np.array(self.horizon) + self.lookback - 1
+        if self.time_enc:
+            self.y_enc_offsets = np.arange(self.lookback - self.label_len,
+                                           self.lookback + self.horizon_time)
 
     def __len__(self):
         return self.roll_start_idxes.size
@@ -134,15 +144,74 @@ class RollDataset(Dataset):
         y = torch.from_numpy(y).float()
 
         if self.time_enc:
+            stamp_start_idx = self.stamp_start_idxes[idx]
             # cal x_enc
-            x_enc = self.data_stamp_arr[start_idx: start_idx + self.lookback]
+            x_enc = self.data_stamp_arr[stamp_start_idx: stamp_start_idx + self.lookback]
             x_enc = torch.from_numpy(x_enc).float()
             # cal y_enc
-            y_enc = self.data_stamp_arr[start_idx + self.lookback - self.label_len:
-                                        start_idx + self.lookback + self.horizon_time]
+            y_enc = self.data_stamp_arr[stamp_start_idx + self.lookback - self.label_len:
+                                        stamp_start_idx + self.lookback + self.horizon_time]
             y_enc = torch.from_numpy(y_enc).float()
 
         if self.time_enc:
             return x, y, x_enc, y_enc
         else:
             return x, y
+
+    def __getitems__(self, idxes):
+        """
+        Gather a batch of samples at once by fancy indexing on the rolled start indexes,
+        instead of calling __getitem__ for each sample. torch DataLoader (torch>=2.0) calls
+        this method automatically, and `roll_batch_collate_fn` returns the gathered batch
+        directly, i.e. x in shape (batch_size, lookback, feature_num) and so on.
+        """
+        idxes = np.asarray(idxes)
+        start_idxes = self.roll_start_idxes[idxes][:, None]
+
+        # cal x
+        x = torch.from_numpy(self.arr[start_idxes + self.x_offsets])
+        if self.is_predict is True and not self.time_enc:
+            return _RollTensorBatch(x)
+
+        # cal y
+        y = torch.from_numpy(self.arr[start_idxes + self.y_offsets, :self.target_num])
+
+        if self.time_enc:
+            stamp_start_idxes = self.stamp_start_idxes[idxes][:, None]
+            x_enc = torch.from_numpy(self.data_stamp_arr[stamp_start_idxes + self.x_offsets])
+            y_enc = torch.from_numpy(self.data_stamp_arr[stamp_start_idxes +
+                                                         self.y_enc_offsets])
+            return _RollBatch((x, y, x_enc, y_enc))
+        else:
+            return _RollBatch((x, y))
+
+
+class _RollBatch(Sequence):
+    """
+    The samples (as returned by __getitem__) of a batch gathered by __getitems__, which
+    carries the collated batch as well. Samples are only sliced out when they are
+    accessed, so that it could still be collated by other collate_fn (e.g. default_collate).
+    """
+
+    def __init__(self, collated):
+        self.collated = collated
+
+    def __len__(self):
+        return len(self.collated[0])
+
+    def __getitem__(self, idx):
+        return tuple(tensor[idx] for tensor in self.collated)
+
+
+class _RollTensorBatch(list):
+    # torch.stack in default_collate only accepts a list of tensors
+    def __init__(self, collated):
+        super().__init__(collated.unbind(0))
+        self.collated = collated
+
+
+def roll_batch_collate_fn(batch):
+    # batch gathered by RollDataset.__getitems__ has been collated already
+    if isinstance(batch, (_RollBatch, _RollTensorBatch)):
+        return batch.collated
+    return default_collate(batch)
@@ -42,7 +42,7 @@ import numpy as np
 import pandas as pd
 from pandas import Timedelta
 from pandas.tseries.frequencies import to_offset
-from bigdl.chronos.data.utils.roll import _roll_timeseries_ndarray
+from bigdl.chronos.data.utils.roll import _roll_timeseries_ndarray, _sliding_window, _take_window
 
 
 class TimeFeature:
@@ -170,3 +170,45 @@ def gen_time_enc_arr(df, dt_col, freq, horizon_time, is_predict, lookback, label
     numpy_y_timeenc, _ = _roll_timeseries_ndarray(data_stamp[lookback-label_len:],
                                                   horizon_time+label_len)
     return numpy_x_timeenc, numpy_y_timeenc
+
+
+def gen_time_stamp_by_id(dt_values, id_offsets, freq, horizon_time, is_predict):
+    """
+    Generate the time encoding of all ids in one pass.
+
+    When is_predict is True, `horizon_time` future timestamps are appended after
+    each id, so the stamp of row i (of the k-th id) is located at
+    i + stamp_shift[k] in the returned data_stamp.
+
+    :return: data_stamp, stamp_shift
+    """
+    dt_values = np.asarray(dt_values)
+    num_id = len(id_offsets) - 1
+    if is_predict and horizon_time > 0:
+        freq = Timedelta(freq)
+        stamp_shift = np.arange(num_id, dtype=np.int64) * horizon_time
+        dates = np.empty(len(dt_values) + num_id * horizon_time, dtype=dt_values.dtype)
+        dates[np.arange(len(dt_values)) + np.repeat(stamp_shift, np.diff(id_offsets))] = \
+            dt_values
+        last_dates = pd.DatetimeIndex(dt_values[id_offsets[1:] - 1])
+        future_start = id_offsets[1:] + stamp_shift
+        for step in range(1, horizon_time + 1):
+            dates[future_start + step - 1] = (last_dates + step * freq).values
+    else:
+        stamp_shift = np.zeros(num_id, dtype=np.int64)
+        dates = dt_values
+    data_stamp = time_features(pd.to_datetime(dates), freq=freq)
+    return data_stamp.transpose(1, 0), stamp_shift
+
+
+def gen_time_enc_arr_by_id(dt_values, id_offsets, roll_start_idxes, freq, horizon_time,
+                           is_predict, lookback, label_len):
+    data_stamp, stamp_shift = gen_time_stamp_by_id(dt_values, id_offsets, freq,
+                                                   horizon_time, is_predict)
+    id_idxes = np.searchsorted(id_offsets, roll_start_idxes, side='right') - 1
+    stamp_start_idxes = roll_start_idxes + stamp_shift[id_idxes]
+    numpy_x_timeenc = _take_window(_sliding_window(data_stamp, lookback),
+                                   stamp_start_idxes)
+    numpy_y_timeenc = _take_window(_sliding_window(data_stamp, horizon_time + label_len),
+                                   stamp_start_idxes + lookback - label_len)
+    return numpy_x_timeenc, numpy_y_timeenc
@@ -15,9 +15,36 @@
 #
 
 from bigdl.chronos.detector.anomaly.abstract import AnomalyDetector
-from bigdl.chronos.detector.anomaly.util import roll_arr, scale_arr
+from bigdl.chronos.detector.anomaly.util import roll_arr, scale_arr, \
+    minmax_params, minmax_transform
 import numpy as np
 
+# number of subsequences reconstructed at a time when computing the errors
+PREDICT_CHUNK_SIZE = 8192
+
+
+def aggregate_subseq_err(recon_err, recon_err_subseq, sub_scalef, out, start=0):
+    """
+    Scatter the error of each point in the subsequences to the time series, one point
+    belongs to several subsequences and only the largest error is kept.
+
+    :param recon_err: the recon err of each point in subsequences start, start + 1, ...
+        in shape (num_subseq, roll_len)
+    :param recon_err_subseq: the recon err of each subsequence in shape (num_subseq,)
+    :param sub_scalef: scale factor for the subsequence err
+    :param out: the aggregated err of each point in the time series, updated inplace
+    :param start: the index of the first subsequence in recon_err
+    """
+    agg_err = recon_err + sub_scalef * recon_err_subseq[:, None]
+    num_subseq, roll_len = agg_err.shape
+    # subsequence i covers points start + i ... start + i + roll_len - 1, so the j-th
+    # column of agg_err is scattered to a contiguous slice, which is much faster than
+    # np.maximum.at on all the point indexes
+    for j in range(roll_len):
+        out_j = out[start + j:start + j + num_subseq]
+        np.maximum(out_j, agg_err[:, j], out=out_j)
+    return out
+
 
 def create_tf_model(compress_rate,
                     input_dim,
@@ -109,6 +136,7 @@ class AEDetector(AnomalyDetector):
         self.sub_scalef = sub_scalef
         self.recon_err = None
         self.recon_err_subseq = None
+        self.recon_err_agg = None
         self.anomaly_scores_ = None
         self.backend = backend
         self.lr = lr
@@ -133,59 +161,96 @@ class AEDetector(AnomalyDetector):
         :param y: the input time series. y must be 1-D numpy array.
         """
         self.check_data(y)
-        self.anomaly_scores_ = np.zeros_like(y)
+        self.anomaly_scores_ = np.zeros(y.shape[0])
 
         if self.roll_len != 0:
-            # roll the time series to create sub sequences
+            # roll the time series to create sub sequences, the rolled array is a view of y
+            # and is only materialized (and scaled) chunk by chunk
             y = roll_arr(y, self.roll_len)
             self.check_rolled(y)
         else:
             y = y.reshape(1, -1)
             self.check_rolled(y)
-        y = scale_arr(y)
+        data_min, data_range = minmax_params(y)
+
+        def get_chunk(idx):
+            return minmax_transform(y[idx], data_min, data_range)
 
         if self.backend == "keras":
-            ae_model = create_tf_model(self.compress_rate, len(y[0]), lr=self.lr)
-            ae_model.fit(y,
-                         y,
-                         batch_size=self.batch_size,
-                         epochs=self.epochs,
-                         verbose=self.verbose)
-            y_pred = ae_model.predict(y)
+            predict_fn = self._fit_tf_model(y, get_chunk)
         elif self.backend == "torch":
-            import torch.optim as optim
-            import torch.nn as nn
-            import torch
-            from torch.utils.data import TensorDataset, DataLoader
-            ae_model = create_torch_model(self.compress_rate, len(y[0]))
-            optimizer = optim.Adadelta(ae_model.parameters(), lr=self.lr)
-            criterion = nn.BCELoss()
-            y = torch.from_numpy(y).float()
-            if y.ndim == 1:
-                y = y.reshape(-1, 1)
-            train_loader = DataLoader(TensorDataset(y, y),
-                                      batch_size=int(self.batch_size),
-                                      shuffle=True)
-            for epochs in range(self.epochs):
-                for x_batch, y_batch in train_loader:
-                    optimizer.zero_grad()
-                    yhat = ae_model(x_batch)
-                    loss = criterion(yhat, y_batch)
-                    loss.backward()
-                    optimizer.step()
-            y_pred_list = []
-            for x_batch, y_batch in train_loader:
-                y_pred_list.append(ae_model(x_batch).detach().numpy())
-            y_pred = np.concatenate(y_pred_list, axis=0)
+            predict_fn = self._fit_torch_model(y, get_chunk)
         else:
             from bigdl.nano.utils.common import invalidInputError
             invalidInputError(False,
                               "backend type can only be 'keras' or 'torch'")
-        # calculate the recon err for each data point in rolled array
-        self.recon_err = abs(y - y_pred)
-        # calculate the (aggregated) recon err for each sub sequence
+
+        chunk_size = max(int(self.batch_size), PREDICT_CHUNK_SIZE)
         if self.roll_len != 0:
-            self.recon_err_subseq = np.linalg.norm(self.recon_err, axis=1)
+            self.recon_err = None
+            self.recon_err_subseq = np.empty(len(y))
+            self.recon_err_agg = np.zeros(self.anomaly_scores_.shape[0])
+            for start in range(0, len(y), chunk_size):
+                y_chunk = get_chunk(slice(start, start + chunk_size))
+                # calculate the recon err for each data point in rolled chunk
+                recon_err = abs(y_chunk - predict_fn(y_chunk))
+                # calculate the (aggregated) recon err for each sub sequence
+                recon_err_subseq = np.linalg.norm(recon_err, axis=1)
+                self.recon_err_subseq[start:start + len(y_chunk)] = recon_err_subseq
+                aggregate_subseq_err(recon_err, recon_err_subseq, self.sub_scalef,
+                                     out=self.recon_err_agg, start=start)
+        else:
+            y = get_chunk(slice(None))
+            self.recon_err = abs(y - predict_fn(y))
+            self.recon_err_subseq = None
+
+    def _fit_tf_model(self, y, get_chunk):
+        import tensorflow as tf
+
+        class RolledSequence(tf.keras.utils.Sequence):
+            def __init__(self, num, batch_size):
+                self.num = num
+                self.batch_size = batch_size
+                self.idx = np.random.permutation(num)
+
+            def __len__(self):
+                return (self.num + self.batch_size - 1) // self.batch_size
+
+            def __getitem__(self, i):
+                x = get_chunk(np.sort(self.idx[i * self.batch_size:(i + 1) * self.batch_size]))
+                return x, x
+
+            def on_epoch_end(self):
+                np.random.shuffle(self.idx)
+
+        ae_model = create_tf_model(self.compress_rate, y.shape[1], lr=self.lr)
+        ae_model.fit(RolledSequence(len(y), int(self.batch_size)),
+                     epochs=self.epochs,
+                     verbose=self.verbose)
+        return lambda x: ae_model.predict(x, batch_size=int(self.batch_size), verbose=0)
+
+    def _fit_torch_model(self, y, get_chunk):
+        import torch.optim as optim
+        import torch.nn as nn
+        import torch
+        ae_model = create_torch_model(self.compress_rate, y.shape[1])
+        optimizer = optim.Adadelta(ae_model.parameters(), lr=self.lr)
+        criterion = nn.BCELoss()
+        batch_size = int(self.batch_size)
+        for epochs in range(self.epochs):
+            idx = np.random.permutation(len(y))
+            for i in range(0, len(y), batch_size):
+                x_batch = torch.from_numpy(get_chunk(np.sort(idx[i:i + batch_size])))
+                optimizer.zero_grad()
+                yhat = ae_model(x_batch)
+                loss = criterion(yhat, x_batch)
+                loss.backward()
+                optimizer.step()
+
+        def predict_fn(x):
+            with torch.no_grad():
+                return ae_model(torch.from_numpy(x)).numpy()
+        return predict_fn
 
     def score(self):
         """
@@ -204,14 +269,8 @@ class AEDetector(AnomalyDetector):
 
         # if input is rolled
         if self.recon_err_subseq is not None:
-            # recon_err = MinMaxScaler().fit_transform(self.recon_err)
-            # recon_err_subseq = MinMaxscaler().fit_transform(self.recon_err_subseq.reshape(-1, 1))
-            for index, e in np.ndenumerate(self.recon_err):
-                agg_err = e + self.sub_scalef * self.recon_err_subseq[index[0]]
-                y_index = index[0] + index[1]
-                # only keep the largest err score for each ts sample
-                if agg_err > self.anomaly_scores_[y_index]:
-                    self.anomaly_scores_[y_index] = agg_err
+            # the errors are aggregated chunk by chunk in fit
+            self.anomaly_scores_ = self.recon_err_agg
         else:
             self.anomaly_scores_ = self.recon_err
 
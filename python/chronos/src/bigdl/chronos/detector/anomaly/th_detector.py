@@ -37,6 +37,17 @@ class Distance(ABC):
         """
         pass
 
+    def batch_abs_dist(self, x, y):
+        """
+        Calculate the distances between each sample (along the first dim) in x and y.
+        x and y should be in same shape.
+
+        :param x: the first tensor
+        :param y: the second tensor
+        :return: a 1-D array of the absolute distance of each sample
+        """
+        return np.array([self.abs_dist(m, n) for m, n in zip(x, y)])
+
 
 class EuclideanDistance(Distance):
     """
@@ -49,6 +60,10 @@ class EuclideanDistance(Distance):
     def abs_dist(self, x, y):
         return np.linalg.norm(x - y)
 
+    def batch_abs_dist(self, x, y):
+        diff = np.asarray(x) - np.asarray(y)
+        return np.linalg.norm(diff.reshape(diff.shape[0], -1), axis=1)
+
 
 def estimate_th(y,
                 yhat,
@@ -69,7 +84,7 @@ def estimate_th(y,
     """
     from bigdl.nano.utils.common import invalidInputError
     invalidInputError(y.shape == yhat.shape, "y shape doesn't match yhat shape")
-    diff = [dist_measure.abs_dist(m, n) for m, n in zip(y, yhat)]
+    diff = dist_measure.batch_abs_dist(y, yhat)
     if mode == "default":
         threshold = np.percentile(diff, (1 - ratio) * 100)
         return threshold
@@ -82,14 +97,70 @@ def estimate_th(y,
         invalidInputError(False, f"Does not support ${mode}")
 
 
+class StreamingThresholdEstimator:
+    """
+    Estimate the threshold on a stream of distances without keeping all of them.
+
+    "default" mode keeps a uniform sample (reservoir sampling) of at most sample_size
+    distances and uses its percentile, which is exact before sample_size distances are
+    seen. "gaussian" mode keeps the running count, mean and sum of squared deviations.
+    """
+
+    def __init__(self, mode="default", ratio=0.01, sample_size=100000, seed=None):
+        from bigdl.nano.utils.common import invalidInputError
+        invalidInputError(mode in ["default", "gaussian"], f"Does not support ${mode}")
+        self.mode = mode
+        self.ratio = ratio
+        self.sample_size = sample_size
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.sample = np.empty(sample_size, dtype=np.float64)
+        self.rng = np.random.default_rng(seed)
+
+    def update(self, dist):
+        dist = np.asarray(dist, dtype=np.float64).ravel()
+        num = dist.shape[0]
+        if num == 0:
+            return
+        if self.mode == "default":
+            filled = min(self.count, self.sample_size)
+            num_fill = min(num, self.sample_size - filled)
+            self.sample[filled:filled + num_fill] = dist[:num_fill]
+            if num_fill < num:
+                # the i-th distance of the stream replaces a random slot with
+                # probability sample_size / (i + 1), later ones overwrite earlier ones
+                seen = self.count + np.arange(num_fill, num)
+                slot = self.rng.integers(0, seen + 1)
+                accept = slot < self.sample_size
+                self.sample[slot[accept]] = dist[num_fill:][accept]
+        else:
+            # merge the moments of this batch (Chan et al.)
+            batch_mean = dist.mean()
+            batch_m2 = np.square(dist - batch_mean).sum()
+            delta = batch_mean - self.mean
+            total = self.count + num
+            self.mean += delta * num / total
+            self.m2 += batch_m2 + delta ** 2 * self.count * num / total
+        self.count += num
+
+    def threshold(self):
+        if self.count == 0:
+            return math.inf
+        if self.mode == "default":
+            return np.percentile(self.sample[:min(self.count, self.sample_size)],
+                                 (1 - self.ratio) * 100)
+        from scipy.stats import norm
+        # same as norm.fit, i.e. maximum likelihood estimation of sigma
+        sigma = math.sqrt(self.m2 / self.count)
+        return norm.ppf(1 - self.ratio) * sigma + self.mean
+
+
 def detect_all(y, yhat, th, dist_measure):
+    is_anomaly = dist_measure.batch_abs_dist(y, yhat) > th
     anomaly_scores = np.zeros_like(y)
-    anomaly_indexes = []
-    for i, (y_i, yhat_i) in enumerate(zip(y, yhat)):
-        if dist_measure.abs_dist(y_i, yhat_i) > th:
-            anomaly_indexes.append(i)
-            anomaly_scores[i] = 1
-    return anomaly_indexes, anomaly_scores
+    anomaly_scores[is_anomaly] = 1
+    return np.flatnonzero(is_anomaly).tolist(), anomaly_scores
 
 
 def detect_range(y, th):
@@ -102,11 +173,12 @@ def detect_range(y, th):
 def detect_range_arr(y, th_arr):
     min_diff = y - th_arr[0]
     max_diff = y - th_arr[1]
-    anomaly_indexes = np.logical_or(min_diff < 0, max_diff > 0)
+    is_anomaly = np.logical_or(min_diff < 0, max_diff > 0)
     anomaly_scores = np.zeros_like(y)
-    anomaly_scores[anomaly_indexes] = 1
-    # anomaly_index.update(np.where(max_diff > 0)[0])
-    return list(set(np.where(anomaly_scores > 0)[0])), anomaly_scores
+    anomaly_scores[is_anomaly] = 1
+    # a sample is an anomaly if any of its dimensions is out of range
+    is_anomaly = is_anomaly.reshape(is_anomaly.shape[0], -1).any(axis=1)
+    return np.flatnonzero(is_anomaly).tolist(), anomaly_scores
 
 
 def detect_anomaly(y,
@@ -170,6 +242,11 @@ class ThresholdDetector(AnomalyDetector):
             >>> td.fit(y_test, y_pred)
             >>> anomaly_scores = td.score()
             >>> anomaly_indexes = td.anomaly_indexes()
+            >>> # detect anomalies on a stream with an online estimated threshold
+            >>> td = ThresholdDetector()
+            >>> td.set_params(ratio=0.01)
+            >>> for y_batch, y_pred_batch in stream:
+            >>>     anomaly_scores = td.update(y_batch, y_pred_batch)
     """
 
     def __init__(self):
@@ -180,14 +257,17 @@ class ThresholdDetector(AnomalyDetector):
         self.ratio = 0.01
         self.dist_measure = EuclideanDistance()
         self.mode = "default"
+        self.sample_size = 100000
         self.anomaly_indexes_ = None
         self.anomaly_scores_ = None
+        self.estimator_ = None
 
     def set_params(self,
                    mode="default",
                    ratio=0.01,
                    threshold=math.inf,
-                   dist_measure=EuclideanDistance()):
+                   dist_measure=EuclideanDistance(),
+                   sample_size=100000):
         """
         Set parameters for ThresholdDetector
 
@@ -202,11 +282,15 @@ class ThresholdDetector(AnomalyDetector):
             2. a tuple (min, max) - min and max are either int/float or tensors in same shape as y,
             yhat is ignored in this case
         :param dist_measure: measure of distance
+        :param sample_size: only effective in `update` with "default" mode, the max number
+            of distances sampled from the stream to estimate the threshold.
         """
         self.ratio = ratio
         self.dist_measure = dist_measure
         self.mode = mode
         self.th = threshold
+        self.sample_size = sample_size
+        self.estimator_ = None
 
     def fit(self, y, y_pred=None):
         """
@@ -228,6 +312,34 @@ class ThresholdDetector(AnomalyDetector):
         self.anomaly_indexes_ = anomalies[0]
         self.anomaly_scores_ = anomalies[1]
 
+    def update(self, y, y_pred=None):
+        """
+        Update the model with a new batch of a stream and detect anomalies in it. If the
+        threshold is not set before the first update, it is estimated online on all the
+        batches seen so far (according to mode and ratio) instead of refitting.
+
+        :param y: the values of the new batch. shape could be 1-D (num_samples,)
+            or 2-D array (num_samples, features)
+        :param y_pred: the estimated values, a tensor with same shape as y
+            could be None when threshold is a tuple
+
+        :return: anomaly score for each sample in the batch, the anomaly indexes in the
+            batch could be got by `anomaly_indexes` afterwards.
+        """
+        from bigdl.nano.utils.common import invalidInputError
+        if y_pred is not None and (self.estimator_ is not None or self.th == math.inf):
+            invalidInputError(y.shape == y_pred.shape, "y shape doesn't match yhat shape")
+            if self.estimator_ is None:
+                self.estimator_ = StreamingThresholdEstimator(mode=self.mode,
+                                                              ratio=self.ratio,
+                                                              sample_size=self.sample_size)
+            self.estimator_.update(self.dist_measure.batch_abs_dist(y, y_pred))
+            self.th = self.estimator_.threshold()
+        anomalies = detect_anomaly(y, y_pred, self.th, self.dist_measure)
+        self.anomaly_indexes_ = anomalies[0]
+        self.anomaly_scores_ = anomalies[1]
+        return self.anomaly_scores_
+
     def score(self, y=None, y_pred=None):
         """
         Gets the anomaly scores for each sample. Each anomaly score is either 0 or 1,
@@ -52,7 +52,22 @@ class INTEL_EXT_DBSCAN:
 
 
 def roll_arr(arr, stride):
-    return np.asarray([arr[i:i + stride] for i in range(len(arr) - stride + 1)])
+    # a read-only strided view, the rolled array is not materialized
+    if len(arr) < stride:
+        return np.empty((0, stride), dtype=arr.dtype)
+    return np.lib.stride_tricks.sliding_window_view(arr, stride)
+
+
+def minmax_params(arr):
+    # the same as MinMaxScaler fitted on arr, reduced without copying arr
+    data_min = arr.min(axis=0)
+    data_range = arr.max(axis=0) - data_min
+    data_range[data_range == 0] = 1
+    return data_min, data_range
+
+
+def minmax_transform(arr, data_min, data_range):
+    return ((arr - data_min) / data_range).astype('float32')
 
 
 def scale_arr(arr, mode="minmax"):
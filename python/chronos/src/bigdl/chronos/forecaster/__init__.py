@@ -53,6 +53,9 @@ orca_available = bool(importlib.util.find_spec('bigdl.orca'))
 
 # import forecasters
 PREFIXNAME = 'bigdl.chronos.forecaster.'
+BatchingPredictor = LazyImport(PREFIXNAME+'batching_predictor.BatchingPredictor')
+fit_many = LazyImport(PREFIXNAME+'fit_many.fit_many')
+fit_many_iter = LazyImport(PREFIXNAME+'fit_many.fit_many_iter')
 if torch_available:
     LSTMForecaster = LazyImport(PREFIXNAME+'lstm_forecaster.LSTMForecaster')
     TCNForecaster = LazyImport(PREFIXNAME+'tcn_forecaster.TCNForecaster')
@@ -1095,20 +1095,9 @@ class BasePytorchForecaster(Forecaster):
                 invalidInputError(False,
                                   "You must call fit or restore first before calling evaluate!")
             if isinstance(data, DataLoader):
-                from torch.utils.data.sampler import RandomSampler
-                if isinstance(data.sampler, RandomSampler):
-                    # If dataloader is shuffled, convert input_data to numpy()
-                    # Avoid to iterate shuffled dataloader two times
-                    input_x = []
-                    input_y = []
-                    for val in data:
-                        input_x.append(val[0].numpy())
-                        input_y.append(val[1].numpy())
-                    input_data = np.concatenate(input_x, axis=0)
-                    target = np.concatenate(input_y, axis=0)
-                else:
-                    input_data = data
-                    target = np.concatenate(tuple(val[1] for val in data), axis=0)
+                # the target is collected in the same pass as the inference, so the
+                # dataloader (even if shuffled) is iterated only once
+                input_data, target = data, None
             else:
                 input_data, target = data
             if quantize:
@@ -1116,20 +1105,22 @@ class BasePytorchForecaster(Forecaster):
                     invalidInputError(False,
                                       "Can't find the quantized model, "
                                       "please call .quantize() method first")
-                yhat = _pytorch_fashion_inference(model=self.accelerated_model,
-                                                  input_data=input_data,
-                                                  batch_size=batch_size)
+                model = self.accelerated_model
             else:
                 if acceleration is False or self.accelerated_model is None:
-                    self.internal.eval()
-                    yhat = _pytorch_fashion_inference(model=self.internal,
-                                                      input_data=input_data,
-                                                      batch_size=batch_size)
+                    model = self.internal
                 else:
-                    self.accelerated_model.eval()
-                    yhat = _pytorch_fashion_inference(model=self.accelerated_model,
-                                                      input_data=input_data,
-                                                      batch_size=batch_size)
+                    model = self.accelerated_model
+                model.eval()
+            if target is None:
+                yhat, target = _pytorch_fashion_inference(model=model,
+                                                          input_data=input_data,
+                                                          batch_size=batch_size,
+                                                          return_target=True)
+            else:
+                yhat = _pytorch_fashion_inference(model=model,
+                                                  input_data=input_data,
+                                                  batch_size=batch_size)
 
             aggregate = 'mean' if multioutput == 'uniform_average' else None
             return Evaluator.evaluate(self.metrics, target,
@@ -1242,7 +1233,8 @@ class BasePytorchForecaster(Forecaster):
         return Evaluator.evaluate(self.metrics, target, yhat, aggregate=aggregate)
 
     def predict_interval(self, data, validation_data=None, batch_size=32,
-                         repetition_times=5):
+                         repetition_times=5, vectorize=False, num_processes=1,
+                         quantiles=None):
         """
         Calculate confidence interval of data based on Monte Carlo dropout(MC dropout).
         Related paper : https://arxiv.org/abs/1709.01907
@@ -1293,12 +1285,25 @@ class BasePytorchForecaster(Forecaster):
                result but will affect resources cost(e.g. memory and time).
         :param repetition_times: Defines repeate how many times to calculate model
                                  uncertainty based on MC Dropout.
+        :param vectorize: if tile each batch `repetition_times` times so that all the MC
+               Dropout repetitions are computed in one batched forward per batch instead of
+               `repetition_times` full passes over data. Each forward then has
+               batch_size * repetition_times samples. Defaults to False.
+        :param num_processes: the number of processes to compute the (vectorized)
+               repetitions of the batches in parallel, by
+               `bigdl.nano.pytorch.InferenceOptimizer.to_multi_instance`. It implies
+               vectorize=True if larger than 1. Defaults to 1.
+        :param quantiles: an optional list of quantiles in (0, 1), e.g. [0.05, 0.95], which
+               are calculated from the prediction and standard deviation by the normal
+               distribution.
 
         :return: prediction and standard deviation which are both numpy array
-                 with shape (num_samples, horizon, target_dim)
+                 with shape (num_samples, horizon, target_dim). If quantiles is set,
+                 a numpy array with shape (len(quantiles), num_samples, horizon, target_dim)
+                 is returned in addition.
 
         """
-        from bigdl.chronos.pytorch.utils import _pytorch_fashion_inference
+        from bigdl.chronos.pytorch.utils import _pytorch_fashion_inference, _MCDropoutModel
 
         if self.distributed:
             invalidInputError(False,
@@ -1309,6 +1314,11 @@ class BasePytorchForecaster(Forecaster):
         if not self.fitted:
             invalidInputError(False,
                               "You must call fit or restore first before calling predict_interval!")
+        invalidInputError(isinstance(num_processes, int) and num_processes > 0,
+                          f"num_processes should be a positive int, but found {num_processes}.")
+        if quantiles is not None:
+            invalidInputError(all(0 < q < 1 for q in quantiles),
+                              f"quantiles should be in (0, 1), but found {quantiles}.")
 
         self.thread_num = set_pytorch_thread(self.optimized_model_thread_num, self.thread_num)
 
@@ -1330,15 +1340,17 @@ class BasePytorchForecaster(Forecaster):
                     shuffle=False,
                 )
 
+            self.internal.eval()
             if isinstance(validation_data, DataLoader):
-                input_data = validation_data
-                target = np.concatenate(tuple(val[1] for val in validation_data), axis=0)
+                val_yhat, target = _pytorch_fashion_inference(model=self.internal,
+                                                              input_data=validation_data,
+                                                              batch_size=batch_size,
+                                                              return_target=True)
             else:
                 input_data, target = validation_data
-            self.internal.eval()
-            val_yhat = _pytorch_fashion_inference(model=self.internal,
-                                                  input_data=input_data,
-                                                  batch_size=batch_size)
+                val_yhat = _pytorch_fashion_inference(model=self.internal,
+                                                      input_data=input_data,
+                                                      batch_size=batch_size)
             self.data_noise = Evaluator.evaluate(["mse"], target,
                                                  val_yhat, aggregate=None)[0]  # 2d array
 
@@ -1361,20 +1373,51 @@ class BasePytorchForecaster(Forecaster):
         # turn on dropout
         self.internal.apply(apply_dropout)
 
-        y_hat_list = []
-        for i in range(repetition_times):
+        if num_processes > 1:
+            from bigdl.nano.pytorch import InferenceOptimizer
+            if isinstance(data, DataLoader):
+                batches = [batch[0] for batch in data]
+            else:
+                batches = list(torch.from_numpy(data).split(batch_size))
+            mc_model = InferenceOptimizer.to_multi_instance(
+                _MCDropoutModel(self.internal, repetition_times),
+                num_processes=num_processes)
+            try:
+                # in shape (num_samples, repetition_times, horizon, target_dim)
+                y_hats = np.concatenate([yhat.numpy() for yhat in mc_model(batches)], axis=0)
+            finally:
+                for p in mc_model.ps:
+                    p.terminate()
+            rep_axis = 1
+        elif vectorize:
+            y_hats = _pytorch_fashion_inference(model=_MCDropoutModel(self.internal,
+                                                                      repetition_times),
+                                                input_data=data,
+                                                batch_size=batch_size)
+            rep_axis = 1
+        else:
+            # the results of all repetitions are written into one preallocated array
             _yhat = _pytorch_fashion_inference(model=self.internal,
                                                input_data=data,
                                                batch_size=batch_size)
-            y_hat_list.append(_yhat)
-        y_hat_mean = np.mean(np.stack(y_hat_list, axis=0), axis=0)
-
-        model_bias = np.zeros_like(y_hat_mean)  # 3d array
-        for i in range(repetition_times):
-            model_bias += (y_hat_list[i] - y_hat_mean)**2
-        model_bias /= repetition_times
+            y_hats = np.empty((repetition_times,) + _yhat.shape, dtype=_yhat.dtype)
+            y_hats[0] = _yhat
+            for i in range(1, repetition_times):
+                _pytorch_fashion_inference(model=self.internal,
+                                           input_data=data,
+                                           batch_size=batch_size,
+                                           out=y_hats[i])
+            rep_axis = 0
+        y_hat_mean = np.mean(y_hats, axis=rep_axis)
+
+        model_bias = np.var(y_hats, axis=rep_axis)  # 3d array
         std_deviation = np.sqrt(self.data_noise + model_bias)
 
+        if quantiles is not None:
+            from scipy.stats import norm
+            y_hat_quantiles = np.stack([y_hat_mean + norm.ppf(q) * std_deviation
+                                        for q in quantiles], axis=0)
+            return y_hat_mean, std_deviation, y_hat_quantiles
         return y_hat_mean, std_deviation
 
     def save(self, checkpoint_file, quantize_checkpoint_file=None):
@@ -0,0 +1,262 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+# request latencies kept to calculate the percentiles in get_stats
+_LATENCY_WINDOW = 10000
+
+
+class _Request:
+    __slots__ = ("x", "future", "squeeze", "submit_time")
+
+    def __init__(self, x, future, squeeze):
+        self.x = x
+        self.future = future
+        self.squeeze = squeeze
+        self.submit_time = time.perf_counter()
+
+
+class BatchingPredictor:
+    """
+        Example:
+            >>> # forecaster has been fitted, and optionally built with
+            >>> # build_onnx/build_openvino/build_jit
+            >>> with BatchingPredictor(forecaster, max_batch_size=64,
+            >>>                        max_latency=0.005) as predictor:
+            >>>     futures = [predictor.submit(x) for x in windows]
+            >>>     results = [f.result() for f in futures]
+            >>>     stats = predictor.get_stats()
+    """
+
+    def __init__(self,
+                 forecaster,
+                 max_batch_size=64,
+                 max_latency=0.005,
+                 num_workers=1,
+                 predict_method="predict",
+                 **predict_kwargs):
+        """
+        Build an in-process predictor which coalesces the concurrent small requests into
+        batches and predicts each batch with one call, so that the framework overhead is
+        paid once per batch instead of once per request.
+
+        A dispatcher thread takes the requests from a queue in their arrival order, a batch
+        is sent to the worker thread pool once it reaches max_batch_size samples or its
+        first request has waited for max_latency seconds.
+
+        :param forecaster: a fitted forecaster, or a model which can be called on a pytorch
+               tensor in shape (batch_size, lookback, feature_dim), e.g. the
+               `accelerated_model` of a forecaster after build_onnx/build_openvino/build_jit.
+        :param max_batch_size: the max number of samples in a batch.
+        :param max_latency: the max time (in seconds) a request waits for other requests
+               to form a batch.
+        :param num_workers: the number of threads to run the batches.
+        :param predict_method: the method of the forecaster to predict a batch, e.g.
+               "predict", "predict_with_onnx", "predict_with_openvino" or "predict_with_jit".
+               Only effective when a forecaster is used.
+        :param predict_kwargs: other parameters of predict_method, e.g. quantize=True.
+        """
+        from bigdl.nano.utils.common import invalidInputError
+        invalidInputError(isinstance(max_batch_size, int) and max_batch_size > 0,
+                          f"max_batch_size should be a positive int, but found {max_batch_size}.")
+        invalidInputError(max_latency >= 0,
+                          f"max_latency should not be negative, but found {max_latency}.")
+        invalidInputError(isinstance(num_workers, int) and num_workers > 0,
+                          f"num_workers should be a positive int, but found {num_workers}.")
+        if hasattr(forecaster, predict_method):
+            predict_fn = getattr(forecaster, predict_method)
+            # the batch is coalesced already, predict it at once
+            self._predict_fn = lambda x: predict_fn(x, batch_size=len(x), **predict_kwargs)
+        else:
+            invalidInputError(callable(forecaster),
+                              f"forecaster should have method {predict_method} or be a "
+                              f"callable model, but found {type(forecaster)}.")
+            from bigdl.chronos.pytorch.utils import _pytorch_fashion_inference
+            self._predict_fn = lambda x: _pytorch_fashion_inference(model=forecaster,
+                                                                    input_data=x)
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.num_workers = num_workers
+
+        self._queue = queue.Queue()
+        # one batch for each idle worker, the requests keep queuing (and so form larger
+        # batches) while all the workers are busy
+        self._idle_workers = threading.Semaphore(num_workers)
+        self._pool = ThreadPoolExecutor(max_workers=num_workers)
+        self._pending = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._start_time = time.perf_counter()
+        self._num_requests = 0
+        self._num_samples = 0
+        self._num_batches = 0
+        self._num_failed_batches = 0
+        self._latencies = deque(maxlen=_LATENCY_WINDOW)
+        self._batch_times = deque(maxlen=_LATENCY_WINDOW)
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, x):
+        """
+        Submit a request.
+
+        :param x: a numpy ndarray in shape (num_samples, lookback, feature_dim), or
+               (lookback, feature_dim) for a single window.
+
+        :return: a concurrent.futures.Future, whose result is a numpy ndarray in shape
+                 (num_samples, horizon, target_dim), or (horizon, target_dim) for a
+                 single window.
+        """
+        from bigdl.nano.utils.common import invalidInputError
+        x = np.asarray(x)
+        invalidInputError(x.ndim in (2, 3),
+                          f"x should be a 2-dim or 3-dim ndarray, but found {x.ndim} dims.")
+        squeeze = x.ndim == 2
+        future = Future()
+        # under the lock of shutdown, so that no request is queued after the stop signal
+        with self._lock:
+            invalidInputError(not self._closed, "the predictor has been shut down.")
+            self._queue.put(_Request(x[np.newaxis] if squeeze else x, future, squeeze))
+        return future
+
+    def predict(self, x, timeout=None):
+        """
+        Submit a request and wait for its result.
+
+        :param x: the same as `submit`.
+        :param timeout: the max time (in seconds) to wait, None to wait until done.
+
+        :return: the prediction result of x.
+        """
+        return self.submit(x).result(timeout=timeout)
+
+    def get_stats(self):
+        """
+        Get the statistics of the requests served so far.
+
+        :return: a dict of the number of requests/samples/batches, the average batch size,
+                 throughput (samples per second since the predictor is built) and the
+                 p50/p90/p99 latency (in seconds, from submit to result) of the latest
+                 requests.
+        """
+        with self._lock:
+            latencies = np.array(self._latencies)
+            batch_times = np.array(self._batch_times)
+            stats = {"num_requests": self._num_requests,
+                     "num_samples": self._num_samples,
+                     "num_batches": self._num_batches,
+                     "num_failed_batches": self._num_failed_batches}
+        elapsed = time.perf_counter() - self._start_time
+        stats["avg_batch_size"] = stats["num_samples"] / max(stats["num_batches"], 1)
+        stats["throughput"] = stats["num_samples"] / elapsed
+        for p in (50, 90, 99):
+            stats[f"latency_p{p}"] = float(np.percentile(latencies, p)) \
+                if len(latencies) else None
+        stats["avg_batch_time"] = float(batch_times.mean()) if len(batch_times) else None
+        return stats
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting requests. The requests submitted before are still served.
+
+        :param wait: whether to wait until all the requests are served.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        if wait:
+            # the dispatcher shuts the pool down after the last batch is submitted
+            self._dispatcher.join()
+            self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown(wait=True)
+
+    def _next_request(self, timeout=None):
+        if self._pending is not None:
+            request, self._pending = self._pending, None
+            return request
+        return self._queue.get(timeout=timeout)
+
+    def _dispatch(self):
+        while True:
+            self._idle_workers.acquire()
+            request = self._next_request()
+            if request is None:
+                break
+            batch, batch_size = [request], len(request.x)
+            deadline = request.submit_time + self.max_latency
+            stop = False
+            while batch_size < self.max_batch_size:
+                timeout = max(deadline - time.perf_counter(), 0)
+                try:
+                    request = self._next_request(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                if batch_size + len(request.x) > self.max_batch_size:
+                    # keep it for the next batch
+                    self._pending = request
+                    break
+                batch.append(request)
+                batch_size += len(request.x)
+            self._pool.submit(self._run_batch, batch)
+            if stop:
+                self._queue.put(None)
+        # all the requests are submitted, the running batches still finish
+        self._pool.shutdown(wait=False)
+
+    def _run_batch(self, batch):
+        try:
+            start = time.perf_counter()
+            try:
+                x = np.concatenate([request.x for request in batch], axis=0) \
+                    if len(batch) > 1 else batch[0].x
+                yhat = self._predict_fn(x)
+            except Exception as e:
+                with self._lock:
+                    self._num_failed_batches += 1
+                for request in batch:
+                    request.future.set_exception(e)
+                return
+            end = time.perf_counter()
+            offset = 0
+            for request in batch:
+                result = yhat[offset:offset + len(request.x)]
+                offset += len(request.x)
+                request.future.set_result(result[0] if request.squeeze else result)
+            with self._lock:
+                self._num_requests += len(batch)
+                self._num_samples += offset
+                self._num_batches += 1
+                self._batch_times.append(end - start)
+                self._latencies.extend(end - request.submit_time for request in batch)
+        finally:
+            self._idle_workers.release()
@@ -0,0 +1,309 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import sys
+import uuid
+import queue
+import pickle
+import shutil
+import hashlib
+import traceback
+import multiprocessing as mp
+from tempfile import TemporaryDirectory
+
+_CKPT_FILE = "forecaster.ckpt"
+# written last, it marks the checkpoint of an id as complete
+_RESULT_FILE = "result.pkl"
+# the environment variables of schedule_processors applied to each worker
+_WORKER_ENV_KEYS = ("KMP_AFFINITY", "OMP_NUM_THREADS", "PROCESS_IDX")
+
+
+def _get_ckpt_path(checkpoint_dir, id):
+    key = hashlib.sha1(repr(id).encode()).hexdigest()
+    return os.path.join(checkpoint_dir, key)
+
+
+def _is_done(checkpoint_dir, id):
+    return os.path.exists(os.path.join(_get_ckpt_path(checkpoint_dir, id), _RESULT_FILE))
+
+
+def _default_fit(forecaster, df, dt_col, target_col, id_col, feature_col, val_ratio,
+                 **fit_kwargs):
+    from bigdl.nano.utils.common import invalidInputError
+    from bigdl.chronos.forecaster import arima_available, prophet_available, torch_available
+    val_len = int(len(df) * val_ratio)
+    if arima_available:
+        from bigdl.chronos.forecaster.arima_forecaster import ARIMAForecaster
+        if isinstance(forecaster, ARIMAForecaster):
+            invalidInputError(val_len > 0,
+                              "ARIMAForecaster needs validation data, please set a larger "
+                              "val_ratio.")
+            data = df[target_col[0]].values
+            return forecaster.fit(data[:-val_len], data[-val_len:], **fit_kwargs)
+    if prophet_available:
+        from bigdl.chronos.forecaster.prophet_forecaster import ProphetForecaster
+        if isinstance(forecaster, ProphetForecaster):
+            data = df[[dt_col, target_col[0]]].rename(columns={dt_col: "ds",
+                                                               target_col[0]: "y"})
+            if val_len > 0:
+                return forecaster.fit(data[:-val_len], data[-val_len:], **fit_kwargs)
+            return forecaster.fit(data, **fit_kwargs)
+    if torch_available:
+        from bigdl.chronos.forecaster.base_forecaster import BasePytorchForecaster
+        if isinstance(forecaster, BasePytorchForecaster):
+            from bigdl.chronos.data import TSDataset
+            if val_len > 0:
+                train, val, _ = TSDataset.from_pandas(df, dt_col=dt_col,
+                                                      target_col=target_col,
+                                                      id_col=id_col,
+                                                      extra_feature_col=feature_col,
+                                                      with_split=True,
+                                                      val_ratio=val_ratio,
+                                                      test_ratio=0)
+                return forecaster.fit(train, validation_data=val, **fit_kwargs)
+            train = TSDataset.from_pandas(df, dt_col=dt_col, target_col=target_col,
+                                          id_col=id_col, extra_feature_col=feature_col)
+            return forecaster.fit(train, **fit_kwargs)
+    invalidInputError(False,
+                      f"No default way to fit {type(forecaster)}, please set fit_fn.")
+
+
+def _load_forecaster(forecaster, ckpt_file):
+    # ARIMAForecaster and ProphetForecaster are restored, pytorch forecasters are loaded
+    if hasattr(forecaster, "load"):
+        forecaster.load(ckpt_file)
+    else:
+        forecaster.restore(ckpt_file)
+    return forecaster
+
+
+def _fit_one(id, df, forecaster_fn, fit_fn, checkpoint_dir):
+    forecaster = forecaster_fn(id)
+    result = fit_fn(forecaster, df)
+    try:
+        result = pickle.dumps(result)
+    except Exception:
+        # e.g. a result holding a lock, only the model is kept
+        result = pickle.dumps(None)
+    path = _get_ckpt_path(checkpoint_dir, id)
+    # the files are written into a temporary directory and then renamed, so that a
+    # crashed job never leaves a partial checkpoint
+    tmp_path = f"{path}.tmp-{os.getpid()}-{uuid.uuid4().hex}"
+    os.makedirs(tmp_path)
+    try:
+        forecaster.save(os.path.join(tmp_path, _CKPT_FILE))
+        with open(os.path.join(tmp_path, _RESULT_FILE), "wb") as f:
+            f.write(result)
+        if os.path.exists(path):
+            # an incomplete checkpoint of a crashed job
+            shutil.rmtree(path)
+        os.rename(tmp_path, path)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def _fit_worker(task_queue, result_queue, env, forecaster_fn, fit_fn, checkpoint_dir):
+    os.environ.update({key: env[key] for key in _WORKER_ENV_KEYS if key in env})
+    if "torch" in sys.modules:
+        # torch has been imported by the parent process before fork
+        sys.modules["torch"].set_num_threads(int(env["OMP_NUM_THREADS"]))
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+        id, df = task
+        try:
+            _fit_one(id, df, forecaster_fn, fit_fn, checkpoint_dir)
+            result_queue.put((id, None))
+        except Exception:
+            result_queue.put((id, traceback.format_exc()))
+
+
+def _read_result(forecaster_fn, checkpoint_dir, id):
+    path = _get_ckpt_path(checkpoint_dir, id)
+    forecaster = _load_forecaster(forecaster_fn(id), os.path.join(path, _CKPT_FILE))
+    with open(os.path.join(path, _RESULT_FILE), "rb") as f:
+        result = pickle.load(f)
+    return id, forecaster, result
+
+
+def _start_workers(num_processes, cores_per_process, task_queue, result_queue,
+                   forecaster_fn, fit_fn, checkpoint_dir):
+    from bigdl.nano.utils.common import schedule_processors
+    envs = schedule_processors(num_processes, cores_per_process)
+    old_env = {key: os.environ.get(key) for key in _WORKER_ENV_KEYS}
+    workers = []
+    try:
+        for env in envs:
+            # set before start, so that the OpenMP runtime of a spawned worker is bound
+            os.environ.update({key: env[key] for key in _WORKER_ENV_KEYS})
+            p = mp.Process(target=_fit_worker,
+                           args=(task_queue, result_queue, env, forecaster_fn, fit_fn,
+                                 checkpoint_dir),
+                           daemon=True)
+            p.start()
+            workers.append(p)
+    finally:
+        for key, value in old_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    return workers
+
+
+def fit_many_iter(tsdataset,
+                  forecaster_fn,
+                  fit_fn=None,
+                  num_processes=1,
+                  cores_per_process=None,
+                  checkpoint_dir=None,
+                  val_ratio=0.1,
+                  **fit_kwargs):
+    '''
+    Fit one forecaster for each id of a TSDataset in a process pool, and yield the fitted
+    forecasters as soon as they are done.
+
+    Each fitted forecaster is saved to checkpoint_dir by its `save` method and loaded
+    back in the main process. The ids which have been fitted in checkpoint_dir by a
+    previous (maybe crashed) call are not fitted again, so a job resumes where it stopped
+    by calling with the same checkpoint_dir.
+
+    :param tsdataset: a TSDataset, one forecaster is fitted on the records of each id.
+    :param forecaster_fn: a function which takes an id and returns a new forecaster,
+           e.g. `lambda id: ARIMAForecaster(p=2, q=2)`. The forecaster should support
+           `save` and `load` (or `restore`).
+    :param fit_fn: an optional function which takes a forecaster and the dataframe of an id,
+           fits the forecaster and returns the fit result. By default, the last val_ratio
+           of the records are used as validation data, and
+           ARIMAForecaster is fitted on the first target_col,
+           ProphetForecaster is fitted on dt_col and the first target_col,
+           the pytorch forecasters are fitted on a TSDataset of the records.
+    :param num_processes: the number of worker processes. The cores are assigned to the
+           workers by `bigdl.nano.utils.common.schedule_processors`. 1 to fit in the
+           current process. Defaults to 1.
+    :param cores_per_process: the number of cores of each worker process, None to divide
+           all the cores evenly.
+    :param checkpoint_dir: the directory to save the fitted forecasters. Defaults to None,
+           which means a temporary directory is used and the job could not be resumed.
+    :param val_ratio: the ratio of validation data used by the default fit_fn.
+    :param fit_kwargs: other parameters of `fit` used by the default fit_fn, e.g. epochs.
+
+    :return: a generator of (id, forecaster, fit result), in the order they are done.
+    '''
+    from bigdl.nano.utils.common import invalidInputError, invalidOperationError
+    invalidInputError(isinstance(num_processes, int) and num_processes > 0,
+                      f"num_processes should be a positive int, but found {num_processes}.")
+    if fit_fn is None:
+        def fit_fn(forecaster, df):
+            return _default_fit(forecaster, df,
+                                dt_col=tsdataset.dt_col,
+                                target_col=tsdataset.target_col,
+                                id_col=tsdataset.id_col,
+                                feature_col=tsdataset.feature_col,
+                                val_ratio=val_ratio,
+                                **fit_kwargs)
+
+    with TemporaryDirectory() as tmp_dir:
+        checkpoint_dir = tmp_dir if checkpoint_dir is None else checkpoint_dir
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+        groups = tsdataset.df.groupby(tsdataset.id_col, sort=False)
+        todo = []
+        for id, df in groups:
+            if _is_done(checkpoint_dir, id):
+                yield _read_result(forecaster_fn, checkpoint_dir, id)
+            else:
+                todo.append((id, df))
+        # the longest series first, to balance the load of the workers
+        todo.sort(key=lambda task: len(task[1]), reverse=True)
+
+        failed = {}
+        if num_processes == 1:
+            for id, df in todo:
+                try:
+                    _fit_one(id, df, forecaster_fn, fit_fn, checkpoint_dir)
+                except Exception:
+                    failed[id] = traceback.format_exc()
+                    continue
+                yield _read_result(forecaster_fn, checkpoint_dir, id)
+        elif todo:
+            task_queue, result_queue = mp.Queue(), mp.Queue()
+            for task in todo:
+                task_queue.put(task)
+            num_processes = min(num_processes, len(todo))
+            for _ in range(num_processes):
+                task_queue.put(None)
+            workers = _start_workers(num_processes, cores_per_process, task_queue,
+                                     result_queue, forecaster_fn, fit_fn, checkpoint_dir)
+            try:
+                for _ in range(len(todo)):
+                    while True:
+                        try:
+                            id, error = result_queue.get(timeout=1)
+                            break
+                        except queue.Empty:
+                            dead = [p.exitcode for p in workers
+                                    if not p.is_alive() and p.exitcode != 0]
+                            invalidOperationError(len(dead) == 0,
+                                                  f"A worker process exits unexpectedly with "
+                                                  f"code {dead}, the fitted forecasters are "
+                                                  f"kept in checkpoint_dir, please call "
+                                                  f"again with the same checkpoint_dir "
+                                                  f"to resume.")
+                    if error is None:
+                        yield _read_result(forecaster_fn, checkpoint_dir, id)
+                    else:
+                        failed[id] = error
+            finally:
+                for p in workers:
+                    if p.is_alive():
+                        p.terminate()
+        invalidOperationError(len(failed) == 0,
+                              f"Failed to fit the forecasters of ids {list(failed)}, the "
+                              f"fitted forecasters are kept in checkpoint_dir, please call "
+                              f"again with the same checkpoint_dir to resume. The first "
+                              f"error:\n{next(iter(failed.values()), '')}")
+
+
+def fit_many(tsdataset,
+             forecaster_fn,
+             fit_fn=None,
+             num_processes=1,
+             cores_per_process=None,
+             checkpoint_dir=None,
+             val_ratio=0.1,
+             **fit_kwargs):
+    '''
+    Fit one forecaster for each id of a TSDataset in a process pool, please refer to
+    `fit_many_iter` for the parameters.
+
+    >>> forecasters = fit_many(tsdata, lambda id: ARIMAForecaster(p=2, q=2),
+    >>>                        num_processes=4, checkpoint_dir="./arima_ckpt")
+    >>> pred = forecasters["00"].predict(horizon=24)
+
+    :return: a dict of id to the fitted forecaster.
+    '''
+    return {id: forecaster
+            for id, forecaster, _ in fit_many_iter(tsdataset,
+                                                   forecaster_fn,
+                                                   fit_fn=fit_fn,
+                                                   num_processes=num_processes,
+                                                   cores_per_process=cores_per_process,
+                                                   checkpoint_dir=checkpoint_dir,
+                                                   val_ratio=val_ratio,
+                                                   **fit_kwargs)}
@@ -136,6 +136,17 @@ class DeepGLO(object):
         l2 = cr2(Xn, Xf) / torch.mean(Xf ** 2)
         return (1 - alpha) * l1 + alpha * l2
 
+    def solve_newX_vanilla(self, Fn, Yn, Xf, alpha):
+        # the minimizer of calculate_newX_loss_vanilla in closed form, which is a ridge
+        # regression of Yn on Fn towards Xf:
+        # (a * Fn^T Fn + b * I) Xn = a * Fn^T Yn + b * Xf
+        Fn, Yn, Xf = Fn.double(), Yn.double(), Xf.double()
+        a = (1 - alpha) / (torch.mean(Yn ** 2) * Yn.numel())
+        b = alpha / (torch.mean(Xf ** 2) * Xf.numel())
+        lhs = a * torch.mm(Fn.t(), Fn) + b * torch.eye(Fn.size(1), dtype=Fn.dtype)
+        rhs = a * torch.mm(Fn.t(), Yn) + b * Xf
+        return torch.linalg.lstsq(lhs, rhs).solution.float()
+
     def recover_future_X(
         self,
         last_step,
@@ -144,6 +155,7 @@ class DeepGLO(object):
         alpha=0.5,
         vanilla=True,
         tol=1e-7,
+        exact=False,
     ):
         rg = max(
             1 + 2 * (self.kernel_size - 1) * 2 ** (len(self.num_channels_X) - 1),
@@ -159,6 +171,9 @@ class DeepGLO(object):
 
         Fn = self.F
 
+        if exact:
+            return self.solve_newX_vanilla(Fn.detach(), Yn, Xf.detach(), alpha)
+
         Xt = torch.zeros(self.rank, future).float()
         Xn = torch.normal(Xt, 0.1)
 
@@ -258,13 +273,12 @@ class DeepGLO(object):
         n = inp.size(0)
         ids = np.arange(0, n, bsize)
         ids = list(ids) + [n]
-        out = self.predict_future_batch(model, inp[ids[0]: ids[1], :, :], future)
-
-        for i in range(1, len(ids) - 1):
-            temp = self.predict_future_batch(
+        # the output rows of all batches are written into one preallocated array
+        out = np.empty((n, inp.size(2) + future), dtype=np.float32)
+        for i in range(len(ids) - 1):
+            out[ids[i]: ids[i + 1]] = self.predict_future_batch(
                 model, inp[ids[i]: ids[i + 1], :, :], future
             )
-            out = np.vstack([out, temp])
 
         out = torch.from_numpy(out).float()
         return self.tensor2d_to_temporal(out)
@@ -644,12 +658,13 @@ class DeepGLO(object):
         n, T = self.Ymat.shape
         rank, XT = self.X.shape
         future = T - XT
+        # only the factors of the new time steps are solved, in closed form
         Xn = self.recover_future_X(
             last_step=XT,
             future=future,
-            num_epochs=100000,
             alpha=0.3,
             vanilla=True,
+            exact=True,
         )
         self.X = torch.cat([self.X, Xn], dim=1)
 
@@ -62,6 +62,20 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def _has_ray_context():
+    try:
+        from bigdl.orca.ray import OrcaRayContext
+        OrcaRayContext.get(initialize=False)
+        return True
+    except Exception:
+        pass
+    try:
+        import ray
+        return ray.is_initialized()
+    except ImportError:
+        return False
+
+
 class Chomp1d(nn.Module):
     def __init__(self, chomp_size):
         super(Chomp1d, self).__init__()
@@ -549,16 +563,22 @@ class LocalModel(object):
         return y
 
     @staticmethod
-    def _predict_future(data, ycovs, covariates, model, future, I):
-        out = None
-        for i in range(len(I) - 1):
-            bdata = data[range(I[i], I[i + 1]), :]
-            batch_ycovs = ycovs[range(I[i], I[i + 1]), :, :] \
-                if ycovs is not None else None
-            cur_out = LocalModel.predict_future_batch(
-                bdata, covariates, batch_ycovs, future, model,
-            )
-            out = np.vstack([out, cur_out]) if out is not None else cur_out
+    def _predict_future(data, ycovs, covariates, model, future, I, out=None):
+        # the results of rows I[0]: I[-1] are written into out (rows I[0]: I[-1] as well)
+        # if it is given, otherwise into a new array with rows 0: I[-1] - I[0]
+        if out is None:
+            out = np.empty((I[-1] - I[0], data.shape[1] + future), dtype=np.float32)
+            offset = I[0]
+        else:
+            offset = 0
+        with torch.no_grad():
+            for i in range(len(I) - 1):
+                bdata = data[I[i]: I[i + 1], :]
+                batch_ycovs = ycovs[I[i]: I[i + 1], :, :] \
+                    if ycovs is not None else None
+                out[I[i] - offset: I[i + 1] - offset] = LocalModel.predict_future_batch(
+                    bdata, covariates, batch_ycovs, future, model,
+                )
         return out
 
     def predict_future(
@@ -579,7 +599,8 @@ class LocalModel(object):
         bsize: batch size for processing (determine according to gopu memory limits)
         normalize: should be set according to the normalization used in the class initialization
         num_workers: number of workers to run prediction. if num_workers > 1, then prediction will
-        run in distributed mode and there has to be an activate OrcaRayContext.
+        run in distributed mode if there is an activate OrcaRayContext or ray, otherwise in a
+        local thread pool.
         """
         with torch.no_grad():
             if normalize:
@@ -595,14 +616,26 @@ class LocalModel(object):
             I.append(n)
 
             model = self.seq
+            # the output rows of all batches are written into one preallocated array
+            out = np.empty((n, T + future), dtype=np.float32)
             if num_workers > 1:
-                import ray
                 import math
 
                 batch_num_per_worker = math.ceil(len(I) / num_workers)
                 indexes = [I[i:i + batch_num_per_worker + 1] for i in
                            range(0, len(I) - 1, batch_num_per_worker)]
                 logger.info(f"actual number of workers used in prediction is {len(indexes)}")
+            if num_workers > 1 and not _has_ray_context():
+                from concurrent.futures import ThreadPoolExecutor
+
+                # torch releases GIL in the forward, the batches of each worker are written
+                # into disjoint rows of out
+                with ThreadPoolExecutor(max_workers=len(indexes)) as pool:
+                    list(pool.map(lambda index: LocalModel._predict_future(
+                        data, ycovs, covariates, model, future, index, out=out), indexes))
+            elif num_workers > 1:
+                import ray
+
                 data_id = ray.put(data)
                 covariates_id = ray.put(covariates)
                 ycovs_id = ray.put(ycovs)
@@ -620,11 +653,11 @@ class LocalModel(object):
                 remote_out = ray.get([predict_future_worker
                                      .remote(index)
                                       for index in indexes])
-
-                out = np.concatenate(remote_out, axis=0)
+                for index, worker_out in zip(indexes, remote_out):
+                    out[index[0]: index[-1]] = worker_out
 
             else:
-                out = LocalModel._predict_future(data, ycovs, covariates, model, future, I)
+                LocalModel._predict_future(data, ycovs, covariates, model, future, I, out=out)
 
             if normalize:
                 temp = (out - self.mini) * self.s[:, None] + self.m[:, None]
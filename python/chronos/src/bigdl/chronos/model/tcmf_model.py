@@ -141,8 +141,9 @@ class TCMF(BaseModel):
         :param mc:
         :param future_covariates: covariates corresponding to future horizon steps data to predict.
         :param future_dti: dti corresponding to future horizon steps data to predict.
-        :param num_workers: the number of workers to use. Note that there has to be an activate
-               OrcaRayContext if num_workers > 1.
+        :param num_workers: the number of workers to use. If num_workers > 1, the prediction
+               runs on ray if there is an activate OrcaRayContext or ray, otherwise in a local
+               thread pool.
         :return:
         """
         from bigdl.nano.utils.common import invalidInputError
@@ -156,21 +157,6 @@ class TCMF(BaseModel):
                                    method_name="predict")
         if num_workers is None:
             num_workers = TCMF.get_default_num_workers()
-        if num_workers > 1:
-            import ray
-            from bigdl.orca.ray import OrcaRayContext
-            try:
-                OrcaRayContext.get(initialize=False)
-            except:
-                try:
-                    # detect whether ray has been started.
-                    ray.put(None)
-                except:
-                    invalidInputError(False,
-                                      f"There must be an activate ray context while running with "
-                                      f"{num_workers} workers. You can either start and init a "
-                                      f"RayContext by init_orca_context(..., init_ray_on_spark="
-                                      f"True) or start Ray with ray.init()")
 
         out = self.model.predict_horizon(
             future=horizon,
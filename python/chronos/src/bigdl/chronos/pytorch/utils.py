@@ -13,49 +13,160 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-import math
+import os
 import torch
 import numpy as np
 from torch.utils.data.dataloader import DataLoader
 
 
-def _inference(model, input_sample_list, batch_size):
-    if batch_size is None:
-        # this branch is only to speed up the inferencing when batch_size is set to None.
-        return model(*input_sample_list).numpy()
+def _split_batch(input_sample_list, batch_size):
+    sample_num = input_sample_list[0].shape[0]  # the first dim should be sample_num
+    if batch_size is None or sample_num <= batch_size:
+        yield input_sample_list
     else:
-        yhat_list = []
-        sample_num = input_sample_list[0].shape[0]  # the first dim should be sample_num
-        if sample_num <= batch_size:
-            return model(*input_sample_list).numpy()
-        else:
-            batch_num = math.ceil(sample_num / batch_size)
-            for batch_id in range(batch_num):
-                yhat_list.append(model(
-                    *tuple(map(lambda x: x[batch_id * batch_size: (batch_id + 1) * batch_size],
-                               input_sample_list))).numpy())
-            # this operation may cause performance degradation
-            yhat = np.concatenate(yhat_list, axis=0)
-            return yhat
-
-
-def _pytorch_fashion_inference(model, input_data, batch_size=None):
+        for start in range(0, sample_num, batch_size):
+            yield [x[start: start + batch_size] for x in input_sample_list]
+
+
+def _get_sample_num(input_data):
+    # the number of samples, or None if unknown (e.g. an IterableDataset)
+    if isinstance(input_data, list):
+        return input_data[0].shape[0]
+    if isinstance(input_data, DataLoader):
+        try:
+            return len(input_data.dataset)
+        except TypeError:
+            return None
+    return input_data.shape[0]
+
+
+def _pytorch_fashion_inference_iter(model, input_data, batch_size=None):
+    '''
+    Iterate the inference result of any models which can be used like:
+    `model(x)  # x is a pytorch tensor`
+    chunk by chunk, so that a large input (e.g. a dataloader of a TSDataset) is never
+    concatenated into one tensor.
+
+    :param model: The model to inference
+    :param input_data: numpy ndarray, a list of numpy ndarray or a pytorch dataloader
+    :param batch_size: the max batch size of each model call. Each batch of a dataloader
+           is further split if it is larger than batch_size. None to call the model on
+           the whole ndarray input, or on each batch of a dataloader.
+
+    :return: a generator of (yhat, y), yhat is the numpy ndarray result of a chunk, y is
+             the numpy ndarray target of the same chunk if input_data is a dataloader which
+             returns x and y, otherwise None.
+    '''
+    def run(chunk):
+        # not around the yields, which would leave inference mode on in the caller's code
+        with torch.inference_mode():
+            return model(*chunk).numpy()
+
+    if isinstance(input_data, DataLoader):
+        for batch in input_data:
+            if not isinstance(batch, (list, tuple)):
+                batch = (batch,)
+            y = batch[1].numpy() if len(batch) > 1 else None
+            start = 0
+            for chunk in _split_batch([batch[0]], batch_size):
+                yhat = run(chunk)
+                yield yhat, None if y is None else y[start: start + len(yhat)]
+                start += len(yhat)
+    else:
+        input_data = input_data if isinstance(input_data, list) else [input_data]
+        input_sample_list = list(map(lambda x: torch.from_numpy(x), input_data))
+        for chunk in _split_batch(input_sample_list, batch_size):
+            yield run(chunk), None
+
+
+class _ChunkWriter:
+    # write chunks one after another into a preallocated ndarray
+    def __init__(self, sample_num=None, out=None):
+        self.sample_num = sample_num
+        self.data = out
+        self.growable = out is None
+        self.size = 0
+
+    def write(self, chunk):
+        from bigdl.nano.utils.common import invalidInputError
+        end = self.size + len(chunk)
+        if self.data is None:
+            if self.sample_num == len(chunk):
+                # the whole result comes in one chunk, no copy is needed
+                self.data, self.size = chunk, end
+                return
+            capacity = max(self.sample_num or 0, end)
+            self.data = np.empty((capacity,) + chunk.shape[1:], dtype=chunk.dtype)
+        elif end > len(self.data):
+            invalidInputError(self.growable,
+                              f"The output ndarray could only hold {len(self.data)} samples.")
+            # more samples than expected (e.g. a custom sampler), grow the buffer
+            grown = np.empty((max(end, 2 * len(self.data)),) + self.data.shape[1:],
+                             dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:end] = chunk
+        self.size = end
+
+    def result(self):
+        return self.data if self.data is None or self.size == len(self.data) \
+            else self.data[:self.size]
+
+
+def _pytorch_fashion_inference(model, input_data, batch_size=None, out=None,
+                               return_target=False):
     '''
     This is an internal inference pattern for any models which can be used like:
     `model(x)  # x is a pytorch tensor`
 
+    The input is inferenced chunk by chunk and the results are written into one
+    preallocated ndarray, so the input and output are not held in memory twice.
+
     :param model: The model to inference
-    :param input_data: numpy ndarray
+    :param input_data: numpy ndarray, a list of numpy ndarray or a pytorch dataloader
     :param batch_size: batch size
+    :param out: optional preallocated numpy ndarray with the shape and dtype of the result,
+           which the result is written into.
+    :param return_target: if return the target (i.e. y) of a dataloader which returns x and y
+           in each iteration as well, the target is collected in the same pass as the
+           inference, so a shuffled dataloader is supported.
+
+    :return: numpy ndarray, or a tuple of numpy ndarray (yhat, y) if return_target is True.
+    '''
+    sample_num = _get_sample_num(input_data)
+    yhat_writer = _ChunkWriter(sample_num, out=out)
+    y_writer = _ChunkWriter(sample_num)
+    for yhat, y in _pytorch_fashion_inference_iter(model, input_data, batch_size):
+        yhat_writer.write(yhat)
+        if return_target:
+            from bigdl.nano.utils.common import invalidInputError
+            invalidInputError(y is not None,
+                              "The dataloader should return x and y in each iteration.")
+            y_writer.write(y)
+    if return_target:
+        return yhat_writer.result(), y_writer.result()
+    return yhat_writer.result()
 
-    :return: numpy ndarray
+
+class _MCDropoutModel(torch.nn.Module):
+    '''
+    Run `model` on the input tiled `repetition_times` times in one forward, so that all
+    the MC dropout samples of a batch are computed by one large batched forward, each
+    tiled copy draws its own dropout masks. The output is in shape
+    (batch_size, repetition_times, ...).
     '''
-    with torch.inference_mode():
-        if isinstance(input_data, list):
-            input_sample_list = list(map(lambda x: torch.from_numpy(x), input_data))
-        elif isinstance(input_data, DataLoader):
-            input_sample_list = [torch.cat(tuple(batch[0] for batch in input_data), dim=0)]
-        else:
-            input_sample_list = [torch.from_numpy(input_data)]
-        yhat = _inference(model, input_sample_list, batch_size=batch_size)
-    return yhat
+    def __init__(self, model, repetition_times):
+        super().__init__()
+        self.model = model
+        self.repetition_times = repetition_times
+        self._pid = os.getpid()
+
+    def forward(self, x):
+        if os.getpid() != self._pid:
+            # the forked processes of multi-instance inference start with the same random
+            # state, reseed them so that they draw different dropout masks
+            torch.seed()
+            self._pid = os.getpid()
+        yhat = self.model(x.repeat(self.repetition_times, *([1] * (x.dim() - 1))))
+        yhat = yhat.reshape(self.repetition_times, x.shape[0], *yhat.shape[1:])
+        return yhat.transpose(0, 1)
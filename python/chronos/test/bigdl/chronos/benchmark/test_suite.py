@@ -0,0 +1,138 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import time
+import tempfile
+import numpy as np
+import pytest
+from unittest import TestCase
+
+from bigdl.chronos.benchmark import BenchmarkSuite, compare_records
+from .. import op_torch, op_diff_set_all
+
+
+class SleepForecaster:
+    # predicts zeros, and takes about 1ms per call
+    def fit(self, data, epochs=1):
+        self.horizon = data[1].shape[1]
+
+    def predict(self, x, batch_size=32, acceleration=True):
+        time.sleep(0.001)
+        return np.zeros((len(x), self.horizon, 1), dtype=np.float32)
+
+
+class TestBenchmarkSuite(TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    @op_torch
+    def test_run_save_load(self):
+        suite = BenchmarkSuite(models=["sleep"],
+                               accelerators=["original", "onnx"],
+                               batch_sizes=[1, 16],
+                               thread_nums=[1],
+                               lookback=24,
+                               horizon=2,
+                               num_running=20,
+                               num_warmup=2,
+                               forecaster_fn=lambda model: SleepForecaster())
+        records = suite.run()
+        assert len(records) == 4
+        original = [r for r in records if r["accelerator"] == "original"]
+        for record in original:
+            assert "error" not in record
+            assert 1 <= record["latency_p50"] <= record["latency_p90"] <= record["latency_p99"]
+            assert record["throughput"] > 0
+        assert original[1]["throughput"] > original[0]["throughput"]
+        # SleepForecaster could not be built with onnx
+        assert all("error" in r for r in records if r["accelerator"] == "onnx")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in ["records.json", "records.csv"]:
+                path = os.path.join(tmp_dir, name)
+                suite.save(path)
+                loaded = BenchmarkSuite.load(path)
+                assert len(loaded) == 4
+                for record, loaded_record in zip(records, loaded):
+                    assert record.keys() == loaded_record.keys()
+                    for k, v in record.items():
+                        if isinstance(v, float):
+                            np.testing.assert_allclose(loaded_record[k], v)
+                        else:
+                            assert loaded_record[k] == v
+                # no regression against itself
+                assert suite.compare(loaded) == []
+            with pytest.raises(RuntimeError):
+                suite.save(os.path.join(tmp_dir, "records.txt"))
+
+    @op_torch
+    def test_run_failed_model(self):
+        def forecaster_fn(model):
+            if model == "bad":
+                raise RuntimeError("unsupported model")
+            return SleepForecaster()
+
+        suite = BenchmarkSuite(models=["bad", "sleep"],
+                               accelerators=["original"],
+                               batch_sizes=[1, 4],
+                               thread_nums=[1],
+                               lookback=24,
+                               horizon=2,
+                               num_running=5,
+                               num_warmup=1,
+                               forecaster_fn=forecaster_fn)
+        records = suite.run()
+        assert len(records) == 4
+        # the failed model is recorded in all its settings, and the others keep running
+        for record in records[:2]:
+            assert record["model"] == "bad"
+            assert record["error"] == "RuntimeError: unsupported model"
+        for record in records[2:]:
+            assert "error" not in record and record["throughput"] > 0
+
+    @op_diff_set_all
+    def test_compare_records(self):
+        setting = {"model": "tcn", "accelerator": "onnx", "batch_size": 1, "thread_num": 1}
+        baseline = [dict(setting, throughput=1000., latency_p50=1., latency_p90=2.,
+                         latency_p99=3., peak_memory=100.),
+                    dict(setting, batch_size=32, throughput=8000., latency_p50=4.)]
+        records = [dict(setting, throughput=850., latency_p50=1.05, latency_p90=2.5,
+                        latency_p99=2., peak_memory=100.),
+                   dict(setting, batch_size=32, error="RuntimeError"),
+                   dict(setting, thread_num=4, throughput=10.)]
+        regressions = compare_records(records, baseline, tolerance=0.1)
+        assert sorted(r["metric"] for r in regressions) == ["error", "latency_p90",
+                                                            "throughput"]
+        throughput = [r for r in regressions if r["metric"] == "throughput"][0]
+        assert throughput["batch_size"] == 1
+        assert throughput["baseline"] == 1000. and throughput["current"] == 850.
+        np.testing.assert_allclose(throughput["ratio"], 0.85)
+        # the setting which ran in the baseline fails now
+        error = [r for r in regressions if r["metric"] == "error"][0]
+        assert error["batch_size"] == 32 and error["current"] == "RuntimeError"
+
+        assert [r["metric"] for r in compare_records(records, baseline,
+                                                     tolerance=0.3)] == ["error"]
+        regressions = compare_records(records, baseline, metrics=["latency_p90"])
+        assert sorted(r["metric"] for r in regressions) == ["error", "latency_p90"]
+        # failing in both is not a regression
+        baseline[1] = dict(setting, batch_size=32, error="RuntimeError")
+        assert compare_records(records, baseline, tolerance=0.3) == []
@@ -0,0 +1,136 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import pytest
+import numpy as np
+import pandas as pd
+
+from unittest import TestCase
+from bigdl.chronos.data import TSDataset, IncrementalTSDataset
+from sklearn.preprocessing import StandardScaler
+from numpy.testing import assert_array_almost_equal
+
+
+def get_multi_id_ts_df(sample_num=60, num_id=3):
+    df = pd.DataFrame({"value": np.random.randn(sample_num * num_id),
+                       "id": np.repeat([f"0{i}" for i in range(num_id)], sample_num),
+                       "extra feature": np.random.randn(sample_num * num_id)})
+    df["datetime"] = np.tile(pd.date_range('1/1/2019', periods=sample_num, freq="H"), num_id)
+    mask = np.random.random_sample((len(df), 2)) < 0.2
+    df.loc[mask[:, 0], "value"] = np.nan
+    df.loc[mask[:, 1], "extra feature"] = np.nan
+    return df
+
+
+def process(df, scaler, fit, id_col="id"):
+    tsdata = TSDataset.from_pandas(df, dt_col="datetime", target_col="value",
+                                   extra_feature_col=["extra feature"], id_col=id_col)
+    tsdata.impute("last")\
+          .gen_dt_feature(features=["HOUR", "DAY"], one_hot_features=["HOUR"])\
+          .scale(scaler, fit=fit)
+    return tsdata
+
+
+def get_last_window(tsdata, ids, lookback):
+    return np.stack([tsdata.df[tsdata.df[tsdata.id_col] == i]
+                     [tsdata.target_col + tsdata.feature_col]
+                     .values[-lookback:].astype(np.float32) for i in ids])
+
+
+class TestIncrementalTSDataset(TestCase):
+
+    def setup_method(self, method):
+        pass
+
+    def teardown_method(self, method):
+        pass
+
+    def test_incremental_tsdataset_append(self):
+        lookback = 8
+        df = get_multi_id_ts_df()
+        history_df = df.groupby("id").head(30)
+        # records of "00" and "01" come in several batches, "02" has no new record
+        new_df = df.drop(history_df.index)
+        new_df = new_df[new_df["id"] != "02"].sort_values("datetime", kind="stable")
+
+        scaler = StandardScaler()
+        tsdata = process(history_df, scaler, fit=True)
+        inc_tsdata = IncrementalTSDataset.from_tsdataset(tsdata, lookback=lookback)
+        assert inc_tsdata.get_id_list() == ["00", "01", "02"]
+        assert_array_almost_equal(inc_tsdata.to_numpy(),
+                                  get_last_window(tsdata, ["00", "01", "02"], lookback))
+
+        for batch in np.array_split(new_df, 7):
+            inc_tsdata.append(batch)
+        full_tsdata = process(pd.concat([history_df, new_df]), scaler, fit=False)
+        x = inc_tsdata.to_numpy()
+        assert x.shape == (3, lookback, len(tsdata.target_col + tsdata.feature_col))
+        assert_array_almost_equal(x, get_last_window(full_tsdata, ["00", "01", "02"], lookback),
+                                  decimal=5)
+
+        pred = x[:, -2:, :1]
+        assert_array_almost_equal(inc_tsdata.unscale_numpy(pred),
+                                  full_tsdata.unscale_numpy(pred))
+
+    def test_incremental_tsdataset_new_id(self):
+        lookback = 4
+        df = get_multi_id_ts_df(num_id=2)
+        history_df = df[df["id"] == "00"]
+        new_df = df[df["id"] == "01"]
+
+        scaler = StandardScaler()
+        tsdata = process(history_df, scaler, fit=True)
+        inc_tsdata = IncrementalTSDataset.from_tsdataset(tsdata, lookback=lookback)
+        # a new id is not exported until it has lookback records
+        inc_tsdata.append(new_df.iloc[:lookback - 1])
+        assert inc_tsdata.get_id_list() == ["00"]
+        assert inc_tsdata.to_numpy().shape[0] == 1
+        inc_tsdata.append(new_df.iloc[lookback - 1:])
+        assert inc_tsdata.get_id_list() == ["00", "01"]
+
+        full_tsdata = process(df, scaler, fit=False)
+        assert_array_almost_equal(inc_tsdata.to_numpy(),
+                                  get_last_window(full_tsdata, ["00", "01"], lookback),
+                                  decimal=5)
+
+    def test_incremental_tsdataset_single_id(self):
+        lookback = 6
+        df = get_multi_id_ts_df(num_id=1).drop(columns=["id"])
+        tsdata = TSDataset.from_pandas(df.iloc[:40], dt_col="datetime", target_col="value",
+                                       extra_feature_col=["extra feature"])
+        tsdata.impute("last")
+        inc_tsdata = IncrementalTSDataset.from_tsdataset(tsdata, lookback=lookback)
+        inc_tsdata.append(df.iloc[40:50]).append(df.iloc[50:])
+
+        full_tsdata = TSDataset.from_pandas(df, dt_col="datetime", target_col="value",
+                                            extra_feature_col=["extra feature"])
+        full_tsdata.impute("last")
+        x = inc_tsdata.to_numpy()
+        assert_array_almost_equal(x, get_last_window(full_tsdata, ["0"], lookback))
+        assert inc_tsdata.unscale_numpy(x) is x
+
+    def test_incremental_tsdataset_error(self):
+        df = get_multi_id_ts_df()
+        tsdata = process(df, StandardScaler(), fit=True)
+        with pytest.raises(RuntimeError):
+            IncrementalTSDataset.from_tsdataset(tsdata, lookback=0)
+        inc_tsdata = IncrementalTSDataset.from_tsdataset(tsdata, lookback=4)
+        with pytest.raises(RuntimeError):
+            inc_tsdata.append(df.drop(columns=["extra feature"]))
+
+        # features aggregated on the whole history could not be updated incrementally
+        tsdata._has_generate_agg_feature = True
+        with pytest.raises(RuntimeError):
+            IncrementalTSDataset.from_tsdataset(tsdata, lookback=4)
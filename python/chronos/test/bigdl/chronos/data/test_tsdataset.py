@@ -411,6 +411,40 @@ class TestTSDataset(TestCase):
         assert np.array_equal(x, np.array([[[1.9, 2.3, 1, 2, 0, 9]]], dtype=np.float32))
         assert np.array_equal(y, np.array([[[2.4, 2.6]]], dtype=np.float32))
 
+    @op_torch
+    def test_tsdataset_roll_cache(self):
+        from sklearn.preprocessing import StandardScaler
+        df = get_multi_id_ts_df()
+        horizon = random.randint(1, 10)
+        lookback = random.randint(1, 20)
+        temp = tempfile.mkdtemp()
+        try:
+            tsdata = TSDataset.from_pandas(df, dt_col="datetime", target_col="value",
+                                           extra_feature_col=["extra feature"], id_col="id")
+            x, y = tsdata.roll(lookback=lookback, horizon=horizon, cache_dir=temp).to_numpy()
+            assert len(os.listdir(os.path.join(temp, "v1"))) == 1
+
+            # same data and parameters, load from cache
+            tsdata = TSDataset.from_pandas(df, dt_col="datetime", target_col="value",
+                                           extra_feature_col=["extra feature"], id_col="id")
+            x_cached, y_cached = tsdata.roll(lookback=lookback, horizon=horizon,
+                                             cache_dir=temp).to_numpy()
+            assert isinstance(x_cached, np.memmap) and isinstance(y_cached, np.memmap)
+            assert len(os.listdir(os.path.join(temp, "v1"))) == 1
+            np.testing.assert_array_equal(x, x_cached)
+            np.testing.assert_array_equal(y, y_cached)
+
+            # different parameters or scaled data, roll again
+            tsdata.roll(lookback=lookback + 1, horizon=horizon, cache_dir=temp)
+            assert len(os.listdir(os.path.join(temp, "v1"))) == 2
+            tsdata.scale(StandardScaler())
+            x_scaled, _ = tsdata.roll(lookback=lookback, horizon=horizon,
+                                      cache_dir=temp).to_numpy()
+            assert len(os.listdir(os.path.join(temp, "v1"))) == 3
+            assert not isinstance(x_scaled, np.memmap)
+        finally:
+            shutil.rmtree(temp)
+
     @op_torch
     def test_tsdata_roll_int_target(self):
         horizon = random.randint(1, 10)
@@ -938,6 +972,42 @@ class TestTSDataset(TestCase):
         assert set(before_sampling) == set(tsdata.df.columns)
         tsdata._check_basic_invariants()
 
+    @op_torch
+    def test_tsdataset_preprocess(self):
+        from sklearn.preprocessing import StandardScaler
+        df = get_ugly_ts_df()
+        df = pd.concat([df, df.iloc[:10]])
+        plans = [["deduplicate"],
+                 [("impute", {"mode": "linear"})],
+                 [("resample", {"interval": "2D", "merge_mode": "sum"})],
+                 ["deduplicate",
+                  ("resample", {"interval": "12H", "start_time": "2018-12-31"}),
+                  ("impute", {"mode": "last"}),
+                  ("scale", {"scaler": StandardScaler()})]]
+        for plan in plans:
+            tsdata = TSDataset.from_pandas(df, dt_col="datetime", target_col=['a', 'b'],
+                                           extra_feature_col=['c', 'd', 'e'], id_col="id")
+            for step in plan:
+                stage, kwargs = (step, {}) if isinstance(step, str) else step
+                getattr(tsdata, stage)(**kwargs)
+            expected = tsdata.to_pandas().reset_index(drop=True)
+
+            tsdata = TSDataset.from_pandas(df, dt_col="datetime", target_col=['a', 'b'],
+                                           extra_feature_col=['c', 'd', 'e'], id_col="id")
+            tsdata.preprocess(plan)
+            assert_frame_equal(tsdata.to_pandas(), expected, check_dtype=False)
+            assert set(tsdata.preprocess_timings) == \
+                {"load", "build"} | set(step if isinstance(step, str) else step[0]
+                                        for step in plan)
+            tsdata._check_basic_invariants()
+        assert tsdata._freq == pd.Timedelta("12H")
+        assert tsdata.scaled_col == ['a', 'b', 'c', 'd', 'e']
+
+        with pytest.raises(RuntimeError):
+            tsdata.preprocess(["dummy"])
+        with pytest.raises(RuntimeError):
+            tsdata.preprocess([("scale", {"scaler": StandardScaler(), "fit": False})])
+
     @op_torch
     def test_tsdataset_resample_multiple(self):
         df = get_multi_id_ts_df()
@@ -1203,6 +1273,22 @@ class TestTSDataset(TestCase):
         # not meaningful, but no error should be raised.
         tsdata.get_cycle_length(aggregate='min', top_k=3)
 
+    @op_torch
+    @op_diff_set_all
+    def test_cycle_length_est_sample_id(self):
+        sample_num, num_id = 100, 10
+        df = pd.DataFrame({"datetime": np.tile(pd.date_range('1/1/2019', periods=sample_num),
+                                               num_id),
+                           "value": np.tile(np.sin(np.array((0, 30, 45, 60, 90) * 20)
+                                                   * np.pi / 180), num_id),
+                           "id": np.repeat(np.arange(num_id), sample_num)})
+        tsdata = TSDataset.from_pandas(df, target_col='value', dt_col='datetime', id_col='id')
+        assert tsdata.get_cycle_length(aggregate='max', top_k=4) == 5
+        assert tsdata.get_cycle_length(aggregate='max', top_k=4,
+                                       sample_id_num=3, seed=0, n_jobs=2) == 5
+        with pytest.raises(RuntimeError):
+            tsdata.get_cycle_length(sample_id_num=0)
+
     @op_torch
     def test_lookback_equal_to_one(self):
         df = get_ts_df()
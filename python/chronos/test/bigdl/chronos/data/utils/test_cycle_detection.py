@@ -19,7 +19,7 @@ import pandas as pd
 import numpy as np
 
 from unittest import TestCase
-from bigdl.chronos.data.utils.cycle_detection import cycle_length_est
+from bigdl.chronos.data.utils.cycle_detection import cycle_length_est, cycle_length_est_batch
 
 from ... import op_torch, op_tf2, op_diff_set_all
 
@@ -37,3 +37,18 @@ class TestCycleDetectionTimeSeries(TestCase):
         data = np.random.randn(100)
         cycle_length = cycle_length_est(data)
         assert 1 <= cycle_length <= 100
+
+    @op_torch
+    @op_tf2
+    @op_diff_set_all
+    def test_cycle_detection_batch(self):
+        data = np.random.randn(50, 100) + \
+            np.sin(np.arange(100) * 2 * np.pi / np.random.randint(3, 10, size=(50, 1)))
+        for adjust in [False, True]:
+            cycle_lengths = cycle_length_est_batch(data, top_k=4, adjust=adjust, workers=2)
+            assert cycle_lengths.shape == (50,)
+            np.testing.assert_array_equal(cycle_lengths,
+                                          [cycle_length_est(series, top_k=4, adjust=adjust)
+                                           for series in data])
+        with pytest.raises(RuntimeError):
+            cycle_length_est_batch(data, top_k=50)
@@ -20,7 +20,8 @@ import numpy as np
 import random
 
 from unittest import TestCase
-from bigdl.chronos.data.utils.roll import roll_timeseries_dataframe
+from bigdl.chronos.data.utils.roll import roll_timeseries_dataframe, \
+    roll_timeseries_ndarray_by_id
 from ... import op_torch, op_tf2
 
 
@@ -92,3 +93,79 @@ class TestRollTimeSeries(TestCase):
                                          target_col=["B", "C"])
         assert x.shape == (6, 2, 3)
         assert y.shape == (6, 2, 2)
+
+    def test_roll_timeseries_dataframe_value(self):
+        x, y = roll_timeseries_dataframe(self.easy_data,
+                                         None,
+                                         lookback=3,
+                                         horizon=2,
+                                         feature_col=["C"],
+                                         target_col=["A"])
+        a = self.easy_data["A"].values.astype(np.float32)
+        c = self.easy_data["C"].values.astype(np.float32)
+        for i in range(x.shape[0]):
+            np.testing.assert_array_equal(x[i, :, 0], a[i:i+3])
+            np.testing.assert_array_equal(x[i, :, 1], c[i:i+3])
+            np.testing.assert_array_equal(y[i, :, 0], a[i+3:i+5])
+
+        x, y = roll_timeseries_dataframe(self.easy_data,
+                                         None,
+                                         lookback=3,
+                                         horizon=[1, 3],
+                                         feature_col=[],
+                                         target_col=["A"])
+        for i in range(x.shape[0]):
+            np.testing.assert_array_equal(y[i, :, 0], a[[i+3, i+5]])
+
+    def test_roll_timeseries_dataframe_view(self):
+        x, y = roll_timeseries_dataframe(self.easy_data,
+                                         None,
+                                         lookback=3,
+                                         horizon=2,
+                                         feature_col=["C"],
+                                         target_col=["A"])
+        # no N/A, rolled result should be a read-only strided view instead of a copy
+        assert not x.flags.writeable
+        assert x.base is not None
+
+        self.easy_data["A"][4] = None
+        x, y = roll_timeseries_dataframe(self.easy_data,
+                                         None,
+                                         lookback=3,
+                                         horizon=2,
+                                         feature_col=["C"],
+                                         target_col=["A"])
+        # windows of x or y covering index 4 are dropped
+        assert x.shape == (1, 3, 2)
+        assert y.shape == (1, 2, 1)
+        assert not np.isnan(x).any() and not np.isnan(y).any()
+
+    def test_roll_timeseries_ndarray_by_id(self):
+        df = pd.concat([self.easy_data.iloc[:7], self.easy_data.iloc[:4], self.easy_data])
+        df["A"].iloc[13] = None
+        id_offsets = np.array([0, 7, 11, 21])
+        arr = df[["B", "A", "C"]].values.astype(np.float32)
+        for horizon, label_len in [(2, 0), (2, 1), ([1, 3], 0), (0, 0)]:
+            is_test = horizon == 0
+            x, y, roll_start_idxes = roll_timeseries_ndarray_by_id(arr,
+                                                                   id_offsets,
+                                                                   lookback=3,
+                                                                   horizon=horizon,
+                                                                   target_num=1,
+                                                                   label_len=label_len,
+                                                                   is_test=is_test)
+            # should be the same as rolling each id separately
+            res = [roll_timeseries_dataframe(df.iloc[id_offsets[i]:id_offsets[i + 1]],
+                                             None,
+                                             lookback=3,
+                                             horizon=horizon,
+                                             feature_col=["A", "C"],
+                                             target_col=["B"],
+                                             label_len=label_len)
+                   for i in range(len(id_offsets) - 1)]
+            np.testing.assert_array_equal(x, np.concatenate([r[0] for r in res]))
+            np.testing.assert_array_equal(arr[roll_start_idxes], x[:, 0, :])
+            if is_test:
+                assert y is None
+            else:
+                np.testing.assert_array_equal(y, np.concatenate([r[1] for r in res]))
@@ -21,6 +21,7 @@ import random
 from bigdl.chronos.data import TSDataset
 from bigdl.chronos.utils import LazyImport
 RollDataset = LazyImport('bigdl.chronos.data.utils.roll_dataset.RollDataset')
+roll_batch_collate_fn = LazyImport('bigdl.chronos.data.utils.roll_dataset.roll_batch_collate_fn')
 from ... import op_torch
 
 
@@ -114,6 +115,69 @@ class TestRollDataset:
         df = get_multi_id_ts_df()
         TestRollDataset.combination_tests_for_df(df)
 
+    def test_multi_id_time_enc(self):
+        df = get_multi_id_ts_df()
+        lookback, horizon = random.randint(2, 10), random.randint(1, 5)
+        for is_predict in [False, True]:
+            tsdata = TSDataset.from_pandas(df, dt_col="datetime", target_col="value",
+                                           extra_feature_col=["extra feature"],
+                                           id_col="id", repair=False)
+            tsdata.roll(lookback=lookback, horizon=horizon, time_enc=True,
+                        is_predict=is_predict)
+            x, y, x_enc, y_enc = tsdata.to_numpy()
+            roll_dataset = RollDataset(df=df,
+                                       dt_col="datetime",
+                                       freq=tsdata._freq,
+                                       lookback=lookback,
+                                       horizon=horizon,
+                                       feature_col=tsdata.feature_col,
+                                       target_col=tsdata.target_col,
+                                       id_col=tsdata.id_col,
+                                       time_enc=True,
+                                       label_len=tsdata.label_len,
+                                       is_predict=is_predict)
+            assert len(roll_dataset) == len(x)
+            for i in range(len(x)):
+                for expected, actual in zip((x[i], y[i], x_enc[i], y_enc[i]), roll_dataset[i]):
+                    np.testing.assert_array_almost_equal(expected, actual.detach().numpy())
+
+    def test_getitems(self):
+        from torch.utils.data.dataloader import default_collate
+        df = get_multi_id_ts_df()
+        lookback = random.randint(2, 10)
+        for horizon, time_enc, is_predict in [(random.randint(1, 5), False, False),
+                                              ([1, 3], False, False),
+                                              (0, False, True),
+                                              (random.randint(1, 5), True, False),
+                                              (random.randint(1, 5), True, True)]:
+            roll_dataset = RollDataset(df=df,
+                                       dt_col="datetime",
+                                       freq=pd.Timedelta("1D"),
+                                       lookback=lookback,
+                                       horizon=horizon,
+                                       feature_col=["extra feature"],
+                                       target_col=["value"],
+                                       id_col="id",
+                                       time_enc=time_enc,
+                                       label_len=1 if time_enc else 0,
+                                       is_predict=is_predict)
+            idxes = np.random.randint(0, len(roll_dataset), size=16)
+            batch = roll_batch_collate_fn(roll_dataset.__getitems__(idxes))
+            expected = default_collate([roll_dataset[i] for i in idxes])
+            # other collate_fn should still work on the result of __getitems__
+            default_batch = default_collate(roll_dataset.__getitems__(idxes))
+            if isinstance(batch, tuple):
+                for b, e in zip(default_batch, expected):
+                    np.testing.assert_array_equal(b.numpy(), e.numpy())
+            else:
+                np.testing.assert_array_equal(default_batch.numpy(), expected.numpy())
+            if isinstance(batch, tuple):
+                assert len(batch) == len(expected)
+                for b, e in zip(batch, expected):
+                    np.testing.assert_array_equal(b.numpy(), e.numpy())
+            else:
+                np.testing.assert_array_equal(batch.numpy(), expected.numpy())
+
     def test_df_nan(self):
         df = get_ts_df()
         df["value"][0] = np.nan
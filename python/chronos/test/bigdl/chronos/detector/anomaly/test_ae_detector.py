@@ -18,7 +18,7 @@ import pytest
 import numpy as np
 from unittest import TestCase
 
-from bigdl.chronos.detector.anomaly.ae_detector import AEDetector
+from bigdl.chronos.detector.anomaly.ae_detector import AEDetector, aggregate_subseq_err
 from ... import op_torch, op_tf2
 
 
@@ -67,6 +67,22 @@ class TestAEDetector(TestCase):
         anomaly_indexes = ad.anomaly_indexes()
         assert len(anomaly_indexes) == int(ad.ratio * len(y))
 
+    def test_aggregate_subseq_err(self):
+        roll_len, num_subseq, sub_scalef = 7, 50, 2
+        recon_err = np.random.rand(num_subseq, roll_len)
+        recon_err_subseq = np.linalg.norm(recon_err, axis=1)
+        expected = np.zeros(num_subseq + roll_len - 1)
+        for index, e in np.ndenumerate(recon_err):
+            agg_err = e + sub_scalef * recon_err_subseq[index[0]]
+            y_index = index[0] + index[1]
+            expected[y_index] = max(expected[y_index], agg_err)
+        # aggregate chunk by chunk
+        out = np.zeros(num_subseq + roll_len - 1)
+        for start in range(0, num_subseq, 16):
+            aggregate_subseq_err(recon_err[start:start + 16], recon_err_subseq[start:start + 16],
+                                 sub_scalef, out=out, start=start)
+        np.testing.assert_allclose(out, expected)
+
     @op_torch
     @op_tf2
     def test_corner_cases(self):
@@ -155,6 +155,43 @@ class TestThresholdDetector(TestCase):
         from scipy.stats import norm
         assert abs(td.th - (norm.ppf(1 - ratio) * sigma + mu)) < 0.04
 
+    def test_update(self):
+        ratio = 0.05
+        y = np.random.randn(1000, 3)
+        y_pred = y + np.random.randn(1000, 3)
+        batches = np.array_split(np.arange(1000), 7)
+
+        # the sample is exact before sample_size distances are seen
+        for mode in ["default", "gaussian"]:
+            td = ThresholdDetector()
+            td.set_params(mode=mode, ratio=ratio)
+            for idx in batches:
+                anomaly_scores = td.update(y[idx], y_pred[idx])
+                assert anomaly_scores.shape == (len(idx), 3)
+            fitted = ThresholdDetector()
+            fitted.set_params(mode=mode, ratio=ratio)
+            fitted.fit(y, y_pred)
+            assert abs(td.th - fitted.th) < 1e-6
+            assert td.anomaly_indexes() == \
+                np.flatnonzero(np.linalg.norm(y[idx] - y_pred[idx], axis=1) > td.th).tolist()
+
+        # reservoir sampling when the stream is longer than sample_size
+        td = ThresholdDetector()
+        td.set_params(ratio=ratio, sample_size=200)
+        for idx in batches:
+            td.update(y[idx], y_pred[idx])
+        assert td.estimator_.count == 1000
+        assert abs(td.th - fitted.th) < 1
+
+        # a threshold set in advance is kept
+        td = ThresholdDetector()
+        td.set_params(threshold=3)
+        td.update(y, y_pred)
+        assert td.th == 3
+        td.set_params(threshold=(-1, 1))
+        anomaly_scores = td.update(y)
+        assert td.anomaly_indexes() == np.flatnonzero(np.any(np.abs(y) > 1, axis=1)).tolist()
+
     def test_corner_cases(self):
         td = ThresholdDetector()
         with pytest.raises(RuntimeError):
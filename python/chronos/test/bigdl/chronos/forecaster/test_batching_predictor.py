@@ -0,0 +1,147 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import time
+import threading
+import numpy as np
+import pytest
+from unittest import TestCase
+
+from bigdl.chronos.utils import LazyImport
+torch = LazyImport('torch')
+LSTMForecaster = LazyImport('bigdl.chronos.forecaster.lstm_forecaster.LSTMForecaster')
+from bigdl.chronos.forecaster.batching_predictor import BatchingPredictor
+from .. import op_torch, op_diff_set_all
+
+
+class SumForecaster:
+    # predicts the sum of each window, and records the size of each batch
+    def __init__(self, delay=0.):
+        self.delay = delay
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+
+    def predict(self, data, batch_size=32, quantize=False):
+        time.sleep(self.delay)
+        with self.lock:
+            self.batch_sizes.append(len(data))
+        if quantize:
+            raise RuntimeError("quantized model is not found")
+        return data.sum(axis=(1, 2), keepdims=True) * np.ones((1, 2, 1))
+
+
+class TestBatchingPredictor(TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    @op_diff_set_all
+    def test_batching_predictor_coalesce(self):
+        forecaster = SumForecaster(delay=0.01)
+        x = np.random.randn(200, 24, 2).astype(np.float32)
+        with BatchingPredictor(forecaster, max_batch_size=16, max_latency=0.05) as predictor:
+            futures = [predictor.submit(x[i]) for i in range(100)]
+            futures.append(predictor.submit(x[100:]))
+            for i in range(100):
+                np.testing.assert_allclose(futures[i].result(), [[x[i].sum()]] * 2, rtol=1e-5)
+            assert futures[-1].result().shape == (100, 2, 1)
+            np.testing.assert_allclose(futures[-1].result()[:, 0, 0], x[100:].sum(axis=(1, 2)),
+                                       rtol=1e-5)
+            stats = predictor.get_stats()
+        assert max(forecaster.batch_sizes[:-1]) <= 16
+        assert forecaster.batch_sizes[-1] == 100
+        assert sum(forecaster.batch_sizes) == 200
+        assert stats["num_requests"] == 101
+        assert stats["num_samples"] == 200
+        assert stats["num_batches"] == len(forecaster.batch_sizes)
+        assert stats["avg_batch_size"] > 1
+        assert 0 < stats["latency_p50"] <= stats["latency_p90"] <= stats["latency_p99"]
+
+    @op_diff_set_all
+    def test_batching_predictor_concurrent(self):
+        forecaster = SumForecaster(delay=0.005)
+        x = np.random.randn(8, 64, 24, 2).astype(np.float32)
+        results = [None] * 8
+        with BatchingPredictor(forecaster, max_batch_size=32, max_latency=0.01,
+                               num_workers=2) as predictor:
+            def client(i):
+                results[i] = [predictor.predict(window) for window in x[i]]
+            threads = [threading.Thread(target=client, args=(i,)) for i in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        for i in range(8):
+            np.testing.assert_allclose(np.stack(results[i])[:, 0, 0], x[i].sum(axis=(1, 2)),
+                                       rtol=1e-5)
+        # requests from different clients are batched together
+        assert len(forecaster.batch_sizes) < 8 * 64
+
+    @op_diff_set_all
+    def test_batching_predictor_error(self):
+        with pytest.raises(RuntimeError):
+            BatchingPredictor(SumForecaster(), max_batch_size=0)
+        with pytest.raises(RuntimeError):
+            BatchingPredictor(object())
+
+        predictor = BatchingPredictor(SumForecaster(), quantize=True)
+        with pytest.raises(RuntimeError):
+            predictor.predict(np.zeros((24, 2)))
+        with pytest.raises(RuntimeError):
+            predictor.submit(np.zeros(24))
+        assert predictor.get_stats()["num_failed_batches"] == 1
+        predictor.shutdown()
+        with pytest.raises(RuntimeError):
+            predictor.submit(np.zeros((24, 2)))
+
+    @op_diff_set_all
+    def test_batching_predictor_shutdown_nowait(self):
+        forecaster = SumForecaster(delay=0.05)
+        x = np.random.randn(6, 24, 2).astype(np.float32)
+        predictor = BatchingPredictor(forecaster, max_batch_size=2, max_latency=0.01)
+        futures = [predictor.submit(x[i]) for i in range(6)]
+        # the requests still queued are served after shutdown returns
+        predictor.shutdown(wait=False)
+        for i in range(6):
+            np.testing.assert_allclose(futures[i].result(timeout=10), [[x[i].sum()]] * 2,
+                                       rtol=1e-5)
+        with pytest.raises(RuntimeError):
+            predictor.submit(x[0])
+
+    @op_torch
+    def test_batching_predictor_forecaster(self):
+        forecaster = LSTMForecaster(past_seq_len=24,
+                                    input_feature_num=2,
+                                    output_feature_num=2,
+                                    loss="mae",
+                                    lr=0.01)
+        x = np.random.rand(100, 24, 2).astype(np.float32)
+        y = np.random.rand(100, 1, 2).astype(np.float32)
+        forecaster.fit((x, y), epochs=1)
+        expected = forecaster.predict(x)
+        with BatchingPredictor(forecaster, max_batch_size=32) as predictor:
+            futures = [predictor.submit(x[i]) for i in range(100)]
+            np.testing.assert_allclose(np.stack([f.result() for f in futures]), expected,
+                                       rtol=1e-5, atol=1e-5)
+
+        # accelerated_model is called on the coalesced batch directly
+        forecaster.build_jit()
+        with BatchingPredictor(forecaster.accelerated_model, max_batch_size=32) as predictor:
+            futures = [predictor.submit(x[i]) for i in range(100)]
+            np.testing.assert_allclose(np.stack([f.result() for f in futures]), expected,
+                                       rtol=1e-5, atol=1e-5)
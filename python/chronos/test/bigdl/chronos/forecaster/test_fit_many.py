@@ -0,0 +1,127 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import os
+import json
+import tempfile
+import numpy as np
+import pandas as pd
+import pytest
+from unittest import TestCase
+
+from bigdl.chronos.data import TSDataset
+from bigdl.chronos.forecaster.fit_many import fit_many, fit_many_iter
+from .. import op_diff_set_all
+
+
+class MeanForecaster:
+    # predicts the mean of the training data
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.mean = None
+
+    def fit(self, data):
+        if self.fail:
+            raise RuntimeError("fit failed")
+        self.mean = float(np.mean(data))
+        # the pid of the process which fits this forecaster
+        return os.getpid()
+
+    def predict(self, horizon):
+        return np.full(horizon, self.mean)
+
+    def save(self, checkpoint_file):
+        with open(checkpoint_file, "w") as f:
+            json.dump({"mean": self.mean}, f)
+
+    def restore(self, checkpoint_file):
+        with open(checkpoint_file) as f:
+            self.mean = json.load(f)["mean"]
+
+
+def mean_fit(forecaster, df):
+    return forecaster.fit(df["value"].values)
+
+
+# the worker processes should not be more than the physical cores
+NUM_PROCESSES = min(2, os.cpu_count())
+
+
+def get_tsdata(num_id=8):
+    df = pd.DataFrame({"datetime": np.tile(pd.date_range("2022-01-01", periods=50), num_id),
+                       "id": np.repeat([f"{i:02d}" for i in range(num_id)], 50),
+                       "value": np.random.randn(50 * num_id)})
+    return df, TSDataset.from_pandas(df, dt_col="datetime", target_col="value", id_col="id")
+
+
+class TestFitMany(TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    @op_diff_set_all
+    def test_fit_many(self):
+        df, tsdata = get_tsdata()
+        expected = df.groupby("id")["value"].mean()
+        for num_processes in [1, NUM_PROCESSES]:
+            forecasters = fit_many(tsdata, lambda id: MeanForecaster(), fit_fn=mean_fit,
+                                   num_processes=num_processes)
+            assert sorted(forecasters) == list(expected.index)
+            for id, forecaster in forecasters.items():
+                np.testing.assert_allclose(forecaster.predict(2), [expected[id]] * 2)
+
+        if NUM_PROCESSES > 1:
+            pids = {result for _, _, result in fit_many_iter(tsdata,
+                                                             lambda id: MeanForecaster(),
+                                                             fit_fn=mean_fit,
+                                                             num_processes=NUM_PROCESSES)}
+            assert os.getpid() not in pids
+
+    @op_diff_set_all
+    def test_fit_many_resume(self):
+        df, tsdata = get_tsdata()
+        expected = df.groupby("id")["value"].mean()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            def failed_forecaster(id):
+                return MeanForecaster(fail=id in ("03", "05"))
+            with pytest.raises(RuntimeError, match="03"):
+                fit_many(tsdata, failed_forecaster, fit_fn=mean_fit,
+                         num_processes=NUM_PROCESSES, checkpoint_dir=tmp_dir)
+            assert len(os.listdir(tmp_dir)) == 6
+
+            # only the failed ids are fitted again
+            refitted = []
+
+            def record_fit(forecaster, df):
+                refitted.append(df["id"].iloc[0])
+                return mean_fit(forecaster, df)
+            fitted = list(fit_many_iter(tsdata, lambda id: MeanForecaster(),
+                                        fit_fn=record_fit, checkpoint_dir=tmp_dir))
+            assert len(fitted) == 8
+            assert sorted(refitted) == ["03", "05"]
+            for id, forecaster, _ in fitted:
+                np.testing.assert_allclose(forecaster.predict(1), [expected[id]])
+
+    @op_diff_set_all
+    def test_fit_many_error(self):
+        _, tsdata = get_tsdata()
+        with pytest.raises(RuntimeError):
+            fit_many(tsdata, lambda id: MeanForecaster(), num_processes=0)
+        # no default fit for a custom forecaster
+        with pytest.raises(RuntimeError):
+            fit_many(tsdata, lambda id: MeanForecaster())
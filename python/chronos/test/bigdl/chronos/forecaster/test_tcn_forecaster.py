@@ -1196,6 +1196,55 @@ class TestChronosModelTCNForecaster(TestCase):
         assert y_pred.shape == std.shape
         y_pred, std = forecaster.predict_interval(data=test)
 
+    def test_predict_interval_vectorize(self):
+        train_data, val_data, test_data = create_data()
+        forecaster = TCNForecaster(past_seq_len=24,
+                                   future_seq_len=5,
+                                   input_feature_num=1,
+                                   output_feature_num=1,
+                                   kernel_size=4,
+                                   num_channels=[16, 16, 16],
+                                   dropout=0.5,
+                                   loss="mse",
+                                   metrics=["mse"],
+                                   lr=0.01)
+        forecaster.fit(train_data, epochs=2)
+        y_pred, std = forecaster.predict_interval(data=test_data[0],
+                                                  validation_data=val_data,
+                                                  repetition_times=20)
+        y_pred_vec, std_vec, y_quantiles = forecaster.predict_interval(data=test_data[0],
+                                                                       repetition_times=20,
+                                                                       vectorize=True,
+                                                                       quantiles=[0.1, 0.9])
+        assert y_pred_vec.shape == y_pred.shape
+        assert std_vec.shape == std.shape
+        assert y_quantiles.shape == (2,) + y_pred.shape
+        assert (y_quantiles[0] <= y_pred_vec).all() and (y_pred_vec <= y_quantiles[1]).all()
+        # the MC dropout samples are drawn from the same distribution
+        assert np.abs(y_pred_vec - y_pred).mean() < std.mean()
+        assert np.abs(std_vec.mean() - std.mean()) < 0.5 * std.mean()
+        with pytest.raises(RuntimeError):
+            forecaster.predict_interval(data=test_data[0], quantiles=[0.5, 1.5])
+
+    def test_predict_interval_multi_process(self):
+        train_loader, val_loader, test_loader = create_data(loader=True)
+        forecaster = TCNForecaster(past_seq_len=24,
+                                   future_seq_len=5,
+                                   input_feature_num=1,
+                                   output_feature_num=1,
+                                   kernel_size=4,
+                                   num_channels=[16, 16, 16],
+                                   loss="mse",
+                                   metrics=["mse"],
+                                   lr=0.01)
+        forecaster.fit(train_loader, epochs=2)
+        y_pred, std = forecaster.predict_interval(data=test_loader,
+                                                  validation_data=val_loader,
+                                                  repetition_times=5,
+                                                  num_processes=2)
+        assert y_pred.shape == std.shape
+        assert len(y_pred) == len(test_loader.dataset)
+
     def test_predict_interval_without_validation_data(self):
         train_data, _, test_data = create_data()
         forecaster = TCNForecaster(past_seq_len=24,
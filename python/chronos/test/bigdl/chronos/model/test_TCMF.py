@@ -24,6 +24,8 @@ from numpy.testing import assert_array_almost_equal
 import pandas as pd
 from bigdl.chronos.utils import LazyImport
 TCMF = LazyImport('bigdl.chronos.model.tcmf_model.TCMF')
+DeepGLO = LazyImport('bigdl.chronos.model.tcmf.DeepGLO.DeepGLO')
+torch = LazyImport('torch')
 
 
 @op_torch
@@ -195,5 +197,52 @@ class TestTCMF(TestCase):
         os.remove(model_file)
 
 
+@op_torch
+class TestDeepGLO(TestCase):
+    def setup_method(self, method):
+        self.model = DeepGLO(num_channels_X=[16, 16, 1],
+                             num_channels_Y=[16, 16, 1],
+                             rank=16,
+                             svd=True)
+        self.Ymat = np.random.rand(300, 480)
+        self.model.train_all_models(self.Ymat, start_date="2020-4-1", freq="1H", period=24,
+                                    init_epochs=1, alt_iters=2, y_iters=1,
+                                    max_FX_epoch=1, max_TCN_epoch=1)
+
+    def teardown_method(self, method):
+        del self.model
+        del self.Ymat
+
+    def test_predict_local_workers(self):
+        result = self.model.predict_horizon(future=10, bsize=32, num_workers=1)
+        # without ray, the batches are predicted in a local thread pool
+        result_workers = self.model.predict_horizon(future=10, bsize=32, num_workers=3)
+        assert result.shape[0] == 300
+        np.testing.assert_allclose(result, result_workers)
+
+    def test_recover_future_X_exact(self):
+        self.model.append_new_y(np.random.rand(300, 12))
+        last_step = self.model.X.shape[1]
+        future = self.model.Ymat.shape[1] - last_step
+        Xn = self.model.recover_future_X(last_step=last_step, future=future, alpha=0.3,
+                                         exact=True)
+        assert Xn.shape == (16, future)
+
+        # Xn is the minimizer of calculate_newX_loss_vanilla
+        rg = 1 + 2 * (self.model.kernel_size - 1) * 2 ** (len(self.model.num_channels_X) - 1)
+        X = self.model.tensor2d_to_temporal(self.model.X[:, last_step - rg: last_step])
+        Xf = self.model.temporal_to_tensor2d(
+            self.model.predict_future(model=self.model.Xseq, inp=X, future=future))
+        Xf = Xf[:, -future:].detach()
+        Yn = torch.from_numpy(self.model.Ymat[:, last_step: last_step + future]).float()
+        Xn = Xn.clone().requires_grad_(True)
+        loss = self.model.calculate_newX_loss_vanilla(Xn, self.model.F.detach(), Yn, Xf, 0.3)
+        loss.backward()
+        assert Xn.grad.abs().max() < 1e-5
+        Xn_perturbed = Xn.detach() + 0.01 * torch.randn_like(Xn)
+        assert self.model.calculate_newX_loss_vanilla(Xn_perturbed, self.model.F.detach(),
+                                                      Yn, Xf, 0.3) > loss
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
@@ -0,0 +1,103 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from bigdl.chronos.utils import LazyImport
+torch = LazyImport('torch')
+from torch.utils.data import TensorDataset, DataLoader
+
+import numpy as np
+from unittest import TestCase
+import pytest
+
+from .. import op_torch
+
+
+@op_torch
+class TestChronosPytorchUtils(TestCase):
+
+    def setUp(self):
+        self.model = torch.nn.Linear(4, 2)
+        self.x = np.random.randn(100, 4).astype(np.float32)
+        self.y = np.random.randn(100, 2).astype(np.float32)
+        with torch.no_grad():
+            self.expected = self.model(torch.from_numpy(self.x)).numpy()
+
+    def tearDown(self):
+        pass
+
+    def test_pytorch_fashion_inference_numpy(self):
+        from bigdl.chronos.pytorch.utils import _pytorch_fashion_inference
+        for batch_size in [None, 7, 32, 200]:
+            yhat = _pytorch_fashion_inference(self.model, self.x, batch_size=batch_size)
+            np.testing.assert_allclose(yhat, self.expected, rtol=1e-6, atol=1e-6)
+
+        out = np.zeros((100, 2), dtype=np.float32)
+        yhat = _pytorch_fashion_inference(self.model, self.x, batch_size=32, out=out)
+        assert yhat is out
+        np.testing.assert_allclose(out, self.expected, rtol=1e-6, atol=1e-6)
+        with pytest.raises(RuntimeError):
+            _pytorch_fashion_inference(self.model, self.x, batch_size=32,
+                                       out=np.zeros((50, 2), dtype=np.float32))
+
+    def test_pytorch_fashion_inference_dataloader(self):
+        from bigdl.chronos.pytorch.utils import _pytorch_fashion_inference,\
+            _pytorch_fashion_inference_iter
+        loader = DataLoader(TensorDataset(torch.from_numpy(self.x), torch.from_numpy(self.y)),
+                            batch_size=16, shuffle=False)
+        for batch_size in [None, 5, 64]:
+            yhat, target = _pytorch_fashion_inference(self.model, loader,
+                                                      batch_size=batch_size,
+                                                      return_target=True)
+            np.testing.assert_allclose(yhat, self.expected, rtol=1e-6, atol=1e-6)
+            np.testing.assert_allclose(target, self.y)
+
+        # the batches are streamed, at most batch_size samples each
+        chunks = list(_pytorch_fashion_inference_iter(self.model, loader, batch_size=5))
+        assert max(len(yhat) for yhat, _ in chunks) == 5
+        assert sum(len(y) for _, y in chunks) == 100
+
+        # yhat and target are aligned for a shuffled dataloader
+        loader = DataLoader(TensorDataset(torch.from_numpy(self.x), torch.from_numpy(self.y)),
+                            batch_size=16, shuffle=True)
+        yhat, target = _pytorch_fashion_inference(self.model, loader, return_target=True)
+        order = np.argsort(target[:, 0])
+        np.testing.assert_allclose(yhat[order], self.expected[np.argsort(self.y[:, 0])],
+                                   rtol=1e-6, atol=1e-6)
+
+        # a dataloader without y
+        loader = DataLoader(TensorDataset(torch.from_numpy(self.x)), batch_size=16)
+        yhat = _pytorch_fashion_inference(self.model, loader)
+        np.testing.assert_allclose(yhat, self.expected, rtol=1e-6, atol=1e-6)
+        with pytest.raises(RuntimeError):
+            _pytorch_fashion_inference(self.model, loader, return_target=True)
+
+    def test_mc_dropout_model(self):
+        from bigdl.chronos.pytorch.utils import _pytorch_fashion_inference, _MCDropoutModel
+        model = torch.nn.Sequential(torch.nn.Linear(4, 8), torch.nn.Dropout(0.5),
+                                    torch.nn.Linear(8, 2))
+        mc_model = _MCDropoutModel(model, repetition_times=10)
+
+        model.eval()
+        yhat = _pytorch_fashion_inference(mc_model, self.x, batch_size=32)
+        assert yhat.shape == (100, 10, 2)
+        expected = _pytorch_fashion_inference(model, self.x)
+        np.testing.assert_allclose(yhat, np.repeat(expected[:, None], 10, axis=1),
+                                   rtol=1e-6, atol=1e-6)
+
+        # each repetition draws its own dropout masks
+        model.train()
+        yhat = _pytorch_fashion_inference(mc_model, self.x, batch_size=32)
+        assert (yhat.std(axis=1) > 0).all()
@@ -13,12 +13,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+import os
+import queue
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Union
 import onnxruntime as ort
 import onnx
 from bigdl.nano.utils.common import invalidInputError
 import numpy as np
 
+# the session options copied to the sessions of async_predict
+_COPIED_SESSION_OPTIONS = ("graph_optimization_level", "execution_mode", "enable_cpu_mem_arena",
+                           "enable_mem_pattern", "enable_mem_reuse", "log_severity_level")
+
 
 def _flatten(inputs, result):
     for x in inputs:
@@ -34,6 +42,12 @@ class ONNXRuntimeModel:
         self.onnx_model = None  # onnx model
         self.ortsess = None  # onnxruntime session
         self.session_options = session_options
+        # the sessions of async_predict, built on its first call
+        self._async_sessions = []
+        self._async_num_threads = None
+        # the input shapes and dtypes -> the output shapes and dtypes, None if the output
+        # shapes depend on the input values
+        self._output_specs = {}
         self._build_ortsess(session_options)
 
     def forward_step(self, *inputs):
@@ -54,6 +68,107 @@ class ONNXRuntimeModel:
         ort_outs = self.ortsess.run(None, zipped_inputs)
         return ort_outs
 
+    def async_predict(self,
+                      input_data: Union[List[np.ndarray], List[List[np.ndarray]]],
+                      num_requests: int = 0) -> List[List[np.ndarray]]:
+        """
+        Perfrom model inference using async mode.
+
+        :param input_data: Input data to be inferenced. Can be List[np.ndarray] or
+                           List[List[np.ndarray]] if the model has multiple inputs.
+        :param num_requests: Number of ONNX Runtime sessions running concurrently, the cores
+                             are split equally among them. Each element in input_data will
+                             be run by an idle session.
+                             Defaults to 0.
+                             If 0, it will be set to the number of cores, i.e. each session
+                             runs on one core.
+
+        :return: A List of the outputs of each input.
+        """
+        if len(input_data) == 0:
+            return []
+        input_list = []
+        for inputs in input_data:
+            flattened_inputs = []
+            _flatten([inputs], flattened_inputs)
+            invalidInputError(len(self._forward_args) == len(flattened_inputs),
+                              "The length of inputs is inconsistent with the length of "
+                              "ONNX Runtime session's inputs, "
+                              f"got model_forward_args: {self._forward_args}, "
+                              f"and {len(flattened_inputs)} inputs.")
+            # C-contiguous, so that the sessions read them in place
+            input_list.append([np.require(x, requirements="C") for x in flattened_inputs])
+
+        num_requests = num_requests or self._get_total_threads()
+        sessions = self._get_async_sessions(num_requests, min(num_requests, len(input_list)))
+        idle_sessions = queue.SimpleQueue()
+        for sess in sessions:
+            idle_sessions.put(sess)
+
+        def run(inputs):
+            sess = idle_sessions.get()
+            try:
+                return self._run_with_iobinding(sess, inputs)
+            finally:
+                idle_sessions.put(sess)
+
+        # onnxruntime releases the GIL while running, so the sessions run in parallel
+        with ThreadPoolExecutor(len(sessions)) as executor:
+            return list(executor.map(run, input_list))
+
+    def _get_total_threads(self):
+        if self.session_options is not None and self.session_options.intra_op_num_threads > 0:
+            return self.session_options.intra_op_num_threads
+        return os.cpu_count()
+
+    def _get_async_sessions(self, num_requests, num_sessions):
+        # the sessions are only rebuilt when num_requests changes their threads, a call with
+        # fewer inputs uses a prefix of them and more are created when needed
+        num_threads = max(1, self._get_total_threads() // num_requests)
+        if num_threads != self._async_num_threads:
+            self._async_sessions = []
+            self._async_num_threads = num_threads
+        if len(self._async_sessions) < num_sessions:
+            sess_options = ort.SessionOptions()
+            if self.session_options is not None:
+                for name in _COPIED_SESSION_OPTIONS:
+                    setattr(sess_options, name, getattr(self.session_options, name))
+            sess_options.intra_op_num_threads = num_threads
+            sess_options.inter_op_num_threads = 1
+            model_bytes = self.onnx_model.SerializeToString()
+            self._async_sessions.extend(
+                ort.InferenceSession(model_bytes, sess_options=sess_options)
+                for _ in range(num_sessions - len(self._async_sessions)))
+        return self._async_sessions[:num_sessions]
+
+    def _run_with_iobinding(self, sess, inputs):
+        binding = sess.io_binding()
+        for name, x in zip(self._forward_args, inputs):
+            binding.bind_cpu_input(name, x)
+        output_names = [x.name for x in sess.get_outputs()]
+        key = tuple((x.shape, x.dtype.str) for x in inputs)
+        specs = self._output_specs.get(key, ())
+        if specs:
+            # run into preallocated buffers, the output shapes are known for these inputs
+            outputs = [np.empty(shape, dtype=dtype) for shape, dtype in specs]
+            for name, output in zip(output_names, outputs):
+                binding.bind_output(name, "cpu", 0, output.dtype, output.shape,
+                                    output.ctypes.data)
+            try:
+                sess.run_with_iobinding(binding)
+                return outputs
+            except Exception:
+                # the output shapes depend on the input values, don't preallocate any more
+                self._output_specs[key] = None
+                binding.clear_binding_outputs()
+        for name in output_names:
+            binding.bind_output(name, "cpu")
+        sess.run_with_iobinding(binding)
+        outputs = binding.copy_outputs_to_cpu()
+        if specs == ():
+            self._output_specs[key] = [(x.shape, x.dtype) for x in outputs]
+        return outputs
+
     @property
     def forward_args(self):
         return self._forward_args
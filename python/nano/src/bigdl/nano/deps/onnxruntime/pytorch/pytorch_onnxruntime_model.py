@@ -16,6 +16,8 @@
 import torch
 import os
 from pathlib import Path
+from typing import Union, List
+from torch.utils.data import DataLoader
 from tempfile import TemporaryDirectory
 from ..core.onnxruntime_model import ONNXRuntimeModel
 import onnxruntime  # should be put behind core's import
@@ -106,6 +108,33 @@ class PytorchONNXRuntimeModel(ONNXRuntimeModel, AcceleratedLightningModule):
         outputs = self.numpy_to_tensors(outputs)
         return outputs
 
+    def async_predict(self,
+                      input_data: Union[DataLoader, List[torch.Tensor], List[List[torch.Tensor]]],
+                      num_requests: int = 0) -> List[torch.Tensor]:
+        """
+        Perfrom model inference using async mode.
+
+        :param input_data: Input data to be inferenced.
+                           Users can put multiple input data in a list or
+                           put all data in a DataLoader to infer and get results of all input data.
+                           Can be torch.utils.data.dataloader.DataLoader and
+                           List[torch.Tensor] or
+                           List[List[torch.Tensor]] if the model has multiple inputs.
+                           If input_data is a DataLoader object,the format in DataLoader should be
+                           (x1, x2, ..., xn, y).
+        :param num_requests: Number of ONNX Runtime sessions running concurrently, the threads
+                             of the model are split equally among them. Each element in
+                             input_data will be run by an idle session.
+                             Defaults to 0.
+                             If 0, it will be set to the number of threads of the model,
+                             i.e. each session runs on one thread.
+
+        :return: A List of torch.Tensor containing result of each input
+        """
+        input_list = [self.on_forward_start(inputs) for inputs in self._get_input_list(input_data)]
+        results = ONNXRuntimeModel.async_predict(self, input_list, num_requests)
+        return [self.on_forward_end(outputs) for outputs in results]
+
     @property
     def status(self):
         status = super().status
@@ -0,0 +1,118 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import bisect
+import warnings
+from collections import OrderedDict
+
+import torch
+import torch.nn.functional as F
+
+from bigdl.nano.utils.common import invalidInputError
+
+
+def _pad(x, dim, size, value):
+    # pad x with value at the end of dim to size
+    pad = [0, 0] * (x.dim() - dim % x.dim() - 1) + [0, size - x.size(dim)]
+    return F.pad(x, pad, value=value)
+
+
+def _unpad(outputs, dims, length):
+    # cut the padded part of the outputs at their dims
+    if isinstance(outputs, torch.Tensor):
+        return outputs if dims is None else outputs.narrow(dims, 0, length)
+    if isinstance(outputs, (tuple, list)):
+        if not isinstance(dims, (tuple, list)):
+            dims = [dims] * len(outputs)
+        invalidInputError(len(dims) == len(outputs),
+                          f"Expect {len(dims)} outputs as output_dims, but got {len(outputs)}")
+        return type(outputs)(_unpad(x, dim, length) for x, dim in zip(outputs, dims))
+    return outputs
+
+
+class _BucketedModel(torch.nn.Module):
+    def __init__(self, model, buckets, convert_fn, dims=1, pad_value=0,
+                 max_models=4, output_dims=None):
+        super().__init__()
+        invalidInputError(len(buckets) > 0 and all(b > 0 for b in buckets),
+                          "buckets should be a non-empty list of positive sizes")
+        invalidInputError(max_models > 0, "max_models should be a positive integer")
+        self.model = model
+        self.buckets = sorted(set(buckets))
+        self.convert_fn = convert_fn
+        self.dims = dims
+        self.pad_value = pad_value
+        self.max_models = max_models
+        self.output_dims = output_dims
+        # bucket -> accelerated model, from the least recently used
+        self._models = OrderedDict()
+        self._warned = False
+
+    def forward(self, *inputs):
+        dims = self.dims if isinstance(self.dims, (list, tuple)) else [self.dims] * len(inputs)
+        invalidInputError(len(dims) == len(inputs),
+                          f"Expect {len(dims)} inputs as dims, but got {len(inputs)}")
+        pad_values = self.pad_value if isinstance(self.pad_value, (list, tuple)) \
+            else [self.pad_value] * len(inputs)
+        lengths = {x.size(dim) for x, dim in zip(inputs, dims)
+                   if dim is not None and isinstance(x, torch.Tensor)}
+        invalidInputError(len(lengths) == 1,
+                          "The inputs to pad should have the same size at their dims, "
+                          f"but got {sorted(lengths)}")
+        length = lengths.pop()
+
+        idx = bisect.bisect_left(self.buckets, length)
+        if idx == len(self.buckets):
+            # longer than all buckets, run the original model
+            if not self._warned:
+                warnings.warn(f"Input size {length} is larger than the largest bucket "
+                              f"{self.buckets[-1]}, run it with the original model.")
+                self._warned = True
+            with torch.inference_mode():
+                return self.model(*inputs)
+        bucket = self.buckets[idx]
+
+        inputs = tuple(_pad(x, dim, bucket, value)
+                       if dim is not None and isinstance(x, torch.Tensor) else x
+                       for x, dim, value in zip(inputs, dims, pad_values))
+        acce_model = self._get_model(bucket, inputs)
+        from bigdl.nano.pytorch import InferenceOptimizer
+        with InferenceOptimizer.get_context(acce_model):
+            outputs = acce_model(*inputs)
+        if self.output_dims is not None and bucket != length:
+            outputs = _unpad(outputs, self.output_dims, length)
+        return outputs
+
+    def _get_model(self, bucket, inputs):
+        acce_model = self._models.get(bucket)
+        if acce_model is not None:
+            self._models.move_to_end(bucket)
+            return acce_model
+        # compile a model specialized for the bucket, on the first inputs falling in it
+        input_sample = inputs[0] if len(inputs) == 1 else inputs
+        acce_model = self.convert_fn(self.model, input_sample)
+        self._models[bucket] = acce_model
+        while len(self._models) > self.max_models:
+            self._models.popitem(last=False)
+        return acce_model
+
+    @property
+    def cached_buckets(self):
+        '''
+        The buckets whose accelerated models are cached, from the least recently used.
+        '''
+        return list(self._models)
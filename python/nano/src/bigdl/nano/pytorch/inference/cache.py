@@ -0,0 +1,238 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import os
+import json
+import uuid
+import types
+import shutil
+import hashlib
+import platform
+import warnings
+import weakref
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch import nn
+from torch.utils.data import DataLoader
+
+# the arguments of trace/quantize which don't change the converted model
+_IGNORED_PARAMS = ("logging", "inplace")
+
+# model -> (the data pointers and versions of its state_dict, fingerprint)
+_model_fingerprints = weakref.WeakKeyDictionary()
+_environment = None
+
+
+def _get_environment():
+    # the cached models and results are only reused on the same CPU features and torch
+    global _environment
+    if _environment is None:
+        from bigdl.nano.utils.common import CPUInfo
+        cpuinfo = CPUInfo()
+        _environment = (platform.machine(), cpuinfo.has_avx512, cpuinfo.has_bf16,
+                        torch.__version__)
+    return _environment
+
+
+def _model_fingerprint(model):
+    state_dict = model.state_dict()
+    # weights modified in place bump their version, so the memo is invalid then
+    memo_key = tuple((name, t.data_ptr(), t._version) for name, t in state_dict.items())
+    memo = _model_fingerprints.get(model)
+    if memo is not None and memo[0] == memo_key:
+        return memo[1]
+    h = hashlib.sha256()
+    h.update(f"{type(model).__module__}.{type(model).__qualname__}\n{model}".encode())
+    _update_hash(h, dict(state_dict))
+    fingerprint = h.hexdigest()
+    _model_fingerprints[model] = (memo_key, fingerprint)
+    return fingerprint
+
+
+def _dataloader_sample(loader):
+    # a few samples instead of the whole dataset, and independent of shuffling
+    dataset = loader.dataset
+    try:
+        num = len(dataset)
+        idxes = sorted({0, num // 2, num - 1}) if num > 0 else []
+        samples = [dataset[i] for i in idxes]
+    except Exception:
+        # e.g. an IterableDataset
+        num, samples = None, next(iter(loader))
+    return type(dataset).__qualname__, num, loader.batch_size, samples
+
+
+def _update_code_hash(h, code):
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            # e.g. a nested function, whose repr is its address
+            _update_code_hash(h, const)
+        else:
+            h.update(repr(const).encode())
+
+
+def _update_hash(h, obj):
+    # return the type of the first object which can't be fingerprinted, or None if all
+    # of them are hashed
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+        h.update(repr((type(obj).__name__, obj)).encode())
+    elif isinstance(obj, torch.Tensor):
+        t = obj.detach().cpu().contiguous()
+        h.update(repr(("tensor", t.dtype, tuple(t.shape))).encode())
+        h.update(t.reshape(-1).view(torch.uint8).numpy())
+    elif isinstance(obj, np.ndarray):
+        h.update(repr(("ndarray", obj.dtype.str, obj.shape)).encode())
+        h.update(np.ascontiguousarray(obj).view(np.uint8))
+    elif isinstance(obj, (tuple, list)):
+        h.update(f"{type(obj).__name__}{len(obj)}".encode())
+        for item in obj:
+            unfingerprintable = _update_hash(h, item)
+            if unfingerprintable is not None:
+                return unfingerprintable
+    elif isinstance(obj, dict):
+        h.update(f"dict{len(obj)}".encode())
+        for key in sorted(obj, key=repr):
+            unfingerprintable = _update_hash(h, key) or _update_hash(h, obj[key])
+            if unfingerprintable is not None:
+                return unfingerprintable
+    elif isinstance(obj, nn.Module):
+        h.update(_model_fingerprint(obj).encode())
+    elif isinstance(obj, DataLoader):
+        return _update_hash(h, _dataloader_sample(obj))
+    elif isinstance(obj, types.FunctionType):
+        # by name and code, as lambdas share their name, but not closures, whose
+        # captured values can't be told
+        if obj.__closure__:
+            return type(obj)
+        h.update(f"function:{obj.__module__}.{obj.__qualname__}".encode())
+        _update_code_hash(h, obj.__code__)
+        return _update_hash(h, (obj.__defaults__, obj.__kwdefaults__))
+    elif isinstance(obj, types.MethodType):
+        return _update_hash(h, ("method", obj.__func__, obj.__self__))
+    elif hasattr(obj, "__qualname__"):
+        # classes and builtin functions, by name
+        h.update(f"{getattr(obj, '__module__', '')}.{obj.__qualname__}".encode())
+    else:
+        text = repr(obj)
+        if " at 0x" in text:
+            return type(obj)
+        h.update(f"{type(obj).__qualname__}:{text}".encode())
+    return None
+
+
+def cache_key(*objs):
+    '''
+    Get a key of objs, which are made up of python scalars, tensors, ndarrays, modules,
+    DataLoaders (by a few samples) and functions (by name and code), together with the CPU
+    features.
+
+    :return: A hex string, or None if some objects can't be fingerprinted, e.g. a closure or
+             an object whose repr is its address.
+    '''
+    h = hashlib.sha256()
+    unfingerprintable = _update_hash(h, (_get_environment(), objs))
+    if unfingerprintable is not None:
+        warnings.warn(f"Can't cache the result because {unfingerprintable} can't be "
+                      "fingerprinted.")
+        return None
+    return h.hexdigest()
+
+
+class InferenceCache:
+    '''
+    An on-disk cache of accelerated models and their measured results, under cache_dir:
+
+    | models/<key>/: the accelerated model saved by InferenceOptimizer.save.
+    | results/<key>.json: the latency, status and accuracy measured by optimize.
+    '''
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+
+    def load_model(self, key, model, input_sample=None, inplace=False, device=None):
+        path = self.cache_dir / "models" / key
+        if not path.exists():
+            return None
+        from bigdl.nano.pytorch import InferenceOptimizer
+        try:
+            return InferenceOptimizer.load(path, model, input_sample=input_sample,
+                                           inplace=inplace, device=device)
+        except Exception as e:
+            # e.g. saved by an incompatible version, convert the model again
+            warnings.warn(f"Fail to load the cached model from {path}: {e}")
+            return None
+
+    def save_model(self, key, acce_model):
+        from bigdl.nano.pytorch import InferenceOptimizer
+        path = self.cache_dir / "models" / key
+        tmp_path = self.cache_dir / "models" / f".{key}.{uuid.uuid4().hex}"
+        try:
+            InferenceOptimizer.save(acce_model, tmp_path)
+            # atomic, so that a concurrent run never loads a half-written model
+            os.rename(tmp_path, path)
+        except Exception as e:
+            if not path.exists():
+                warnings.warn(f"Fail to cache the model: {e}")
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def load_result(self, key):
+        path = self.cache_dir / "results" / f"{key}.json"
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_result(self, key, result):
+        path = self.cache_dir / "results" / f"{key}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{key}.{uuid.uuid4().hex}")
+        with open(tmp_path, "w") as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
+
+
+def cached_convert(convert_fn, local_vars):
+    '''
+    Load the model converted by convert_fn (InferenceOptimizer.trace or quantize) with the
+    same arguments from the cache, or convert and save it into the cache.
+
+    :param convert_fn: InferenceOptimizer.trace or InferenceOptimizer.quantize.
+    :param local_vars: The locals() of convert_fn at the beginning, i.e. its arguments,
+           including cache_dir and kwargs.
+    '''
+    params = dict(local_vars)
+    cache_dir = params.pop("cache_dir")
+    params.update(params.pop("kwargs", {}))
+    key = cache_key(convert_fn.__name__,
+                    {k: v for k, v in params.items() if k not in _IGNORED_PARAMS})
+    if key is None:
+        return convert_fn(**params)
+    cache = InferenceCache(cache_dir)
+    acce_model = cache.load_model(key, params["model"],
+                                  input_sample=params.get("input_sample"),
+                                  inplace=params.get("inplace", False),
+                                  device=params.get("device"))
+    if acce_model is None:
+        acce_model = convert_fn(**params)
+        cache.save_model(key, acce_model)
+    return acce_model
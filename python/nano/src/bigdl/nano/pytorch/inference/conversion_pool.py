@@ -0,0 +1,174 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import os
+import time
+import weakref
+import traceback
+import contextlib
+import multiprocessing as mp
+from collections import deque
+from multiprocessing.connection import wait
+
+import torch
+
+
+def _set_affinity(cores):
+    # os.sched_setaffinity(0, cores) only pins the calling thread, pin all the threads of
+    # the process (e.g. the OpenMP threads of torch) and return their original affinities
+    tids = [int(tid) for tid in os.listdir("/proc/self/task")] \
+        if os.path.isdir("/proc/self/task") else [0]
+    original_cores = {}
+    for tid in tids:
+        try:
+            original_cores[tid] = os.sched_getaffinity(tid)
+            os.sched_setaffinity(tid, cores)
+        except OSError:
+            # the thread has exited
+            pass
+    return original_cores
+
+
+def _convert_helper(convert_fn, method, conn, cores):
+    try:
+        if cores is not None:
+            _set_affinity(cores)
+            torch.set_num_threads(len(cores))
+        convert_fn(method)
+        conn.send(None)
+    except Exception:
+        conn.send(traceback.format_exc())
+    finally:
+        conn.close()
+
+
+@contextlib.contextmanager
+def pinned(cores):
+    '''
+    Run all the threads of the current process on cores in the context, do nothing if
+    cores is None.
+    '''
+    if cores is None:
+        yield
+        return
+    original_cores = _set_affinity(cores)
+    try:
+        yield
+    finally:
+        for tid, tid_cores in original_cores.items():
+            try:
+                os.sched_setaffinity(tid, tid_cores)
+            except OSError:
+                pass
+
+
+class ConversionPool:
+    '''
+    Run convert_fn(method) for the methods concurrently, each in a new forked process, so
+    that a crashed conversion doesn't affect the others and its memory is released once it
+    is done. convert_fn should save the result somewhere (e.g. a cache directory) for the
+    main process to load, only the error (if any) is sent back.
+    '''
+
+    def __init__(self, convert_fn, methods, num_processes, cores_for_each_process=None):
+        self.convert_fn = convert_fn
+        self.num_processes = num_processes
+        self.cores_for_each_process = cores_for_each_process or [None] * num_processes
+        self._ctx = mp.get_context("fork")
+        self._pending = deque(methods)
+        self._free_slots = deque(range(num_processes))
+        # method -> (process, connection, slot)
+        self._running = {}
+        # method -> None if succeed, or the error message
+        self._results = {}
+        # the conversions left running are killed with the pool
+        self._finalizer = weakref.finalize(self, ConversionPool._terminate, self._running)
+        self._start()
+
+    def _start(self):
+        while self._pending and self._free_slots:
+            method = self._pending.popleft()
+            slot = self._free_slots.popleft()
+            recv_conn, send_conn = self._ctx.Pipe(duplex=False)
+            p = self._ctx.Process(target=_convert_helper,
+                                  args=(self.convert_fn, method, send_conn,
+                                        self.cores_for_each_process[slot]))
+            p.start()
+            send_conn.close()
+            self._running[method] = (p, recv_conn, slot)
+
+    def _collect(self, timeout=None):
+        # a connection is ready once the result is sent, or at EOF if the process crashed
+        conns = {conn: method for method, (_, conn, _) in self._running.items()}
+        for conn in wait(list(conns), timeout):
+            method = conns[conn]
+            p, _, slot = self._running.pop(method)
+            try:
+                self._results[method] = conn.recv()
+            except EOFError:
+                p.join()
+                self._results[method] = f"The conversion process exited with code {p.exitcode}."
+            p.join()
+            conn.close()
+            self._free_slots.append(slot)
+        self._start()
+
+    def wait(self, method, timeout=None):
+        '''
+        Wait until the conversion of method is done.
+
+        :param method: the method to wait for.
+        :param timeout: the max time (in seconds) to wait, None to wait until done.
+        :return: (whether the conversion is done, None if it succeeds or the error message).
+        '''
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while method not in self._results:
+            if not (self._running or self._pending):
+                return True, "The method is not in the pool."
+            remaining = None if deadline is None else deadline - time.perf_counter()
+            if remaining is not None and remaining <= 0:
+                return False, None
+            self._collect(remaining)
+        return True, self._results.pop(method)
+
+    def wait_all(self, timeout=None):
+        '''
+        Wait until all the conversions are done.
+
+        :param timeout: the max time (in seconds) to wait, None to wait until done.
+        '''
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while self._running or self._pending:
+            remaining = None if deadline is None else deadline - time.perf_counter()
+            if remaining is not None and remaining <= 0:
+                return
+            self._collect(remaining)
+
+    def close(self):
+        '''
+        Stop the conversions left.
+        '''
+        self._pending.clear()
+        self._finalizer()
+
+    @staticmethod
+    def _terminate(running):
+        for p, conn, _ in running.values():
+            p.terminate()
+            p.join()
+            conn.close()
+        running.clear()
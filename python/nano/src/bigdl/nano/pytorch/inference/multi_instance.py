@@ -15,7 +15,11 @@
 #
 
 
-from typing import Union, List
+import math
+import weakref
+from collections import deque
+from multiprocessing.shared_memory import SharedMemory
+from typing import Union, List, Iterator, Tuple, Any
 
 import torch
 from torch.utils.data.dataset import TensorDataset
@@ -24,9 +28,116 @@ from torch.utils.data.dataloader import DataLoader
 from bigdl.nano.utils.common import invalidInputError, invalidOperationError
 from bigdl.nano.pytorch.model import AcceleratedLightningModule
 
+# the offset of each tensor in a shared memory slab is aligned to it
+_ALIGNMENT = 64
+
+
+def _aligned(nbytes):
+    return (nbytes + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _flatten(data):
+    # a tensor, or a tuple/list of tensors, to (kind, tensors), kind is None otherwise
+    if isinstance(data, torch.Tensor):
+        return "tensor", [data]
+    if isinstance(data, (tuple, list)) and len(data) > 0 and \
+            all(isinstance(t, torch.Tensor) for t in data):
+        return type(data).__name__, list(data)
+    return None, None
+
+
+def _get_nbytes(tensors):
+    return sum(_aligned(t.numel() * t.element_size()) for t in tensors)
+
+
+def _write_tensors(buf, offset, kind, tensors):
+    # copy the tensors into buf from offset, and return the meta to read them back
+    specs = []
+    with torch.no_grad():
+        for t in tensors:
+            if t.numel() > 0:
+                dst = torch.frombuffer(buf, dtype=t.dtype, count=t.numel(), offset=offset)
+                dst.view(t.shape).copy_(t)
+            specs.append((offset, tuple(t.shape), t.dtype))
+            offset += _aligned(t.numel() * t.element_size())
+    return kind, specs
+
+
+def _read_tensors(buf, meta, copy=False):
+    # the tensors are views of buf unless copy is True
+    kind, specs = meta
+    tensors = []
+    for offset, shape, dtype in specs:
+        numel = math.prod(shape)
+        if numel == 0:
+            tensors.append(torch.empty(shape, dtype=dtype))
+            continue
+        t = torch.frombuffer(buf, dtype=dtype, count=numel, offset=offset).view(shape)
+        tensors.append(t.clone() if copy else t)
+    if kind == "tensor":
+        return tensors[0]
+    return tuple(tensors) if kind == "tuple" else tensors
+
+
+class _SharedMemoryBatch:
+    # sent to the worker in place of a batch, whose inputs are in slab `name`
+    __slots__ = ("idx", "slot", "name", "size", "in_nbytes", "meta")
+
+    def __init__(self, idx, slot, name, size, in_nbytes, meta):
+        self.idx = idx
+        self.slot = slot
+        self.name = name
+        self.size = size
+        self.in_nbytes = in_nbytes
+        self.meta = meta
+
+
+class _SharedMemoryOutput:
+    # sent back in place of an output, which is written after the inputs in the same slab
+    __slots__ = ("meta",)
+
+    def __init__(self, meta):
+        self.meta = meta
+
+
+class _SharedMemoryRing:
+    '''
+    A fixed number of shared memory slabs, each holds the inputs and then the outputs of
+    one batch in flight. The slabs are reused across batches and calls, a slab is only
+    reallocated when a batch does not fit in it.
+    '''
+
+    def __init__(self, slot_num):
+        self.slabs = [None] * slot_num
+        self.free = deque(range(slot_num))
+        # the largest output seen, reserved after the inputs in each slab
+        self.out_nbytes = 0
+
+    def acquire(self, in_nbytes):
+        slot = self.free.popleft()
+        nbytes = max(in_nbytes + self.out_nbytes, 1)
+        shm = self.slabs[slot]
+        if shm is None or shm.size < nbytes:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = SharedMemory(create=True, size=1 << (nbytes - 1).bit_length())
+            self.slabs[slot] = shm
+        return slot, shm
+
+    def release(self, slot):
+        self.free.append(slot)
+
+    def close(self):
+        for shm in self.slabs:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self.slabs = [None] * len(self.slabs)
+
 
 class _MultiInstanceModel(torch.nn.Module):
-    def __init__(self, model, ps, send_queue, recv_queue, next_idx):
+    def __init__(self, model, ps, send_queue, recv_queue, next_idx, shared_memory=False):
         super().__init__()
         self.model = model
         self.ps = ps
@@ -34,43 +145,113 @@ class _MultiInstanceModel(torch.nn.Module):
         self.send_queue = send_queue
         self.recv_queue = recv_queue
         self.next_idx = next_idx
+        self.ring = None
+        if ps is not None and shared_memory:
+            # one batch running and one waiting for each process
+            self.ring = _SharedMemoryRing(2 * self.p_num)
+            weakref.finalize(self, self.ring.close)
 
     def forward(self, input_data: Union[DataLoader, List]) -> List:
-        if isinstance(input_data, (DataLoader, list)):
-            length = len(input_data)
-        else:
+        outputs = [None] * len(input_data)
+        for idx, output in self.stream(input_data):
+            outputs[idx] = output
+        return outputs
+
+    def stream(self, input_data: Union[DataLoader, List]) -> Iterator[Tuple[int, Any]]:
+        """
+        Run inference on input_data and yield the outputs in the order they are completed,
+        instead of waiting for all the batches as `forward`.
+
+        :param input_data: A DataLoader or a list of input batchs.
+        :return: A generator of (index of the batch in input_data, output of the batch).
+        """
+        if not isinstance(input_data, (DataLoader, list)):
             invalidInputError(False, "The input should be a DataLoader or a list of input batchs")
 
         if self.ps is None:
             # run inference in current process directly
             from bigdl.nano.pytorch import InferenceOptimizer
             with InferenceOptimizer.get_context(self.model):
-                outputs = [self.model(inputs) for inputs in input_data]
-            return outputs
+                for idx, inputs in enumerate(input_data):
+                    yield idx, self.model(inputs)
+            return
 
+        # the workers load the batches by themselves from a DataLoader on other datasets
+        load_in_worker = isinstance(input_data, DataLoader) and \
+            not isinstance(input_data.dataset, TensorDataset)
+        if load_in_worker:
+            for idx in range(self.p_num):
+                self.send_queue.put(input_data)
+            batches, pending = iter(()), len(input_data)
         else:
-            if isinstance(input_data, DataLoader) and not isinstance(input_data.dataset,
-                                                                     TensorDataset):
-                for idx in range(self.p_num):
-                    self.send_queue.put(input_data)
-            else:
-                for idx_and_batch in enumerate(input_data):
-                    self.send_queue.put(idx_and_batch)
-
-            outputs = [None] * length
-            for _i in range(length):
+            batches, pending = enumerate(input_data), 0
+        slots = {}
+        error = None
+        try:
+            while True:
+                # the ring bounds the batches in flight, all batches are sent without it
+                while error is None and (self.ring is None or self.ring.free):
+                    try:
+                        idx, inputs = next(batches)
+                    except StopIteration:
+                        break
+                    self.send_queue.put(self._pack(idx, inputs, slots))
+                    pending += 1
+                if pending == 0:
+                    break
+                idx, output = self.recv_queue.get()
+                pending -= 1
+                output = self._unpack(idx, output, slots)
+                if isinstance(output, Exception):
+                    error = output if error is None else error
+                    # the other batches of the DataLoader may never come, don't wait for them
+                    if load_in_worker:
+                        pending = 0
+                elif error is None:
+                    yield idx, output
+            invalidOperationError(error is None, f"forward error: {error}\n")
+        finally:
+            # consume the outputs left by an early stop, so that they don't mix with the
+            # outputs of the next call
+            while pending > 0:
                 idx, output = self.recv_queue.get()
-                invalidOperationError(not isinstance(output, Exception),
-                                      f"forward error: {output}\n")
-                outputs[idx] = output
-            with self.next_idx.get_lock():
-                self.next_idx.value = 0
+                pending -= 1
+                self._unpack(idx, output, slots)
+            if load_in_worker:
+                with self.next_idx.get_lock():
+                    self.next_idx.value = 0
 
-        return outputs
+    def _pack(self, idx, inputs, slots):
+        if self.ring is None:
+            return idx, inputs
+        kind, tensors = _flatten(inputs)
+        if kind is None:
+            return idx, inputs
+        in_nbytes = _get_nbytes(tensors)
+        slot, shm = self.ring.acquire(in_nbytes)
+        slots[idx] = (slot, in_nbytes)
+        meta = _write_tensors(shm.buf, 0, kind, tensors)
+        return _SharedMemoryBatch(idx, slot, shm.name, shm.size, in_nbytes, meta)
+
+    def _unpack(self, idx, output, slots):
+        if idx not in slots:
+            return output
+        slot, in_nbytes = slots.pop(idx)
+        if isinstance(output, _SharedMemoryOutput):
+            output = _read_tensors(self.ring.slabs[slot].buf, output.meta, copy=True)
+        else:
+            # the output didn't fit in the slab, reserve its size for the next batches
+            kind, tensors = _flatten(output)
+            if kind is not None:
+                self.ring.out_nbytes = max(self.ring.out_nbytes, _get_nbytes(tensors))
+        self.ring.release(slot)
+        return output
 
 
 def _multi_instance_helper(model, recv_queue, send_queue, next_idx):
     from bigdl.nano.pytorch import InferenceOptimizer
+    # the slabs attached, by slot
+    slabs = {}
     with InferenceOptimizer.get_context(model):
         while True:
             try:
@@ -89,6 +270,9 @@ def _multi_instance_helper(model, recv_queue, send_queue, next_idx):
                         new_idx = get_next_idx(next_idx)
                         inference(idx, inputs, model, send_queue)
                         idx = new_idx
+                elif isinstance(args, _SharedMemoryBatch):
+                    idx = args.idx
+                    shared_memory_inference(args, model, send_queue, slabs)
                 else:
                     idx, inputs = args
                     inference(idx, inputs, model, send_queue)
@@ -104,6 +288,30 @@ def inference(idx, inputs, model, send_queue):
     send_queue.put((idx, output))
 
 
+def shared_memory_inference(args, model, send_queue, slabs):
+    shm = slabs.get(args.slot)
+    if shm is None or shm.name != args.name:
+        if shm is not None:
+            try:
+                shm.close()
+            except BufferError:
+                # still referenced by a tensor, it is unmapped once the tensor is released
+                pass
+        shm = SharedMemory(name=args.name)
+        slabs[args.slot] = shm
+    inputs = _read_tensors(shm.buf, args.meta)
+    if isinstance(inputs, tuple):
+        output = model(*inputs)
+    else:
+        output = model(inputs)
+    kind, tensors = _flatten(output)
+    if kind is not None and args.in_nbytes + _get_nbytes(tensors) <= args.size:
+        meta = _write_tensors(shm.buf, args.in_nbytes, kind, tensors)
+        send_queue.put((args.idx, _SharedMemoryOutput(meta)))
+    else:
+        send_queue.put((args.idx, output))
+
+
 def get_next_idx(next_idx):
     with next_idx.get_lock():
         idx = next_idx.value
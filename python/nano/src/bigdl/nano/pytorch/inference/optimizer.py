@@ -41,6 +41,9 @@ from bigdl.nano.utils.common import schedule_processors
 from bigdl.nano.pytorch.context_manager import generate_context_manager,\
     BaseContextManager, AutocastContextManager
 from .multi_instance import _MultiInstanceModel, _multi_instance_helper
+from .bucketing import _BucketedModel
+from .cache import InferenceCache, cache_key, cached_convert
+from .conversion_pool import ConversionPool, pinned
 import traceback
 import warnings
 # Filter out useless Userwarnings
@@ -50,13 +53,14 @@ warnings.filterwarnings('ignore', category=UserWarning, module='torch')
 warnings.filterwarnings('ignore', category=DeprecationWarning, module='torch')
 
 import os
+import tempfile
 os.environ['LOGLEVEL'] = 'ERROR'  # remove parital output of inc
 
 
 class TorchAccelerationOption(AccelerationOption):
     def optimize(self, model, training_data=None, input_sample=None,
                  thread_num=None, dynamic_axes=True, logging=False,
-                 sample_size_for_pot=100):
+                 sample_size_for_pot=100, cache_dir=None):
         accelerator = self.get_accelerator()
         if self.get_precision() == "fp32":
             if accelerator is None and self.ipex is False and \
@@ -72,7 +76,8 @@ class TorchAccelerationOption(AccelerationOption):
                                          use_ipex=self.ipex,
                                          dynamic_axes=dynamic_axes,
                                          # remove output of openvino
-                                         logging=logging)
+                                         logging=logging,
+                                         cache_dir=cache_dir)
         else:
             # quantize
             ort_method: str = self.method
@@ -89,7 +94,8 @@ class TorchAccelerationOption(AccelerationOption):
                                             dynamic_axes=dynamic_axes,
                                             sample_size=sample_size_for_pot,
                                             # remove output of openvino
-                                            logging=logging)
+                                            logging=logging,
+                                            cache_dir=cache_dir)
         return acce_model
 
 
@@ -160,7 +166,10 @@ class InferenceOptimizer(BaseInferenceOptimizer):
                  latency_sample_num: int = 100,
                  includes: Optional[List[str]] = None,
                  excludes: Optional[List[str]] = None,
-                 output_filename: Optional[str] = None) -> None:
+                 output_filename: Optional[str] = None,
+                 cache_dir: Optional[str] = None,
+                 num_processes: int = 1,
+                 time_budget: Optional[float] = None) -> None:
         '''
         This function will give all available inference acceleration methods a try
         and record the latency, accuracy and model instance inside the Optimizer for
@@ -290,12 +299,29 @@ class InferenceOptimizer(BaseInferenceOptimizer):
                search. "original" will be ignored in the excludes.
         :param output_filename: (optional) a string filename is used to specify the file which the
                optimized table will be writed. The default is None which means don't write to file.
+        :param cache_dir: (optional) a directory to cache the accelerated models and their
+               latency and accuracy across runs. A method is loaded instead of converted again
+               if the model weights, input_sample, thread_num and CPU features are unchanged,
+               and its latency (and accuracy, if validation_data and metric are unchanged) is
+               reused instead of measured again. The calibration and validation data are only
+               compared by a few samples. Default to None meaning no cache.
+        :param num_processes: (optional) the number of processes to convert the models of
+               different methods concurrently, while the latency is still measured one by one
+               in this process. If thread_num is set and there are enough cores, the latency
+               is measured on the first thread_num cores while the conversions run on the
+               others, otherwise it is measured after all the conversions are done. Default to
+               1 meaning converting and measuring one by one.
+        :param time_budget: (optional) the max time (in seconds) of the optimization. The
+               methods not tested in time are skipped with status "out of time budget".
+               Default to None meaning no limit.
         '''
 
         # check if model is a nn.Module or inherited from a nn.Module
         invalidInputError(isinstance(model, nn.Module), "model should be a nn module.")
         invalidInputError(direction in ['min', 'max'],
                           "Only support direction 'min', 'max'.")
+        invalidInputError(isinstance(num_processes, int) and num_processes > 0,
+                          "num_processes must be a positive integer.")
         invalidInputError(accelerator is None or isinstance(accelerator, tuple),
                           "accelerator must be a tuple.")
         invalidInputError(precision is None or isinstance(precision, tuple),
@@ -410,96 +436,186 @@ class InferenceOptimizer(BaseInferenceOptimizer):
 
         print("==========================Start Optimization==========================")
         start_time = time.perf_counter()
-        for idx, (method, available) in enumerate(available_dict.items()):
-            result_map[method] = {}
-            if available is False:
-                result_map[method]["status"] = "lack dependency"
-            else:
-                print(f"----------Start test {method} model "
-                      f"({idx+1}/{len(available_dict)})----------")
-                option: AccelerationOption = self.ALL_INFERENCE_ACCELERATION_METHOD[method]
-                _precision = option.get_precision()
-                try:
-                    acce_model = option.optimize(model, training_data=training_data,
-                                                 input_sample=input_sample,
-                                                 thread_num=thread_num,
-                                                 dynamic_axes=dynamic_axes,
-                                                 logging=logging,
-                                                 sample_size_for_pot=sample_size_for_pot)
-                except Exception:
-                    traceback.print_exc()
-                    result_map[method]["status"] = "fail to convert"
-                    print(f"----------Failed to convert to {method}----------")
-                    continue
-
-                result_map[method]["status"] = "successful"
-
-                def func_test(model, input_sample):
-                    if isinstance(input_sample, (Dict, torch.Tensor)):
-                        model(input_sample)
-                    else:
-                        model(*input_sample)
 
-                with InferenceOptimizer.get_context(acce_model):
-                    try:
-                        result_map[method]["latency"], status =\
-                            latency_calculate_helper(latency_sample_num, baseline_time,
-                                                     func_test, acce_model, input_sample)
-                        if status is False and method != "original":
-                            result_map[method]["status"] = "early stopped"
-                            # save model even early stop
-                            result_map[method]["model"] = acce_model
-                            torch.set_num_threads(default_threads)
+        pool, measure_cores, tmp_dir = None, None, None
+        try:
+            if num_processes > 1:
+                if cache_dir is None:
+                    # the models converted in other processes are loaded from the cache
+                    tmp_dir = tempfile.TemporaryDirectory()
+                    cache_dir = tmp_dir.name
+                cores = sorted(os.sched_getaffinity(0))
+                cores_for_each_process = None
+                if thread_num is not None and len(cores) >= thread_num + num_processes:
+                    # measure the latency on dedicated cores, so that it is not disturbed by the
+                    # conversions running on the other cores
+                    measure_cores = cores[:thread_num]
+                    cores_for_each_process = [cores[thread_num + i::num_processes]
+                                              for i in range(num_processes)]
+
+                def convert(method):
+                    self.ALL_INFERENCE_ACCELERATION_METHOD[method].optimize(
+                        model, training_data=training_data, input_sample=input_sample,
+                        thread_num=thread_num, dynamic_axes=dynamic_axes, logging=logging,
+                        sample_size_for_pot=sample_size_for_pot, cache_dir=cache_dir)
+
+                pool = ConversionPool(convert,
+                                      [method for method, available in available_dict.items()
+                                       if available and method != "original"],
+                                      num_processes, cores_for_each_process)
+                if measure_cores is None:
+                    pool.wait_all(timeout=None if time_budget is None else time_budget)
+
+            cache = None
+            if cache_dir is not None:
+                cache = InferenceCache(cache_dir)
+                accuracy_key = cache_key(validation_data, metric) if self._calculate_accuracy \
+                    else None
+
+            for idx, (method, available) in enumerate(available_dict.items()):
+                result_map[method] = {}
+                if available is False:
+                    result_map[method]["status"] = "lack dependency"
+                else:
+                    print(f"----------Start test {method} model "
+                          f"({idx+1}/{len(available_dict)})----------")
+                    option: AccelerationOption = self.ALL_INFERENCE_ACCELERATION_METHOD[method]
+                    _precision = option.get_precision()
+                    remaining_time = None if time_budget is None else \
+                        time_budget - (time.perf_counter() - start_time)
+                    if pool is not None and method != "original":
+                        converted, error = pool.wait(method, timeout=remaining_time)
+                        if not converted:
+                            result_map[method]["status"] = "out of time budget"
+                            continue
+                        if error is not None:
+                            print(error)
+                            result_map[method]["status"] = "fail to convert"
+                            print(f"----------Failed to convert to {method}----------")
                             continue
+                    elif remaining_time is not None and remaining_time <= 0 and \
+                            method != "original":
+                        result_map[method]["status"] = "out of time budget"
+                        continue
+                    try:
+                        acce_model = option.optimize(model, training_data=training_data,
+                                                     input_sample=input_sample,
+                                                     thread_num=thread_num,
+                                                     dynamic_axes=dynamic_axes,
+                                                     logging=logging,
+                                                     sample_size_for_pot=sample_size_for_pot,
+                                                     cache_dir=cache_dir)
                     except Exception:
                         traceback.print_exc()
-                        result_map[method]["status"] = "fail to forward"
-                        print(f"----------{method} failed to forward----------")
-                        torch.set_num_threads(default_threads)
+                        result_map[method]["status"] = "fail to convert"
+                        print(f"----------Failed to convert to {method}----------")
                         continue
 
-                    torch.set_num_threads(default_threads)
-                    if self._calculate_accuracy:
-                        # here we suppose trace don't change accuracy,
-                        # so we jump it to reduce time cost of optimize
-                        if _precision == "fp32" and method != "original":
-                            _accuracy = result_map["original"]["accuracy"]
-                            if isinstance(_accuracy, torch.Tensor):
-                                _accuracy = _accuracy.item()
-                            _accuracy = round(_accuracy, 3)
-                            result_map[method]["accuracy"] = str(_accuracy) + '*'
+                    result_map[method]["status"] = "successful"
+
+                    result_key, cached_result = None, None
+                    if cache is not None:
+                        # int8 models also depend on the calibration data
+                        result_key = cache_key(method, model, input_sample, thread_num,
+                                               dynamic_axes, latency_sample_num,
+                                               training_data if _precision == "int8" else None)
+                        cached_result = cache.load_result(result_key) if result_key else None
+
+                    def func_test(model, input_sample):
+                        if isinstance(input_sample, (Dict, torch.Tensor)):
+                            model(input_sample)
                         else:
-                            if method == "original":
-                                # test whether metric works
-                                try:
+                            model(*input_sample)
+
+                    with InferenceOptimizer.get_context(acce_model):
+                        try:
+                            if cached_result is not None:
+                                print(f"----------Reuse the cached latency of {method} "
+                                      f"model----------")
+                                result_map[method]["latency"] = cached_result["latency"]
+                                status = not cached_result["early_stopped"]
+                            else:
+                                with pinned(measure_cores):
+                                    result_map[method]["latency"], status =\
+                                        latency_calculate_helper(latency_sample_num,
+                                                                 baseline_time, func_test,
+                                                                 acce_model, input_sample)
+                                if result_key is not None:
+                                    cached_result = {"latency": result_map[method]["latency"],
+                                                     "early_stopped": status is False}
+                                    cache.save_result(result_key, cached_result)
+                            if status is False and method != "original":
+                                result_map[method]["status"] = "early stopped"
+                                # save model even early stop
+                                result_map[method]["model"] = acce_model
+                                torch.set_num_threads(default_threads)
+                                continue
+                        except Exception:
+                            traceback.print_exc()
+                            result_map[method]["status"] = "fail to forward"
+                            print(f"----------{method} failed to forward----------")
+                            torch.set_num_threads(default_threads)
+                            continue
+
+                        torch.set_num_threads(default_threads)
+                        if self._calculate_accuracy:
+                            if cached_result is not None and accuracy_key is not None and \
+                                    cached_result.get("accuracy_key") == accuracy_key:
+                                result_map[method]["accuracy"] = cached_result["accuracy"]
+                            # here we suppose trace don't change accuracy,
+                            # so we jump it to reduce time cost of optimize
+                            elif _precision == "fp32" and method != "original":
+                                _accuracy = result_map["original"]["accuracy"]
+                                if isinstance(_accuracy, torch.Tensor):
+                                    _accuracy = _accuracy.item()
+                                _accuracy = round(_accuracy, 3)
+                                result_map[method]["accuracy"] = str(_accuracy) + '*'
+                            else:
+                                if method == "original":
+                                    # test whether metric works
+                                    try:
+                                        result_map[method]["accuracy"] =\
+                                            _accuracy_calculate_helper(acce_model, metric,
+                                                                       validation_data)
+                                    except Exception:
+                                        traceback.print_exc()
+                                        self._calculate_accuracy = False
+                                        invalidInputError(
+                                            False,
+                                            "Your metric is incompatible with validation_data or "
+                                            "don't follow our given pattern. Our expected metric "
+                                            "pattern is as follows:\n1. a torchmetrics.Metric "
+                                            "object\n2. a callable object which takes prediction "
+                                            "and target then returns a value in this calling "
+                                            "method: `metric(pred, target)`\n3. a callable object "
+                                            "that takes model and validation_data (if "
+                                            "validation_data is not None) as input,and returns an "
+                                            "accuracy value in this calling method: "
+                                            "metric(model, data_loader) (or metric(model) if "
+                                            "validation_data is None).")
+                                else:
                                     result_map[method]["accuracy"] =\
                                         _accuracy_calculate_helper(acce_model, metric,
                                                                    validation_data)
-                                except Exception:
-                                    traceback.print_exc()
-                                    self._calculate_accuracy = False
-                                    invalidInputError(
-                                        False,
-                                        "Your metric is incompatible with validation_data or don't "
-                                        "follow our given pattern. Our expected metric pattern is "
-                                        "as follows:\n1. a torchmetrics.Metric object\n2. a "
-                                        "callable object which takes prediction and target then "
-                                        "returns a value in this calling method: `metric(pred, "
-                                        "target)`\n3. a callable object that takes model and "
-                                        "validation_data (if validation_data is not None) as input,"
-                                        "and returns an accuracy value in this calling method: "
-                                        "metric(model, data_loader) (or metric(model) if "
-                                        "validation_data is None).")
-                            else:
-                                result_map[method]["accuracy"] =\
-                                    _accuracy_calculate_helper(acce_model, metric,
-                                                               validation_data)
-                    else:
-                        result_map[method]["accuracy"] = None
-
-                result_map[method]["model"] = acce_model
-                print(f"----------Finish test {method} model "
-                      f"({idx+1}/{len(available_dict)})----------")
+                                if result_key is not None and accuracy_key is not None:
+                                    _accuracy = result_map[method]["accuracy"]
+                                    if isinstance(_accuracy, torch.Tensor):
+                                        _accuracy = _accuracy.item()
+                                    cached_result.update(accuracy_key=accuracy_key,
+                                                         accuracy=_accuracy)
+                                    cache.save_result(result_key, cached_result)
+                        else:
+                            result_map[method]["accuracy"] = None
+
+                    result_map[method]["model"] = acce_model
+                    print(f"----------Finish test {method} model "
+                          f"({idx+1}/{len(available_dict)})----------")
+        finally:
+            # also on failure, so that no conversion process or temporary directory is left
+            if pool is not None:
+                pool.close()
+            if tmp_dir is not None:
+                tmp_dir.cleanup()
 
         self.optimized_model_dict: Dict = result_map
         print("\n\n==========================Optimization Results==========================")
@@ -553,6 +669,7 @@ class InferenceOptimizer(BaseInferenceOptimizer):
                  weights_prepack: Optional[bool] = None,
                  enable_onednn: bool = True,
                  q_config=None,
+                 cache_dir: Optional[str] = None,
                  **kwargs):
         """
         Calibrate a torch.nn.Module for post-training quantization.
@@ -694,6 +811,11 @@ class InferenceOptimizer(BaseInferenceOptimizer):
                          https://pytorch.org/docs/1.13/generated/torch.quantization.qconfig.
                          QConfig.html#torch.quantization.qconfig.QConfig .
                          This parameter only works for native ipex quantization.
+        :param cache_dir: (optional) A directory to cache the quantized model. If a model has
+                          been quantized with the same weights, input_sample, calibration data
+                          (by a few samples), arguments and CPU features, it will be loaded from
+                          the cache instead of quantized again. Default to ``None`` meaning no
+                          cache.
         :param **kwargs: Other extra advanced settings include:
                          1. those be passed to ``torch.onnx.export`` function,
                          only valid when accelerator='onnxruntime'/'openvino',
@@ -715,6 +837,8 @@ class InferenceOptimizer(BaseInferenceOptimizer):
                          and order of channels depend on how the original model was trained.
         :return:            A accelerated torch.nn.Module if quantization is sucessful.
         """
+        if cache_dir is not None:
+            return cached_convert(InferenceOptimizer.quantize, locals())
         invalidInputError(precision in ['int8', 'fp16', 'bf16'],
                           "Only support 'int8', 'bf16', 'fp16' now, "
                           "no support for {}.".format(precision))
@@ -947,6 +1071,7 @@ class InferenceOptimizer(BaseInferenceOptimizer):
               inplace: bool = False,
               weights_prepack: Optional[bool] = None,
               enable_onednn: bool = True,
+              cache_dir: Optional[str] = None,
               **kwargs):
         """
         Trace a torch.nn.Module and convert it into an accelerated module for inference.
@@ -1016,6 +1141,10 @@ class InferenceOptimizer(BaseInferenceOptimizer):
                               ignored. For more details, please refer https://github.com/pytorch/
                               pytorch/tree/master/torch/csrc/jit/codegen/
                               onednn#pytorch---onednn-graph-api-bridge.
+        :param cache_dir: (optional) A directory to cache the traced model. If a model has been
+                          traced with the same weights, input_sample, arguments and CPU
+                          features, it will be loaded from the cache instead of traced again.
+                          Default to ``None`` meaning no cache.
         :param **kwargs: Other extra advanced settings include:
                          1. those be passed to torch.onnx.export function,
                          only valid when accelerator='onnxruntime'/'openvino',
@@ -1030,6 +1159,8 @@ class InferenceOptimizer(BaseInferenceOptimizer):
                          For more details about model optimizer, you can see mo --help .
         :return: Model with different acceleration.
         """
+        if cache_dir is not None:
+            return cached_convert(InferenceOptimizer.trace, locals())
         invalidInputError(
             isinstance(model, nn.Module) and not isinstance(model, AcceleratedLightningModule),
             "Expect a nn.Module instance that is not traced or quantized"
@@ -1182,16 +1313,25 @@ class InferenceOptimizer(BaseInferenceOptimizer):
     @staticmethod
     def to_multi_instance(model: nn.Module, num_processes: int = 4,
                           cores_per_process: int = None,
-                          cpu_for_each_process: List[List[int]] = None) -> _MultiInstanceModel:
+                          cpu_for_each_process: List[List[int]] = None,
+                          shared_memory: bool = False) -> _MultiInstanceModel:
         """
         Transform a model to multi-instance inference model.
 
+        The returned model runs a list of batches (or a DataLoader) with ``model(input_data)``,
+        which returns the outputs in the order of the batches, or yields (index, output) in
+        the order the batches are completed with ``model.stream(input_data)``.
+
         :param model: The model to transform.
         :param num_processes: The number of processes to use, default to 4.
         :param cores_per_process: Number of CPU cores used by each process,
             default to `None`, means decided automatically.
         :param cpu_for_each_process: Specify the CPU cores used by each process,
             default to `None`, if set, it will override `num_processes` and `cores_per_process`.
+        :param shared_memory: Whether to pass the batches and outputs made up of tensors
+            through a ring of shared memory slabs reused across calls, in place of pickling
+            them through a queue, default to `False`. The slabs are in /dev/shm, make sure it
+            is large enough to hold 2 * num_processes batches with their outputs.
         :return: Model with multi-instance inference acceleration.
         """
         invalidInputError(isinstance(num_processes, int) and num_processes > 0,
@@ -1209,6 +1349,12 @@ class InferenceOptimizer(BaseInferenceOptimizer):
         recv_queue = mp.Queue()
         next_idx = mp.Value('i', 0, lock=True)
 
+        if shared_memory:
+            # start the resource tracker before forking, so that the slabs attached by the
+            # workers are tracked (and unlinked) by the same tracker as the main process
+            from multiprocessing import resource_tracker
+            resource_tracker.ensure_running()
+
         KMP_AFFINITY = os.environ.get("KMP_AFFINITY", "")
         OMP_NUM_THREADS = os.environ.get("OMP_NUM_THREADS", "")
         if cpu_for_each_process is None:
@@ -1240,7 +1386,76 @@ class InferenceOptimizer(BaseInferenceOptimizer):
         os.environ["KMP_AFFINITY"] = KMP_AFFINITY
         os.environ["OMP_NUM_THREADS"] = OMP_NUM_THREADS
 
-        return _MultiInstanceModel(model, ps, send_queue, recv_queue, next_idx)
+        return _MultiInstanceModel(model, ps, send_queue, recv_queue, next_idx,
+                                   shared_memory=shared_memory)
+
+    @staticmethod
+    def to_bucketed(model: nn.Module,
+                    buckets: Sequence[int],
+                    dims: Union[int, Sequence[Optional[int]]] = 1,
+                    pad_value=0,
+                    precision: str = 'fp32',
+                    accelerator: Optional[str] = None,
+                    max_models: int = 4,
+                    output_dims: Union[int, Sequence[Optional[int]], None] = None,
+                    **kwargs) -> _BucketedModel:
+        """
+        Transform a model taking inputs of variable sizes (e.g. sequence length) to a model
+        which pads the inputs to the smallest bucket they fit in, and runs them with an
+        accelerated model specialized for the shapes of the bucket.
+
+        The accelerated model of a bucket is traced (or quantized if precision is not 'fp32')
+        on the first padded inputs falling in the bucket, and at most ``max_models`` of them
+        are cached, the least recently used one is dropped when exceeded. Pass ``cache_dir``
+        to reload the dropped ones from disk instead of converting them again. Inputs larger
+        than the largest bucket are run with the original model.
+
+        The models exported to onnx (i.e. accelerator='onnxruntime' or 'openvino') only have
+        the batch dim (dim 0) dynamic by default, so that the padded dims are static, or no
+        dynamic dims if the batch dim is padded. Pass ``dynamic_axes`` to override it.
+
+        Padding must not change the result of the unpadded part, e.g. pad the token ids and
+        the attention mask of a transformer with 0.
+
+        :param model: The model to transform.
+        :param buckets: The sizes to pad the inputs to, e.g. [32, 64, 128, 256].
+        :param dims: The dim to pad of each input, or an int for all the inputs,
+               None means not padding that input, default to 1.
+        :param pad_value: The value to pad each input with, or a number for all the inputs,
+               default to 0.
+        :param precision: 'fp32' to use InferenceOptimizer.trace, 'bf16', 'fp16' or 'int8' to
+               use InferenceOptimizer.quantize, which calibrates an int8 model on the padded
+               inputs unless ``calib_data`` is given, default to 'fp32'.
+        :param accelerator: The accelerator to use, default to None.
+        :param max_models: The max number of accelerated models cached, default to 4. It
+               only bounds the number of the models, not their memory, and each of them has
+               its own copy of the weights, so choose it by the size of the model.
+        :param output_dims: The dim of each output to cut back to the size of the inputs, or
+               an int for all the outputs, None means not cutting that output, default to
+               None, i.e. return the padded outputs.
+        :param **kwargs: Other arguments passed to InferenceOptimizer.trace/quantize.
+        :return: Model with shape-bucketed inference acceleration.
+        """
+        invalidInputError(precision in ('fp32', 'bf16', 'fp16', 'int8'),
+                          f"precision should be one of 'fp32', 'bf16', 'fp16' and 'int8', "
+                          f"but got {precision}")
+        # dynamic_axes=True only makes dim 0 dynamic, see export_to_onnx
+        pad_dims = dims if isinstance(dims, (list, tuple)) else [dims]
+        kwargs.setdefault('dynamic_axes', 0 not in pad_dims)
+
+        def convert_fn(model, input_sample):
+            if precision == 'fp32':
+                return InferenceOptimizer.trace(model, input_sample=input_sample,
+                                                accelerator=accelerator, **kwargs)
+            quantize_kwargs = dict(kwargs)
+            if precision == 'int8':
+                quantize_kwargs.setdefault('calib_data', input_sample)
+            return InferenceOptimizer.quantize(model, precision=precision,
+                                               accelerator=accelerator,
+                                               input_sample=input_sample, **quantize_kwargs)
+
+        return _BucketedModel(model, buckets, convert_fn, dims=dims, pad_value=pad_value,
+                              max_models=max_models, output_dims=output_dims)
 
 
 def _signature_check(function):
@@ -13,13 +13,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
+from concurrent.futures import ThreadPoolExecutor
+
 import torch
+from torch.utils.data import DataLoader
 
 from bigdl.nano.pytorch.lightning import LightningModule
 from bigdl.nano.utils.common import invalidInputError
 from bigdl.nano.utils.common import AcceleratedModel
 import numpy as np
-from typing import Sequence
+from typing import Sequence, Union, List
 
 
 class AcceleratedLightningModule(AcceleratedModel, LightningModule):
@@ -44,6 +47,61 @@ class AcceleratedLightningModule(AcceleratedModel, LightningModule):
     def forward_step(self, *inputs):
         return self.model(*inputs)
 
+    def async_predict(self,
+                      input_data: Union[DataLoader, List[torch.Tensor], List[List[torch.Tensor]]],
+                      num_requests: int = 0) -> List[torch.Tensor]:
+        """
+        Perfrom model inference using async mode.
+
+        :param input_data: Input data to be inferenced.
+                           Users can put multiple input data in a list or
+                           put all data in a DataLoader to infer and get results of all input data.
+                           Can be torch.utils.data.dataloader.DataLoader and
+                           List[torch.Tensor] or
+                           List[List[torch.Tensor]] if the model has multiple inputs.
+                           If input_data is a DataLoader object,the format in DataLoader should be
+                           (x1, x2, ..., xn, y).
+        :param num_requests: Number of requests running concurrently, each in its own thread,
+                             the threads of the model are split equally among them.
+                             Defaults to 0.
+                             If 0, it will be set to the number of threads of the model,
+                             i.e. each request runs on one thread.
+
+        :return: A List of torch.Tensor containing result of each input
+        """
+        input_list = self._get_input_list(input_data)
+        if len(input_list) == 0:
+            return []
+        context_manager = getattr(self, "_nano_context_manager", None)
+        if context_manager is None:
+            from bigdl.nano.pytorch.context_manager import generate_context_manager
+            context_manager = generate_context_manager()
+        total_threads = context_manager.thread_num or torch.get_num_threads()
+        num_requests = min(num_requests or total_threads, len(input_list))
+
+        context_type = type(context_manager)
+
+        def run(inputs):
+            # inference mode and autocast are thread local, so each request enters its own
+            # context, and the global settings (e.g. onednn fusion) are set once below
+            with context_type(accelerator=context_manager.accelerator, enable_onednn=False):
+                return self(*inputs)
+
+        with context_type(thread_num=context_manager.thread_num,
+                          accelerator=context_manager.accelerator,
+                          enable_onednn=context_manager.enable_onednn):
+            torch.set_num_threads(max(1, total_threads // num_requests))
+            with ThreadPoolExecutor(num_requests) as executor:
+                return list(executor.map(run, input_list))
+
+    @staticmethod
+    def _get_input_list(input_data):
+        # a DataLoader or a list of inputs, to a list of tuples of inputs
+        if isinstance(input_data, DataLoader):
+            return [tuple(data)[:-1] for data in input_data]
+        return [tuple(inputs) if isinstance(inputs, (list, tuple)) else (inputs,)
+                for inputs in input_data]
+
     @staticmethod
     def tensors_to_numpy(tensors):
         # TODO: add more type transformation here
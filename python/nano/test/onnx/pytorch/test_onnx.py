@@ -322,6 +322,26 @@ class TestOnnx(TestCase):
         accmodel(x2)
         accmodel(x3)
 
+    def test_onnx_async_predict(self):
+        model = MultiInputModel()
+        x1 = torch.randn(100, 28 * 28)
+        x2 = torch.randn(100, 28 * 28)
+        y = torch.zeros(100).long()
+        train_loader = DataLoader(TensorDataset(x1, x2, y), batch_size=32)
+        onnx_model = InferenceOptimizer.trace(model, accelerator="onnxruntime",
+                                              input_sample=train_loader)
+
+        # do async_predict use dataloader as input
+        result = onnx_model.async_predict(train_loader, num_requests=3)
+        for res, (x1, x2, _) in zip(result, train_loader):
+            np.testing.assert_almost_equal(res.numpy(), onnx_model(x1, x2).numpy(), decimal=5)
+
+        # do async_predict use List of List of Tensor as input
+        x = [[torch.randn(10, 28 * 28), torch.randn(10, 28 * 28)] for i in range(3)]
+        result = onnx_model.async_predict(x, num_requests=2)
+        for res in result:
+            assert res.shape == (10, 2)
+
 
 if __name__ == '__main__':
     pytest.main([__file__])
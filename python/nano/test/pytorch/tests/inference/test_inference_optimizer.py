@@ -15,6 +15,7 @@
 #
 
 import os
+import tempfile
 import numpy as np
 from torch import nn
 import torch
@@ -537,6 +538,63 @@ class TestInferencePipeline(TestCase):
             np.testing.assert_allclose(pred1, pred2, atol=1e-4,
                                        err_msg=f"\npred1: {pred1}\npred2: {pred2}\n")
 
+    def test_multi_instance_shared_memory(self):
+        model = MultipleInputNet()
+        model.eval()
+        input_data = [(torch.randn(i + 1, 10), torch.randn(i + 1, 10)) for i in range(20)]
+        with torch.no_grad():
+            preds1 = [model(*b) for b in input_data]
+
+        multi_instance_model = InferenceOptimizer.to_multi_instance(model, num_processes=1,
+                                                                    cores_per_process=1,
+                                                                    shared_memory=True)
+        # the slabs are reused (and grown) across calls
+        for _ in range(2):
+            preds2 = multi_instance_model(input_data)
+            for (pred1, pred2) in zip(preds1, preds2):
+                np.testing.assert_allclose(pred1, pred2, atol=1e-4)
+
+        # test streaming, the outputs are yielded in completion order with their index
+        results = dict(multi_instance_model.stream(input_data))
+        assert sorted(results) == list(range(len(input_data)))
+        for idx, pred1 in enumerate(preds1):
+            np.testing.assert_allclose(pred1, results[idx], atol=1e-4)
+
+        # test an early stop doesn't affect the next call
+        stream = multi_instance_model.stream(input_data)
+        next(stream)
+        stream.close()
+        preds2 = multi_instance_model(input_data)
+        for (pred1, pred2) in zip(preds1, preds2):
+            np.testing.assert_allclose(pred1, pred2, atol=1e-4)
+
+    def test_to_bucketed(self):
+        class SeqNet(nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.embedding = nn.Embedding(100, 8)
+
+            def forward(self, ids, mask):
+                hidden = self.embedding(ids) * mask.unsqueeze(-1)
+                return hidden, hidden.sum(dim=1)
+
+        model = SeqNet()
+        model.eval()
+        bucketed_model = InferenceOptimizer.to_bucketed(model, buckets=[4, 8, 16],
+                                                        accelerator="jit", max_models=2,
+                                                        output_dims=[1, None])
+        for length in [3, 4, 7, 3, 12, 20]:
+            ids = torch.randint(0, 100, (2, length))
+            mask = torch.ones(2, length)
+            with torch.no_grad():
+                hidden1, pooled1 = model(ids, mask)
+            hidden2, pooled2 = bucketed_model(ids, mask)
+            assert hidden2.shape == hidden1.shape
+            np.testing.assert_allclose(hidden1, hidden2, atol=1e-5)
+            np.testing.assert_allclose(pooled1, pooled2, atol=1e-5)
+        # 8 is the least recently used one, 20 is larger than all buckets
+        assert bucketed_model.cached_buckets == [4, 16]
+
     def test_grid_search_model_with_accelerator(self):
         inference_opt = InferenceOptimizer()
 
@@ -552,6 +610,93 @@ class TestInferencePipeline(TestCase):
         with pytest.raises(RuntimeError):
             acc_model, option = inference_opt.get_best_model(accelerator="onnxruntime")
 
+    def test_optimize_with_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            results = []
+            for _ in range(2):
+                inference_opt = InferenceOptimizer()
+                inference_opt.optimize(model=self.model,
+                                       training_data=self.train_loader,
+                                       validation_data=self.test_loader,
+                                       metric=self.metric,
+                                       direction="max",
+                                       thread_num=1,
+                                       includes=["jit_fp32", "static_int8"],
+                                       cache_dir=cache_dir)
+                results.append(inference_opt.optimized_model_dict)
+            # the second run loads the models and reuses the measured results
+            for method in ("original", "jit_fp32", "static_int8"):
+                if results[0][method]["status"] == "successful":
+                    assert results[1][method]["latency"] == results[0][method]["latency"]
+                    assert results[1][method]["accuracy"] == results[0][method]["accuracy"]
+            x = next(iter(self.train_loader))[0]
+            with torch.no_grad():
+                np.testing.assert_allclose(results[0]["jit_fp32"]["model"](x),
+                                           results[1]["jit_fp32"]["model"](x), atol=1e-5)
+
+            # the latency is measured again with another thread_num
+            inference_opt = InferenceOptimizer()
+            inference_opt.optimize(model=self.model,
+                                   training_data=self.train_loader,
+                                   thread_num=2,
+                                   includes=["jit_fp32"],
+                                   cache_dir=cache_dir)
+            assert inference_opt.optimized_model_dict["jit_fp32"]["latency"] != \
+                results[0]["jit_fp32"]["latency"]
+
+    def test_optimize_multi_process(self):
+        inference_opt = InferenceOptimizer()
+        inference_opt.optimize(model=self.model,
+                               training_data=self.train_loader,
+                               thread_num=1,
+                               includes=["jit_fp32", "onnxruntime_fp32", "openvino_fp32"],
+                               num_processes=2)
+        sequential_opt = InferenceOptimizer()
+        sequential_opt.optimize(model=self.model,
+                                training_data=self.train_loader,
+                                thread_num=1,
+                                includes=["jit_fp32", "onnxruntime_fp32", "openvino_fp32"])
+        x = next(iter(self.train_loader))[0]
+        for method, result in sequential_opt.optimized_model_dict.items():
+            assert inference_opt.optimized_model_dict[method]["status"] == result["status"]
+            if result["status"] == "successful":
+                model = inference_opt.optimized_model_dict[method]["model"]
+                with InferenceOptimizer.get_context(model, result["model"]):
+                    np.testing.assert_allclose(model(x), result["model"](x), atol=1e-4)
+
+    def test_optimize_time_budget(self):
+        inference_opt = InferenceOptimizer()
+        inference_opt.optimize(model=self.model,
+                               training_data=self.train_loader,
+                               thread_num=1,
+                               includes=["jit_fp32", "onnxruntime_fp32"],
+                               time_budget=0)
+        optim_dict = inference_opt.optimized_model_dict
+        # original is always tested
+        assert optim_dict["original"]["status"] == "successful"
+        for method in ("jit_fp32", "onnxruntime_fp32"):
+            assert optim_dict[method]["status"] in ("out of time budget", "lack dependency")
+
+    def test_trace_with_cache(self):
+        model = MultipleInputNet()
+        x1, x2 = torch.randn(10, 10), torch.randn(10, 10)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            jit_model = InferenceOptimizer.trace(model, accelerator="jit",
+                                                 input_sample=(x1, x2), cache_dir=cache_dir)
+            assert len(os.listdir(os.path.join(cache_dir, "models"))) == 1
+            loaded_model = InferenceOptimizer.trace(model, accelerator="jit",
+                                                    input_sample=(x1, x2), cache_dir=cache_dir)
+            assert len(os.listdir(os.path.join(cache_dir, "models"))) == 1
+            with InferenceOptimizer.get_context(jit_model, loaded_model):
+                np.testing.assert_allclose(jit_model(x1, x2), loaded_model(x1, x2), atol=1e-5)
+
+            # changing the weights makes a new cached model
+            with torch.no_grad():
+                model.dense1.weight.add_(1)
+            InferenceOptimizer.trace(model, accelerator="jit",
+                                     input_sample=(x1, x2), cache_dir=cache_dir)
+            assert len(os.listdir(os.path.join(cache_dir, "models"))) == 2
+
     def test_grid_search_model_with_precision(self):
         inference_opt = InferenceOptimizer()
 
@@ -556,6 +556,22 @@ class IPEXJITInference_gt_1_10:
         new_model(image_latents2, torch.Tensor([980]).long(), encoder_hidden_states2)
 
 
+    def test_jit_async_predict(self):
+        model = InferenceOptimizer.trace(self.model, accelerator="jit",
+                                         use_ipex=False, input_sample=self.data_sample)
+        x = [torch.rand((2, 3, 224, 224)) for _ in range(4)]
+        result = model.async_predict(x, num_requests=2)
+        with InferenceOptimizer.get_context(model):
+            for res, data in zip(result, x):
+                torch.testing.assert_close(res, model(data))
+
+        # multiple inputs from a DataLoader
+        model = InferenceOptimizer.trace(MultipleInputNet(), accelerator="jit",
+                                         input_sample=(torch.rand(2, 10), torch.rand(2, 10)))
+        ds = TensorDataset(torch.rand(10, 10), torch.rand(10, 10), torch.ones(10))
+        result = model.async_predict(DataLoader(ds, batch_size=4))
+        assert [res.shape[0] for res in result] == [4, 4, 2]
+
 class IPEXJITInference_lt_1_10:
     def test_placeholder(self):
         pass
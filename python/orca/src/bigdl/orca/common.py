@@ -26,6 +26,7 @@ class OrcaContextMeta(type):
     _serialize_data_creator = False
     _train_data_store = "DRAM"
     __shard_size = None
+    __arrow_conversion = True
 
     @property
     def log_output(cls):
@@ -123,6 +124,24 @@ class OrcaContextMeta(type):
                               "shard size should be either None or a positive integer.")
         cls.__shard_size = value
 
+    @property
+    def _arrow_conversion(cls):
+        """
+        Whether to convert Spark DataFrame input to SparkXShards through Arrow in
+        fit/predict/evaluate of the Orca estimators, which builds the ndarrays of each shard
+        from the Arrow columns instead of converting the Rows one by one. It only applies to
+        Spark 3 and DataFrames whose feature and label columns are all float, double, int,
+        long, (nested) arrays of them or vectors, otherwise the Rows are converted.
+        Default to be True.
+        """
+        return cls.__arrow_conversion
+
+    @_arrow_conversion.setter
+    def _arrow_conversion(cls, value):
+        invalidInputError(isinstance(value, bool),
+                          "_arrow_conversion should either be True or False")
+        cls.__arrow_conversion = value
+
     @property
     def barrier_mode(cls):
         """
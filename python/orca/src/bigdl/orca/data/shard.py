@@ -304,27 +304,16 @@ class SparkXShards(XShards):
         """
         class_name = self._get_class_name()
         if class_name == 'pandas.core.frame.DataFrame':
-            import pandas as pd
-
-            rdd = self.rdd \
-                .flatMap(lambda df: df.apply(lambda row: (row[0], row.values.tolist()), axis=1)
-                         .values.tolist()) \
-                .partitionBy(num_partitions)
-
             schema = self.get_schema()
+            # shuffle a sub-frame of each DataFrame for each partition instead of the rows,
+            # the rows are placed by the hash of their first column
+            rdd = self.rdd \
+                .flatMap(lambda df: split_pd_df_by_hash(df, df.iloc[:, 0], num_partitions)) \
+                .partitionBy(num_partitions, lambda idx: idx)
 
-            def merge_rows(iter):
-                data = [value[1] for value in list(iter)]
-                if data:
-                    df = pd.DataFrame(data=data, columns=schema['columns']) \
-                        .astype(schema['dtypes'])
-                    return [df]
-                else:
-                    # no data in this partition
-                    return iter
-
-            repartitioned_shard = self._create(rdd.mapPartitions(merge_rows),
-                                               class_name=class_name)
+            repartitioned_shard = self._create(
+                rdd.mapPartitions(lambda iter: merge_pd_dfs(iter, schema)),
+                class_name=class_name)
         elif class_name == 'builtins.list':
             if num_partitions > self.rdd.getNumPartitions():
                 rdd = self.rdd \
@@ -413,37 +402,26 @@ class SparkXShards(XShards):
         :return: a new SparkXShards.
         """
         if self._get_class_name() == 'pandas.core.frame.DataFrame':
-            import pandas as pd
             schema = self.get_schema()
             # if partition by a column
             if isinstance(cols, str):
                 if not isinstance(schema, Dict) or cols not in schema['columns']:
                     invalidInputError(False,
                                       "The partition column is not in the DataFrame")
-                # change data to key value pairs
-                rdd = self.rdd.flatMap(
-                    lambda df: df.apply(
-                        lambda row: (row[cols], row.values.tolist()), axis=1).values.tolist())
-
                 partition_num = self.rdd.getNumPartitions() if not num_partitions \
                     else num_partitions
-                # partition with key
-                partitioned_rdd = rdd.partitionBy(partition_num)
+                # split each DataFrame into a sub-frame for each partition by the column,
+                # and shuffle the sub-frames
+                partitioned_rdd = self.rdd \
+                    .flatMap(lambda df: split_pd_df_by_hash(df, df[cols], partition_num)) \
+                    .partitionBy(partition_num, lambda idx: idx)
             else:
                 invalidInputError(False,
                                   "Only support partition by a column name")
 
-            def merge(iterator):
-                data = [value[1] for value in list(iterator)]
-                if data:
-                    df = pd.DataFrame(data=data, columns=schema['columns']).astype(schema['dtypes'])
-                    return [df]
-                else:
-                    # no data in this partition
-                    return []
-
-            # merge records to df in each partition
-            partitioned_shard = SparkXShards(partitioned_rdd.mapPartitions(merge))
+            # merge sub-frames to df in each partition
+            partitioned_shard = SparkXShards(
+                partitioned_rdd.mapPartitions(lambda iter: merge_pd_dfs(iter, schema)))
             self._uncache()
             return partitioned_shard
         else:
@@ -22,9 +22,12 @@ from bigdl.dllib.utils.log4Error import *
 import pyspark.sql.functions as F
 from typing import (
     TYPE_CHECKING,
+    Any,
     Dict,
+    Iterator,
     List,
     Optional,
+    Tuple,
     Type,
     Union,
 )
@@ -41,6 +44,7 @@ if TYPE_CHECKING:
     from pyspark.sql.dataframe import DataFrame
     from ray.data.dataset import Dataset
     from bigdl.orca.data.ray_xshards import RayXShards
+    import pandas as pd
 
 
 def list_s3_file(file_path, env):
@@ -593,3 +597,44 @@ def check_cols_exists(columns: List[str],
         invalidInputError(False,
                           "elements in column should be str or list of str but"
                           " get " + str(column))
+
+
+def split_pd_df_by_hash(df: "pd.DataFrame", keys: "pd.Series",
+                        num_partitions: int) -> List[Tuple[int, "pd.DataFrame"]]:
+    """
+    Split a pandas DataFrame into a sub-frame for each target partition of its rows, in the
+    same way as RDD.partitionBy places the keys, i.e. portable_hash(key) % num_partitions.
+
+    :param df: a pandas DataFrame.
+    :param keys: a pandas Series of the key of each row in df.
+    :param num_partitions: the number of target partitions.
+    :return: a list of (partition index, sub-frame) for the non-empty partitions.
+    """
+    from pyspark.rdd import portable_hash
+    import pandas as pd
+    if len(df) == 0:
+        return []
+    # only hash the distinct keys, missing keys are coded as -1, i.e. hashed as None
+    codes, uniques = pd.factorize(keys, sort=False)
+    partitions = np.array([portable_hash(key) % num_partitions for key in uniques] +
+                          [portable_hash(None) % num_partitions], dtype=np.int64)
+    partition_ids = partitions[codes]
+    return [(int(idx), sub_df) for idx, sub_df in df.groupby(partition_ids, sort=False)]
+
+
+def merge_pd_dfs(iterator: Iterator[Tuple[int, "pd.DataFrame"]],
+                 schema: Dict[str, Any]) -> List["pd.DataFrame"]:
+    """
+    Concatenate the sub-frames shuffled to a partition into one pandas DataFrame.
+
+    :param iterator: an iterator of (partition index, sub-frame).
+    :param schema: the schema of the sub-frames, with the columns and dtypes.
+    :return: a list of the DataFrame, or an empty list if there is no data in the partition.
+    """
+    import pandas as pd
+    dfs = [df for _, df in iterator]
+    if not dfs:
+        return []
+    df = pd.concat(dfs, ignore_index=True)
+    df.columns = schema['columns']
+    return [df.astype(schema['dtypes'])]
@@ -25,9 +25,9 @@ class LifeCycle(metaclass=ABCMeta):
         torch.set_num_threads(cores_per_node)
 
     def setup_torch_distribute(self, tcp_store_host, tcp_store_port, world_rank,
-                               world_size):
+                               world_size, store_prefix=None):
         self._init_torch_ddp(tcp_store_host, tcp_store_port, world_rank,
-                             world_size)
+                             world_size, store_prefix)
         self.setup_ddp_components()
 
     def setup_torch_estimator(self, world_rank, world_size):
@@ -65,10 +65,13 @@ class LifeCycle(metaclass=ABCMeta):
         pass
 
     def _init_torch_ddp(self, tcp_store_host, tcp_store_port, world_rank,
-                        world_size):
+                        world_size, store_prefix=None):
         """A runner will contain `rank`, `backend` and `size` after setup_torch_distribute."""
         import torch.distributed as dist
         client_store = dist.TCPStore(tcp_store_host, tcp_store_port, -1, False)
+        if store_prefix is not None:
+            # a store shared by several process groups over time
+            client_store = dist.PrefixStore(store_prefix, client_store)
         dist.init_process_group(
             backend="gloo",
             store=client_store,
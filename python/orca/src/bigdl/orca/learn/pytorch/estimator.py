@@ -46,6 +46,7 @@ class Estimator(object):
                    sync_stats: bool=False,
                    log_level: int=logging.INFO,
                    log_to_driver: bool=True,
+                   persistent_workers: bool=False,
                    ) -> Union['PyTorchRayEstimator',
                               'PyTorchSparkEstimator',
                               'PyTorchPySparkEstimator',
@@ -87,6 +88,12 @@ class Estimator(object):
                Default: logging.INFO.
         :param log_to_driver: Whether to display executor log on driver in cluster mode for spark
                backend. Default: True.
+        :param persistent_workers: Whether to keep the workers (including the models, optimizers
+               and the process group) in the executors between fit, evaluate and predict for
+               spark backend, which are created again only if some of them are lost, and load
+               the state from the driver only if it is changed, e.g. by load. It requires
+               Spark 3.0 or above and works best with one worker per executor, and only one
+               estimator with persistent workers should be used at a time. Default: False.
 
         :return: A Estimator object for PyTorch.
         """
@@ -126,6 +133,7 @@ class Estimator(object):
                                            log_level=log_level,
                                            model_dir=model_dir,
                                            log_to_driver=log_to_driver,
+                                           persistent_workers=persistent_workers,
                                            )
         else:
             from bigdl.dllib.utils.log4Error import invalidInputError
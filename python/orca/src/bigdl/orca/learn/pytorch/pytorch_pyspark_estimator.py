@@ -21,12 +21,17 @@ import os
 import shutil
 import tempfile
 import logging
+import uuid
 
 from pyspark.sql.dataframe import DataFrame
 
 from bigdl.dllib.utils.file_utils import is_local_path
-from bigdl.orca.learn.pytorch.pytorch_pyspark_worker import PytorchPysparkWorker
+from bigdl.orca.learn.pytorch.pytorch_pyspark_worker import PytorchPysparkWorker, get_runner, \
+    release_resident_runners
 from bigdl.orca.learn.pytorch.utils import process_stats
+from bigdl.orca.learn.pytorch.stream_dataset import spill_partition, shards_to_creator
+from bigdl.orca.learn.pytorch.sharded_checkpoint import is_sharded_checkpoint, \
+    load_sharded_state_dict
 from bigdl.orca.learn.utils import maybe_dataframe_to_xshards, dataframe_to_xshards, \
     convert_predict_xshards_to_dataframe, make_data_creator, update_predict_xshards, \
     reload_dataloader_creator, process_xshards_of_pandas_dataframe, add_predict_to_pd_xshards
@@ -95,6 +100,11 @@ def partition_to_creator(partition):
     return data_creator
 
 
+def _tag_shards(rdd, kind):
+    # (partition index, (kind, shard)) to put the shards of the same index of rdds together
+    return rdd.mapPartitionsWithIndex(lambda idx, iter: ((idx, (kind, shard)) for shard in iter))
+
+
 def parse_model_dir(model_dir):
     if model_dir and model_dir.startswith("dbfs:/"):
         model_dir = "/dbfs/" + model_dir[len("dbfs:/"):]
@@ -117,7 +127,8 @@ class PyTorchPySparkEstimator(BaseEstimator):
             sync_stats: bool=True,
             log_level: int=logging.INFO,
             model_dir: Optional[str]=None,
-            log_to_driver: bool=True):
+            log_to_driver: bool=True,
+            persistent_workers: bool=False):
         logging.basicConfig(level=log_level,
                             format='[%(asctime)s] %(levelname)-8s %(message)s',
                             datefmt='%Y-%m-%d %H:%M:%S'
@@ -139,6 +150,19 @@ class PyTorchPySparkEstimator(BaseEstimator):
         self.model_dir = parse_model_dir(model_dir)
         self.use_tqdm = use_tqdm
 
+        self.persistent_workers = persistent_workers
+        # the runners of persistent workers are kept in the python workers by this id
+        self._estimator_id = uuid.uuid4().hex if persistent_workers else None
+        # the version of the state on the driver, which is loaded by the persistent workers
+        # only if they have a different version
+        self._state_version = 0
+        self._job_id = 0
+        self._tcp_store = None
+        self._cluster_info = None
+        # the sharded checkpoint the state is loaded from, by the workers directly and by the
+        # driver only when needed
+        self._checkpoint_path = None
+
         self.model_creator = model_creator
         self.optimizer_creator = optimizer_creator
 
@@ -188,13 +212,34 @@ class PyTorchPySparkEstimator(BaseEstimator):
 
     def create_tcpstore_server(self) -> 'TCPStore':
         import torch.distributed as dist
+        if self._tcp_store is not None:
+            return self._tcp_store
         server_store = dist.TCPStore(self.ip, self.tcp_store_port, -1, True,
                                      dist.constants.default_pg_timeout)
+        if self.persistent_workers:
+            # shared by the process groups of the persistent workers with different prefixes
+            self._tcp_store = server_store
         return server_store
 
     def _get_cluster_info(self, sc):
-        cluster_info = self.workerRDD.barrier().mapPartitions(find_ip_and_free_port).collect()
-        return cluster_info
+        # the ranks of the persistent workers are decided by the cluster info they are created
+        # with, so it is only fetched once
+        if self._cluster_info is None or not self.persistent_workers:
+            self._cluster_info = \
+                self.workerRDD.barrier().mapPartitions(find_ip_and_free_port).collect()
+        return self._cluster_info
+
+    def _get_persistent_params(self):
+        if not self.persistent_workers:
+            return {}
+        self._job_id += 1
+        return dict(state_version=self._state_version,
+                    trained_state_version=self._job_id,
+                    driver_tcp_store_prefix=str(self._job_id))
+
+    def _bump_state_version(self):
+        self._job_id += 1
+        self._state_version = self._job_id
 
     def fit(self,
             data: Union['SparkXShards', 'SparkDataFrame', Callable[[Dict, int], 'DataLoader']],
@@ -216,7 +261,10 @@ class PyTorchPySparkEstimator(BaseEstimator):
 
         :param data: An instance of SparkXShards, a Spark DataFrame or a function that
                takes config and batch_size as argument and returns a PyTorch DataLoader for
-               training.
+               training. For SparkXShards and Spark DataFrame, if "stream_data" is True in
+               config, each worker spills its partition to local disk and streams it to the
+               model, shuffling at most "shuffle_buffer_size" (default 10000) records at a
+               time, instead of holding the whole partition in memory.
         :param epochs: The number of epochs to train the model. Default is 1.
         :param batch_size: Total batch size for all workers used for training. Each worker's batch
                size would be this value divide the total number of workers. Default is 32.
@@ -283,8 +331,13 @@ class PyTorchPySparkEstimator(BaseEstimator):
         init_params = dict(
             mode="fit",
             state_dict=state_dict,
-            cluster_info=cluster_info)
+            cluster_info=cluster_info,
+            checkpoint_path=self._checkpoint_path)
         init_params.update(self.worker_init_params)
+        init_params.update(self._get_persistent_params())
+        estimator_id = self._estimator_id
+        # the persistent workers are left in an unknown state if the training fails
+        self._bump_state_version()
 
         # Check uniqueness of the MainCallback
         callbacks = callbacks or []
@@ -310,13 +363,42 @@ class PyTorchPySparkEstimator(BaseEstimator):
                                                                             label_cols,
                                                                             validation_data, "fit")
 
-            if validation_data is None:
+            if self.config.get("stream_data", False):
+                has_validation = validation_data is not None
+
+                def transform_func(iter, init_params, param):
+                    spills = spill_partition(iter, num_kinds=2)
+                    try:
+                        param["data_creator"] = shards_to_creator(spills[0])
+                        if has_validation:
+                            param["validation_data_creator"] = \
+                                shards_to_creator(spills[1], shuffle=False)
+                        runner = get_runner(init_params, estimator_id)
+                        result = runner.train_epochs(**param)
+                        if estimator_id is None:
+                            runner.shutdown()
+                        return result
+                    finally:
+                        for spill in spills:
+                            spill.delete()
+
+                data_rdd = data.rdd.map(lambda shard: (0, shard))  # type:ignore
+                if has_validation:
+                    # instead of zipping the materialized partitions of train and validation
+                    data_rdd = _tag_shards(data.rdd, 0).union(  # type:ignore
+                        _tag_shards(validation_data.rdd, 1))  # type:ignore
+                    data_rdd = data_rdd.partitionBy(self.num_workers, lambda idx: idx).values()
+                res = data_rdd.barrier().mapPartitions(
+                    lambda iter: transform_func(iter, init_params, params)).collect()
+
+            elif validation_data is None:
                 def transform_func(iter, init_params, param):
                     partition_data = list(iter)
                     param["data_creator"] = partition_to_creator(partition_data)
-                    runner = PytorchPysparkWorker(**init_params)
+                    runner = get_runner(init_params, estimator_id)
                     result = runner.train_epochs(**param)
-                    runner.shutdown()
+                    if estimator_id is None:
+                        runner.shutdown()
                     return result
 
                 data_rdd = data.rdd  # type:ignore
@@ -330,9 +412,10 @@ class PyTorchPySparkEstimator(BaseEstimator):
                     valid_list = [x for data_tuple in data_tuple_list for x in data_tuple[1]]
                     param["data_creator"] = partition_to_creator(data_list)
                     param["validation_data_creator"] = partition_to_creator(valid_list)
-                    runner = PytorchPysparkWorker(**init_params)
+                    runner = get_runner(init_params, estimator_id)
                     result = runner.train_epochs(**param)
-                    runner.shutdown()
+                    if estimator_id is None:
+                        runner.shutdown()
                     return result
 
                 train_rdd = data.rdd.mapPartitions(lambda iter: [list(iter)])  # type:ignore
@@ -351,7 +434,7 @@ class PyTorchPySparkEstimator(BaseEstimator):
             params["validation_data_creator"] = reload_dataloader_creator(validation_data)
 
             def transform_func(iter, init_param, param):  # type:ignore
-                return PytorchPysparkWorker(**init_param).train_epochs(**param)
+                return get_runner(init_param, estimator_id).train_epochs(**param)
 
             res = self.workerRDD.barrier().mapPartitions(
                 lambda iter: transform_func(iter, init_params, params)).collect()
@@ -363,6 +446,10 @@ class PyTorchPySparkEstimator(BaseEstimator):
             self.state_dict = res[0]  # state dicts of all runners would be the same
             # Each runner would return a list of worker stats for different epochs
             worker_stats = [item for item in res if isinstance(item, list)]
+        self._checkpoint_path = None
+        if self.persistent_workers:
+            # the persistent workers keep the trained state, which is the same as the driver
+            self._state_version = init_params["trained_state_version"]
 
         epoch_stats = list(map(list, zip(*worker_stats)))
         if reduce_results:
@@ -389,18 +476,20 @@ class PyTorchPySparkEstimator(BaseEstimator):
         return state_dicts
 
     def _get_broadcasted_state_dict(self, sc):
-        if self.state_dict:
+        if self.state_dict and self._checkpoint_path is None:
             state_dict_b = sc.broadcast(self.state_dict)
         else:
             state_dict_b = None
         return state_dict_b
 
     def _predict_spark_xshards(self, xshards, init_params, params):
+        estimator_id = self._estimator_id
+
         def transform_func(iter, init_param, param):
             partition_data = list(iter)
             # res = combine_in_partition(partition_data)
             param["data_creator"] = make_data_creator(partition_data)
-            return PytorchPysparkWorker(**init_param).predict(**params)
+            return get_runner(init_param, estimator_id).predict(**params)
 
         pred_shards = SparkXShards.lazy(xshards.rdd.mapPartitions(
             lambda iter: transform_func(iter, init_params, params)))
@@ -442,8 +531,10 @@ class PyTorchPySparkEstimator(BaseEstimator):
         init_params = dict(
             mode="predict",
             state_dict=state_dict,
-            cluster_info=cluster_info)
+            cluster_info=cluster_info,
+            checkpoint_path=self._checkpoint_path)
         init_params.update(self.worker_init_params)
+        init_params.update(self._get_persistent_params())
 
         callbacks = callbacks or []
         make_only_mainCallback(callbacks)
@@ -504,7 +595,8 @@ class PyTorchPySparkEstimator(BaseEstimator):
 
         :param data: An instance of SparkXShards, a Spark DataFrame or a function that
                takes config and batch_size as argument and returns a PyTorch DataLoader for
-               validation.
+               validation. The data is streamed from local disk as in fit if "stream_data" is
+               True in config.
         :param batch_size: Total batch size for all workers used for evaluation. Each worker's batch
                size would be this value divide the total number of workers. Default: 32.
                If your validation data is a function, you can set batch_size to be the input
@@ -538,13 +630,19 @@ class PyTorchPySparkEstimator(BaseEstimator):
                               "or load a saved model.")
 
         sc = OrcaContext.get_spark_context()
+        if self.persistent_workers:
+            # the persistent workers for evaluate are distributed ones, the same as fit
+            self.create_tcpstore_server()
         cluster_info = self._get_cluster_info(sc)
         state_dict = self._get_broadcasted_state_dict(sc)
         init_params = dict(
             mode="evaluate",
             state_dict=state_dict,
-            cluster_info=cluster_info)
+            cluster_info=cluster_info,
+            checkpoint_path=self._checkpoint_path)
         init_params.update(self.worker_init_params)
+        init_params.update(self._get_persistent_params())
+        estimator_id = self._estimator_id
 
         # Check uniqueness of the MainCallback
         callbacks = callbacks or []
@@ -576,10 +674,19 @@ class PyTorchPySparkEstimator(BaseEstimator):
             if data._get_class_name() == 'pandas.core.frame.DataFrame':
                 data = process_xshards_of_pandas_dataframe(data, feature_cols, label_cols)
 
-            def transform_func(iter, init_param, param):
-                partition_data = list(iter)
-                param["data_creator"] = partition_to_creator(partition_data)
-                return PytorchPysparkWorker(**init_param).validate(**param)
+            if self.config.get("stream_data", False):
+                def transform_func(iter, init_param, param):
+                    spill, = spill_partition(iter)
+                    try:
+                        param["data_creator"] = shards_to_creator(spill, shuffle=False)
+                        return get_runner(init_param, estimator_id).validate(**param)
+                    finally:
+                        spill.delete()
+            else:
+                def transform_func(iter, init_param, param):
+                    partition_data = list(iter)
+                    param["data_creator"] = partition_to_creator(partition_data)
+                    return get_runner(init_param, estimator_id).validate(**param)
 
             data_rdd = data.rdd  # type:ignore
             res = data_rdd.barrier().mapPartitions(
@@ -588,7 +695,7 @@ class PyTorchPySparkEstimator(BaseEstimator):
             params["data_creator"] = reload_dataloader_creator(data)
 
             def transform_func(iter, init_param, param):
-                return PytorchPysparkWorker(**init_param).validate(**param)
+                return get_runner(init_param, estimator_id).validate(**param)
 
             res = self.workerRDD.barrier().mapPartitions(
                 lambda iter: transform_func(iter, init_params, params)).collect()
@@ -605,7 +712,7 @@ class PyTorchPySparkEstimator(BaseEstimator):
         :return: The learned PyTorch model.
         """
         if self.model_creator:
-            state = self.state_dict
+            state = self.get_state_dict()
             model = self.model_creator(self.config)
             model_state = state["models"][0]
             model.load_state_dict(model_state)
@@ -616,6 +723,8 @@ class PyTorchPySparkEstimator(BaseEstimator):
         return model.module if hasattr(model, "module") else model  # type:ignore
 
     def get_state_dict(self) -> Dict:
+        if self.state_dict is None and self._checkpoint_path is not None:
+            self.state_dict = load_sharded_state_dict(self._checkpoint_path)
         return self.state_dict
 
     def save(self, model_path: str, entire: bool=False) -> str:
@@ -632,7 +741,7 @@ class PyTorchPySparkEstimator(BaseEstimator):
             if entire:
                 torch.save(self.get_model(), model_path)
             else:
-                torch.save(self.state_dict, model_path)
+                torch.save(self.get_state_dict(), model_path)
         else:
             file_name = os.path.basename(model_path)
             temp_dir = tempfile.mkdtemp()
@@ -641,7 +750,7 @@ class PyTorchPySparkEstimator(BaseEstimator):
                 if entire:
                     torch.save(self.get_model(), temp_path)
                 else:
-                    torch.save(self.state_dict, temp_path)
+                    torch.save(self.get_state_dict(), temp_path)
                 put_local_file_to_remote(temp_path, model_path)
             finally:
                 shutil.rmtree(temp_dir)
@@ -674,40 +783,91 @@ class PyTorchPySparkEstimator(BaseEstimator):
                 self.state_dict = [re.state_dict() for re in res]
         else:
             self.state_dict = res.state_dict()
+        self._checkpoint_path = None
         if self.model_creator is None:
             self.model_creator = lambda config: res
             self.worker_init_params["model_creator"] = self.model_creator
+        self._bump_state_version()
 
-    def save_checkpoint(self, model_path: str):
+    def save_checkpoint(self, model_path: str, sharded: bool=False):
         """
         Manually saves the Estimator state (including model and optimizer) to the provided
         model_path.
         :param model_path: (str) Path to save the model. Both local and remote path are supported.
                e.g. "/tmp/estimator.ckpt" or "hdfs:///tmp/estimator.ckpt"
+        :param sharded: (boolean) Whether to save a sharded checkpoint, i.e. a directory where
+               the tensors are split into one file for each worker and written by the workers
+               in parallel, instead of a single file written on the driver. model_path should
+               be accessible by all the workers, e.g. on HDFS or a shared file system.
+               Default is False.
         :return: None
         """
-        if is_local_path(model_path):
+        if sharded:
+            self._save_sharded_checkpoint(model_path)
+        elif is_local_path(model_path):
             self.save(model_path)
         else:
-            self.driver_runner.load_state_dict(self.state_dict)
+            self.driver_runner.load_state_dict(self.get_state_dict())
             self.driver_runner.save_checkpoint(filepath=model_path)
 
+    def _save_sharded_checkpoint(self, model_path):
+        if self.model_creator is None:
+            invalidInputError(False,
+                              "Must provide callable function for model_creator "
+                              "or load a saved model.")
+        sc = OrcaContext.get_spark_context()
+        if self.persistent_workers:
+            self.create_tcpstore_server()
+        init_params = dict(
+            mode="evaluate",
+            state_dict=self._get_broadcasted_state_dict(sc),
+            cluster_info=self._get_cluster_info(sc),
+            checkpoint_path=self._checkpoint_path)
+        init_params.update(self.worker_init_params)
+        init_params.update(self._get_persistent_params())
+        estimator_id = self._estimator_id
+
+        def transform_func(iter, init_param):
+            return get_runner(init_param, estimator_id).save_sharded_checkpoint(model_path)
+
+        self.workerRDD.barrier().mapPartitions(
+            lambda iter: transform_func(iter, init_params)).collect()
+
     def load_checkpoint(self, model_path: str):
         """
         Loads the Estimator state (including model and optimizer) from the provided model_path.
+        A sharded checkpoint is loaded by the workers directly when they are used, and by the
+        driver only if needed, e.g. in get_model.
         :param model_path: (str) Path to the existing model. Both local and remote path are
                supported. e.g. "/tmp/estimator.ckpt" or "hdfs:///tmp/estimator.ckpt"
         :return: None
         """
-        if is_local_path(model_path):
+        if is_sharded_checkpoint(model_path):
+            self.state_dict = None
+            self._checkpoint_path = model_path
+            self._bump_state_version()
+        elif is_local_path(model_path):
             self.load(model_path)
         else:
             self.driver_runner.load_checkpoint(filepath=model_path)
             self.state_dict = self.driver_runner.get_state_dict()
+            self._checkpoint_path = None
+            self._bump_state_version()
 
     def shutdown(self):
         """
         Shutdown estimator and release resources.
         """
+        if self.persistent_workers:
+            estimator_id = self._estimator_id
+
+            def release_func(iter):
+                release_resident_runners(estimator_id)
+                return []
+
+            # best effort, the runners left in the python workers not reached are released
+            # when a new distributed runner is created there or the python workers exit
+            self.workerRDD.mapPartitions(release_func).collect()
+            self._tcp_store = None
         if self.need_to_log_to_driver:
             stop_log_server(self.log_server_thread, self.ip, self.log_port)
@@ -39,10 +39,16 @@ import copy
 from pyspark import BarrierTaskContext, TaskContext
 from bigdl.orca.learn.utils import save_pkl, duplicate_stdout_stderr_to_file, get_rank
 from bigdl.orca.learn.log_monitor import LogMonitor
+from bigdl.orca.learn.pytorch.sharded_checkpoint import prepare_sharded_checkpoint, \
+    save_state_dict_shard, load_sharded_state_dict
 
 
 logger = logging.getLogger(__name__)
 
+# (estimator id, "fit" or "predict") -> the runner kept in this python worker between the
+# jobs of an estimator with persistent workers
+_resident_runners = {}
+
 
 class PytorchPysparkWorker(TorchRunner):
     """Manages a PyTorch model for training."""
@@ -66,7 +72,11 @@ class PytorchPysparkWorker(TorchRunner):
                  log_to_driver=True,
                  driver_ip=None,
                  driver_log_port=None,
-                 driver_tcp_store_port=None
+                 driver_tcp_store_port=None,
+                 driver_tcp_store_prefix=None,
+                 state_version=None,
+                 trained_state_version=None,
+                 checkpoint_path=None
                  ):
         super().__init__(model_creator=model_creator,
                          optimizer_creator=optimizer_creator,
@@ -78,6 +88,12 @@ class PytorchPysparkWorker(TorchRunner):
                          log_level=log_level)
 
         self.state_dict = state_dict
+        # the state is loaded only once for a version, None to load it in every job
+        self.state_version = state_version
+        self.trained_state_version = trained_state_version
+        self._loaded_version = None
+        # the state is loaded from the sharded checkpoint instead of state_dict if not None
+        self.checkpoint_path = checkpoint_path
         self.size = size
         self.mode = mode
         self.backend = backend
@@ -90,7 +106,8 @@ class PytorchPysparkWorker(TorchRunner):
             self.log_path, self.logger_thread, self.thread_stop = \
                 PytorchPysparkWorker._start_log_monitor(driver_ip, driver_log_port)
         if self.backend == "torch-distributed":
-            self.setup_distributed(self.mode, cluster_info, driver_ip, driver_tcp_store_port)
+            self.setup_distributed(self.mode, cluster_info, driver_ip, driver_tcp_store_port,
+                                   driver_tcp_store_prefix)
 
     @staticmethod
     def _start_log_monitor(driver_ip, driver_log_port):
@@ -108,25 +125,48 @@ class PytorchPysparkWorker(TorchRunner):
                                          partition_id=partition_id)
         return log_path, logger_thread, thread_stop
 
-    def setup_distributed(self, mode, cluster_info, driver_ip, driver_tcp_store_port):
+    def setup_distributed(self, mode, cluster_info, driver_ip, driver_tcp_store_port,
+                          driver_tcp_store_prefix=None):
         if mode == "fit":
+            # the default process group of this process is taken by the new runner
+            release_resident_runners(kind="fit")
             self.rank = get_rank(cluster_info)
             logger.info(f"cluster is: {cluster_info}")
             self.setup_components()
             self.setup_torch_distribute(tcp_store_host=driver_ip,
                                         tcp_store_port=driver_tcp_store_port,
                                         world_rank=self.rank,
-                                        world_size=self.size)
+                                        world_size=self.size,
+                                        store_prefix=driver_tcp_store_prefix)
         else:
             self.rank = 0
             self.setup_components()
             if self.model_creator:
                 self.setup_operator(self.models)
 
+    def reuse(self, init_params):
+        """Prepare the resident runner for a new job with its init_params."""
+        self.state_dict = init_params["state_dict"]
+        self.state_version = init_params["state_version"]
+        self.trained_state_version = init_params["trained_state_version"]
+        self.checkpoint_path = init_params["checkpoint_path"]
+        if self.log_to_driver:
+            self.log_path, self.logger_thread, self.thread_stop = \
+                PytorchPysparkWorker._start_log_monitor(init_params["driver_ip"],
+                                                        init_params["driver_log_port"])
+
+    def _load_state(self):
+        if self.state_version is None or self.state_version != self._loaded_version:
+            if self.checkpoint_path is not None:
+                self.load_state_dict(load_sharded_state_dict(self.checkpoint_path))
+            else:
+                self.load_state_dict(self.state_dict.value)
+            self._loaded_version = self.state_version
+
     def train_epochs(self, data_creator, epochs=1, batch_size=32, profile=False,
                      wrap_dataloader=None, callbacks=None,
                      validation_data_creator=None):
-        self.load_state_dict(self.state_dict.value)
+        self._load_state()
         stats_list = super().train_epochs(data_creator=data_creator,
                                           epochs=epochs,
                                           batch_size=batch_size,
@@ -134,6 +174,9 @@ class PytorchPysparkWorker(TorchRunner):
                                           wrap_dataloader=wrap_dataloader,
                                           callbacks=callbacks,
                                           validation_data_creator=validation_data_creator)
+        if self.trained_state_version is not None:
+            # the same as the state on the driver after the job
+            self._loaded_version = self.trained_state_version
         state_dict = self.get_state_dict()
 
         if self.log_to_driver:
@@ -151,7 +194,7 @@ class PytorchPysparkWorker(TorchRunner):
     def validate(self, data_creator, batch_size=32, num_steps=None, profile=False,
                  wrap_dataloader=None, callbacks=None):
         """Evaluates the model on the validation data set."""
-        self.load_state_dict(self.state_dict.value)
+        self._load_state()
         validation_stats = super().validate(data_creator, batch_size, num_steps, profile,
                                             wrap_dataloader, callbacks)
         if self.log_to_driver:
@@ -164,14 +207,84 @@ class PytorchPysparkWorker(TorchRunner):
         self._toggle_profiling(profile=profile)
 
         partition = data_creator(config, batch_size)
-        self.load_state_dict(self.state_dict.value)
+        self._load_state()
         result = super().predict(partition=partition, batch_size=batch_size,
                                  profile=profile, callbacks=callbacks)
         if self.log_to_driver:
             LogMonitor.stop_log_monitor(self.log_path, self.logger_thread, self.thread_stop)
         return result
 
+    def save_sharded_checkpoint(self, filepath):
+        """Saves a shard of the state to the sharded checkpoint in a barrier task."""
+        self._load_state()
+        state_dict = self.get_state_dict()
+        tc = BarrierTaskContext.get()
+        shard, num_shards = tc.partitionId(), len(tc.getTaskInfos())
+        if shard == 0:
+            prepare_sharded_checkpoint(filepath)
+        tc.barrier()
+        if shard != 0:
+            save_state_dict_shard(state_dict, filepath, shard, num_shards)
+        # the shard 0 with the manifest is the last one
+        tc.barrier()
+        if shard == 0:
+            save_state_dict_shard(state_dict, filepath, shard, num_shards)
+        if self.log_to_driver:
+            LogMonitor.stop_log_monitor(self.log_path, self.logger_thread, self.thread_stop)
+        return []
+
     def shutdown(self):
         """Attempts to shut down the worker."""
-        dist.destroy_process_group()
+        if self.mode == "fit" and dist.is_initialized():
+            dist.destroy_process_group()
         super().shutdown()
+
+
+def get_runner(init_params, estimator_id=None):
+    """
+    Create a PytorchPysparkWorker, or get the one kept in this python worker by the previous
+    job of the estimator if estimator_id is not None.
+
+    For the barrier jobs of fit and evaluate, the runners are distributed ones, which are
+    kept only if the runners of all the tasks are kept with the right ranks, otherwise all
+    of them are created again with a new process group. So it must be called in all the
+    tasks of the job.
+
+    :param init_params: The init params of PytorchPysparkWorker.
+    :param estimator_id: The id of the estimator with persistent workers, None to create a
+           new runner.
+    """
+    if estimator_id is None:
+        return PytorchPysparkWorker(**init_params)
+    kind = "predict" if init_params["mode"] == "predict" else "fit"
+    key = (estimator_id, kind)
+    runner = _resident_runners.get(key)
+    kept = runner is not None
+    if kind == "fit":
+        tc = BarrierTaskContext.get()
+        kept = kept and runner.rank == get_rank(init_params["cluster_info"])
+        if hasattr(tc, "allGather"):
+            kept = all(msg == "1" for msg in tc.allGather("1" if kept else "0"))
+        else:
+            # the tasks can't agree on keeping the process group before spark 3.0
+            kept = False
+    if not kept:
+        if runner is not None:
+            _resident_runners.pop(key).shutdown()
+        runner = PytorchPysparkWorker(**dict(init_params, mode=kind))
+        _resident_runners[key] = runner
+    else:
+        runner.reuse(init_params)
+    return runner
+
+
+def release_resident_runners(estimator_id=None, kind=None):
+    """
+    Shut down the runners kept in this python worker.
+
+    :param estimator_id: Only the runners of this estimator if not None.
+    :param kind: Only the runners of this kind ("fit" or "predict") if not None.
+    """
+    for key in list(_resident_runners):
+        if (estimator_id is None or key[0] == estimator_id) and (kind is None or key[1] == kind):
+            _resident_runners.pop(key).shutdown()
@@ -0,0 +1,267 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# A sharded checkpoint is a directory of:
+# | manifest.json: the format, the number of shards and where each tensor is, written last.
+# | meta.pkl: the state dict pickled with the tensors as persistent ids, i.e. their indices
+# |     in the manifest.
+# | shard-<i>-of-<n>.bin: the raw bytes of the tensors of shard i, which are aligned so that
+# |     they can be memory-mapped.
+
+import io
+import os
+import json
+import pickle
+import shutil
+import tempfile
+import subprocess
+
+import numpy as np
+import torch
+
+from bigdl.dllib.utils.file_utils import is_local_path
+from bigdl.dllib.utils.log4Error import invalidInputError
+
+MANIFEST_FILE = "manifest.json"
+META_FILE = "meta.pkl"
+FORMAT_NAME = "orca-sharded-state-dict"
+FORMAT_VERSION = 1
+_ALIGNMENT = 64
+
+
+class _MetaPickler(pickle.Pickler):
+    def __init__(self, file, tensors):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.tensors = tensors
+        # the same view of the same memory (e.g. tied weights, which are different tensors
+        # in a state dict) -> its index, so that it is saved once and loaded as one tensor
+        self.tensor_idxes = {}
+
+    def persistent_id(self, obj):
+        if isinstance(obj, torch.Tensor):
+            key = (obj.device, obj.data_ptr(), obj.dtype, tuple(obj.shape), obj.stride()) \
+                if obj.numel() > 0 else None
+            if key is not None and key in self.tensor_idxes:
+                return self.tensor_idxes[key]
+            self.tensors.append(obj.detach().cpu().contiguous())
+            if key is not None:
+                self.tensor_idxes[key] = len(self.tensors) - 1
+            return len(self.tensors) - 1
+        return None
+
+
+class _MetaUnpickler(pickle.Unpickler):
+    def __init__(self, file, tensors):
+        super().__init__(file)
+        self.tensors = tensors
+
+    def persistent_load(self, pid):
+        return self.tensors[pid]
+
+
+def _local_path(path):
+    return path[len("file://"):] if path.startswith("file://") else path
+
+
+def _shard_file(shard, num_shards):
+    return f"shard-{shard:05d}-of-{num_shards:05d}.bin"
+
+
+def _plan(tensors, num_shards):
+    # assign the tensors to the shards by size, the same on all the workers for the same state
+    loads = [0] * num_shards
+    entries = [None] * len(tensors)
+    for i in sorted(range(len(tensors)), key=lambda i: -tensors[i].nbytes):
+        shard = loads.index(min(loads))
+        offset = loads[shard]
+        entries[i] = {"shard": shard, "offset": offset,
+                      "dtype": str(tensors[i].dtype).replace("torch.", ""),
+                      "shape": list(tensors[i].shape)}
+        loads[shard] = offset + -(-tensors[i].nbytes // _ALIGNMENT) * _ALIGNMENT
+    return entries
+
+
+def _tensor_bytes(tensor):
+    return tensor.reshape(-1).view(torch.uint8).numpy()
+
+
+def _put(local_file, path, file_name):
+    from bigdl.orca.data.file import put_local_file_to_remote
+    if is_local_path(path):
+        os.replace(local_file, os.path.join(_local_path(path), file_name))
+    else:
+        invalidInputError(put_local_file_to_remote(local_file,
+                                                   os.path.join(path, file_name)) == 0,
+                          f"Fail to upload {file_name} to {path}")
+
+
+def _is_checkpoint_file(file_name):
+    return file_name in (MANIFEST_FILE, META_FILE) or \
+        (file_name.startswith("shard-") and file_name.endswith(".bin"))
+
+
+def _remove_checkpoint_files(path):
+    # the manifest first, so that the checkpoint is incomplete once any file is removed
+    def order(file_names):
+        return sorted((name for name in file_names if _is_checkpoint_file(name)),
+                      key=lambda name: name != MANIFEST_FILE)
+
+    if is_local_path(path):
+        local_dir = _local_path(path)
+        for file_name in order(os.listdir(local_dir)):
+            os.remove(os.path.join(local_dir, file_name))
+    elif path.startswith("hdfs://"):
+        from bigdl.orca.data.file import listdir
+        for file_name in order(os.path.basename(p) for p in listdir(path)):
+            cmd = 'hdfs dfs -rm -f {}'.format(os.path.join(path, file_name))
+            result = subprocess.getstatusoutput(cmd)
+            invalidInputError(result[0] == 0, result[1])
+    elif path.startswith("s3"):
+        import boto3
+        s3_client = boto3.Session(
+            aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
+            aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"]).client('s3',
+                                                                              verify=False)
+        path_parts = path.split("://")[1].split('/')
+        bucket = path_parts.pop(0)
+        prefix = "/".join(path_parts).rstrip("/") + "/"
+        response = s3_client.list_objects_v2(Bucket=bucket, Prefix=prefix, Delimiter="/")
+        file_names = [obj["Key"][len(prefix):] for obj in response.get("Contents", [])]
+        for file_name in order(file_names):
+            s3_client.delete_object(Bucket=bucket, Key=prefix + file_name)
+
+
+def prepare_sharded_checkpoint(path):
+    """
+    Create the directory of a sharded checkpoint if needed, or remove the files of the
+    checkpoint saved there before, i.e. the manifest first and then the meta and all the
+    shards (which may be of a different number of shards). It should be called once
+    before any save_state_dict_shard.
+    """
+    from bigdl.orca.data.file import exists, makedirs
+    if is_local_path(path):
+        os.makedirs(_local_path(path), exist_ok=True)
+    elif not exists(path):
+        makedirs(path)
+    _remove_checkpoint_files(path)
+
+
+def save_state_dict_shard(state_dict, path, shard, num_shards):
+    """
+    Save a shard of the state dict to the sharded checkpoint at path. The same state dict
+    should be saved by num_shards workers, each with a different shard in [0, num_shards),
+    and the shard 0 should be saved after all the others are done, which writes the
+    manifest to mark the checkpoint complete.
+
+    :param state_dict: The state dict, e.g. from TorchRunner.get_state_dict.
+    :param path: The directory of the checkpoint, local or remote. It should be accessible
+           by all the workers.
+    :param shard: The shard to save.
+    :param num_shards: The number of shards.
+    """
+    tensors = []
+    meta = io.BytesIO()
+    _MetaPickler(meta, tensors).dump(state_dict)
+    entries = _plan(tensors, num_shards)
+    # under the target directory to rename instead of copying if it is local
+    temp_dir = tempfile.mkdtemp(dir=_local_path(path) if is_local_path(path) else None)
+    try:
+        file_name = _shard_file(shard, num_shards)
+        with open(os.path.join(temp_dir, file_name), "wb") as f:
+            for tensor, entry in zip(tensors, entries):
+                if entry["shard"] == shard:
+                    f.seek(entry["offset"])
+                    f.write(_tensor_bytes(tensor))
+        _put(os.path.join(temp_dir, file_name), path, file_name)
+        if shard == 0:
+            with open(os.path.join(temp_dir, META_FILE), "wb") as f:
+                f.write(meta.getvalue())
+            _put(os.path.join(temp_dir, META_FILE), path, META_FILE)
+            with open(os.path.join(temp_dir, MANIFEST_FILE), "w") as f:
+                json.dump({"format": FORMAT_NAME, "version": FORMAT_VERSION,
+                           "num_shards": num_shards, "tensors": entries}, f)
+            _put(os.path.join(temp_dir, MANIFEST_FILE), path, MANIFEST_FILE)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def is_sharded_checkpoint(path):
+    """
+    Whether path is a complete sharded checkpoint.
+    """
+    from bigdl.orca.data.file import exists
+    return exists(os.path.join(path, MANIFEST_FILE))
+
+
+def load_sharded_state_dict(path, mmap=True):
+    """
+    Load the state dict from the sharded checkpoint at path.
+
+    :param path: The directory of the checkpoint, local or remote. A remote one is
+           downloaded to a temporary directory first.
+    :param mmap: Whether to memory-map the tensors (copy-on-write) instead of reading them
+           into memory, so that they are only read when used, e.g. copied into a model by
+           load_state_dict. Default: True.
+    :return: The state dict.
+    """
+    from bigdl.orca.data.file import get_remote_file_to_local
+    temp_dir = None if is_local_path(path) else tempfile.mkdtemp()
+    local_dir = _local_path(path) if temp_dir is None else temp_dir
+
+    def download(file_name):
+        if temp_dir is not None:
+            invalidInputError(
+                get_remote_file_to_local(os.path.join(path, file_name),
+                                         os.path.join(local_dir, file_name)) == 0,
+                f"Fail to download {file_name} of {path}")
+
+    try:
+        download(MANIFEST_FILE)
+        with open(os.path.join(local_dir, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        invalidInputError(manifest.get("format") == FORMAT_NAME and
+                          manifest.get("version") == FORMAT_VERSION,
+                          f"{path} is not a sharded checkpoint of version {FORMAT_VERSION}")
+        num_shards = manifest["num_shards"]
+        file_names = [META_FILE] + [_shard_file(i, num_shards) for i in range(num_shards)]
+        for file_name in file_names:
+            download(file_name)
+        shards = []
+        for file_name in file_names[1:]:
+            file_path = os.path.join(local_dir, file_name)
+            if os.path.getsize(file_path) == 0:
+                shards.append(np.empty(0, dtype=np.uint8))
+            elif mmap:
+                # the mapping is still valid after the temporary file is removed
+                shards.append(np.memmap(file_path, dtype=np.uint8, mode="c"))
+            else:
+                shards.append(np.fromfile(file_path, dtype=np.uint8))
+        tensors = []
+        for entry in manifest["tensors"]:
+            dtype = getattr(torch, entry["dtype"])
+            nbytes = int(np.prod(entry["shape"], dtype=np.int64)) * \
+                torch.tensor([], dtype=dtype).element_size()
+            if nbytes == 0:
+                # an empty slice can't be viewed as another dtype
+                tensors.append(torch.empty(entry["shape"], dtype=dtype))
+                continue
+            data = shards[entry["shard"]][entry["offset"]:entry["offset"] + nbytes]
+            tensors.append(torch.from_numpy(data).view(dtype).reshape(entry["shape"]))
+        with open(os.path.join(local_dir, META_FILE), "rb") as f:
+            return _MetaUnpickler(f, tensors).load()
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
@@ -0,0 +1,190 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import math
+import pickle
+import tempfile
+
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset, DataLoader
+
+from bigdl.orca.data.utils import combine, index_data, get_size
+
+DEFAULT_SHUFFLE_BUFFER_SIZE = 10000
+
+
+def _get_spill_dir():
+    # the local dirs of spark are usually on the large disks of the node
+    local_dirs = os.environ.get("SPARK_LOCAL_DIRS")
+    if local_dirs:
+        return local_dirs.split(",")[0]
+    return None
+
+
+class ShardSpill:
+    """
+    The shards of a partition pickled one by one to a local file, which can be read back
+    (in any order) many times with only one shard in memory at a time.
+    """
+
+    def __init__(self):
+        fd, self.path = tempfile.mkstemp(prefix="orca_shards_", dir=_get_spill_dir())
+        self._file = os.fdopen(fd, "wb")
+        # the offset and number of records of each shard in the file
+        self.offsets = []
+        self.sizes = []
+
+    def append(self, shard):
+        size = get_size(shard["y"])
+        if size == 0:
+            return
+        self.offsets.append(self._file.tell())
+        self.sizes.append(size)
+        pickle.dump((shard["x"], shard["y"]), self._file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __len__(self):
+        return sum(self.sizes)
+
+    def read(self, shuffle=False):
+        self.close()
+        order = np.random.permutation(len(self.offsets)) if shuffle \
+            else range(len(self.offsets))
+        with open(self.path, "rb") as f:
+            for i in order:
+                f.seek(self.offsets[i])
+                yield pickle.load(f)
+
+    def delete(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def spill_partition(iterator, num_kinds=1):
+    """
+    Spill the shards of a partition to local files.
+
+    :param iterator: An iterator of shards, or (kind, shard) if num_kinds > 1, e.g.
+           0 for the training shards and 1 for the validation shards.
+    :param num_kinds: The number of kinds of the shards.
+    :return: A list of ShardSpill, one for each kind.
+    """
+    spills = [ShardSpill() for _ in range(num_kinds)]
+    try:
+        for item in iterator:
+            kind, shard = item if num_kinds > 1 else (0, item)
+            spills[kind].append(shard)
+    except BaseException:
+        for spill in spills:
+            spill.delete()
+        raise
+    for spill in spills:
+        spill.close()
+    return spills
+
+
+def _to_tensor(data):
+    if isinstance(data, np.ndarray):
+        return torch.from_numpy(data)
+    return type(data)(torch.from_numpy(d) for d in data)
+
+
+class ShardStreamDataset(IterableDataset):
+    """
+    An IterableDataset yielding the batches of a partition of pre-batched ndarray shards,
+    instead of indexing the records of the whole partition in memory one by one.
+
+    The shards are read from a ShardSpill in a random order, and the records are shuffled
+    in a buffer of at most shuffle_buffer_size records (plus a shard).
+    """
+
+    def __init__(self, shards, batch_size, shuffle=True,
+                 shuffle_buffer_size=DEFAULT_SHUFFLE_BUFFER_SIZE, drop_last=False):
+        """
+        :param shards: A ShardSpill.
+        :param batch_size: The batch size.
+        :param shuffle: Whether to shuffle the records.
+        :param shuffle_buffer_size: The max number of records to shuffle at a time.
+        :param drop_last: Whether to drop the last incomplete batch.
+        """
+        self.shards = shards
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.buffer_size = max(shuffle_buffer_size, batch_size)
+        self.drop_last = drop_last
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.shards) // self.batch_size
+        return math.ceil(len(self.shards) / self.batch_size)
+
+    def _batches(self, xs, ys, last):
+        x, y = combine(xs), combine(ys)
+        size = get_size(y)
+        if self.shuffle:
+            idxes = np.random.permutation(size)
+            x, y = index_data(x, idxes), index_data(y, idxes)
+        end = size if last and not self.drop_last else size // self.batch_size * self.batch_size
+        for start in range(0, end, self.batch_size):
+            idxes = slice(start, min(start + self.batch_size, end))
+            yield _to_tensor(index_data(x, idxes)), _to_tensor(index_data(y, idxes))
+        if end < size and not last:
+            # the records not enough for a batch are kept in the buffer
+            rest = slice(end, size)
+            return [index_data(x, rest)], [index_data(y, rest)], size - end
+        return [], [], 0
+
+    def __iter__(self):
+        xs, ys, buffered = [], [], 0
+        for x, y in self.shards.read(self.shuffle):
+            size = get_size(y)
+            if size == 0:
+                continue
+            xs.append(x)
+            ys.append(y)
+            buffered += size
+            if buffered >= self.buffer_size:
+                xs, ys, buffered = yield from self._batches(xs, ys, last=False)
+        if buffered > 0:
+            yield from self._batches(xs, ys, last=True)
+
+
+def shards_to_creator(shards, shuffle=None):
+    """
+    Create a data_creator returning a DataLoader of a ShardStreamDataset on the shards,
+    which takes shuffle, shuffle_buffer_size, drop_last and pin_memory from config.
+
+    :param shards: A ShardSpill.
+    :param shuffle: Whether to shuffle the records, None to take it from config
+           (default to True).
+    """
+    def data_creator(config, batch_size):
+        dataset = ShardStreamDataset(
+            shards, batch_size,
+            shuffle=config.get("shuffle", True) if shuffle is None else shuffle,
+            shuffle_buffer_size=config.get("shuffle_buffer_size", DEFAULT_SHUFFLE_BUFFER_SIZE),
+            drop_last=config.get("drop_last", False))
+        # the dataset yields batches
+        return DataLoader(dataset, batch_size=None, pin_memory=config.get("pin_memory", False))
+
+    return data_creator
@@ -22,7 +22,7 @@ import shutil
 
 from bigdl.dllib.utils import log4Error
 from bigdl.dllib.utils.common import callBigDlFunc
-from bigdl.dllib.utils.file_utils import get_file_list, is_local_path
+from bigdl.dllib.utils.file_utils import get_file_list, is_local_path, callZooFunc
 from bigdl.orca.data import SparkXShards
 from bigdl.orca.data.utils import get_size
 from bigdl.orca.data.file import put_local_dir_tree_to_remote, put_local_file_to_remote,\
@@ -392,8 +392,117 @@ def process_xshards_of_pandas_dataframe(data, feature_cols, label_cols=None, val
         return data
 
 
+def _get_arrow_numpy_dtype(data_type):
+    # the dtype of the ndarrays convert_row_to_numpy gives, or None if the spark type
+    # isn't converted through arrow
+    import pyspark.sql.types as df_types
+    from pyspark.ml.linalg import VectorUDT
+    if isinstance(data_type, VectorUDT):
+        # float32 as DenseVector.values in convert_row_to_numpy, vector_to_array can't tell
+        # SparseVector (whose toArray() is float64 there) apart, so it is float32 as well
+        return np.float32
+    depth = 0
+    while isinstance(data_type, df_types.ArrayType):
+        data_type = data_type.elementType
+        depth += 1
+    if depth > 1:
+        # nested lists are converted by np.array without a cast
+        dtypes = {df_types.FloatType: np.float64, df_types.DoubleType: np.float64,
+                  df_types.IntegerType: np.int64, df_types.LongType: np.int64}
+    else:
+        dtypes = {df_types.FloatType: np.float32, df_types.DoubleType: np.float64,
+                  df_types.IntegerType: np.int32, df_types.LongType: np.int64}
+    return dtypes.get(type(data_type))
+
+
+def _arrow_array_to_numpy(arr, dtype):
+    # arrays of (nested) lists of the same length are converted to one ndarray
+    # of shape (rows, length1, length2, ...), the values are not copied if possible
+    import pyarrow as pa
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.chunk(0) if arr.num_chunks == 1 else pa.concat_arrays(arr.chunks)
+    shape = [len(arr)]
+    while pa.types.is_list(arr.type):
+        lengths = np.diff(arr.offsets.to_numpy())
+        invalidInputError(arr.null_count == 0 and (len(lengths) == 0 or
+                                                   lengths.min() == lengths.max()),
+                          "Elements in the same column must have the same "
+                          "shape, please drop, pad or truncate the columns "
+                          "that do not meet this requirement.")
+        shape.append(int(lengths[0]) if len(lengths) > 0 else 0)
+        arr = arr.flatten()
+    values = arr.to_numpy(zero_copy_only=False)
+    return values.astype(dtype, copy=False).reshape(shape)
+
+
+def _dataframe_to_xshards_by_arrow(data, feature_cols, label_cols=None, shard_size=None):
+    import pyspark.sql.functions as F
+    from pyspark.ml.functions import vector_to_array
+    from pyspark.ml.linalg import VectorUDT
+    from bigdl.dllib.utils.common import get_spark_context, get_spark_sql_context
+
+    schema = data.schema
+    cols = list(dict.fromkeys(feature_cols + (label_cols or [])))
+    dtypes = [_get_arrow_numpy_dtype(schema[col].dataType) for col in cols]
+    # only the feature and label columns are written to arrow, vectors are converted to
+    # arrays in the jvm instead of a python udf
+    data = data.select(*[vector_to_array(F.col(col), "float32").alias(col)
+                         if isinstance(schema[col].dataType, VectorUDT) else F.col(col)
+                         for col in cols])
+    feature_idxes = [cols.index(col) for col in feature_cols]
+    label_idxes = [cols.index(col) for col in label_cols] if label_cols is not None else None
+
+    def to_dict(batch):
+        arrs = [_arrow_array_to_numpy(batch.column(i), dtype) for i, dtype in enumerate(dtypes)]
+
+        def merge(idxes):
+            return arrs[idxes[0]] if len(idxes) == 1 else tuple(arrs[i] for i in idxes)
+
+        if label_idxes is not None:
+            return {"x": merge(feature_idxes), "y": merge(label_idxes)}
+        return {"x": merge(feature_idxes)}
+
+    def to_shards(iter):
+        from pyspark.sql.pandas.serializers import ArrowStreamSerializer
+        import pyarrow as pa
+        for file_name in iter:
+            with open(file_name, "rb") as stream:
+                batches = ArrowStreamSerializer().load_stream(stream)
+                if shard_size:
+                    # each batch holds shard_size rows
+                    for batch in batches:
+                        if batch.num_rows > 0:
+                            yield to_dict(batch)
+                else:
+                    batches = [batch for batch in batches if batch.num_rows > 0]
+                    if batches:
+                        yield to_dict(pa.Table.from_batches(batches).combine_chunks())
+
+    sqlContext = get_spark_sql_context(get_spark_context())
+    # each partition is written to an arrow file, in batches of shard_size rows if provided
+    rdd_file = callZooFunc("float", "sparkdfTopdf", data._jdf, sqlContext, shard_size or -1)
+    return SparkXShards.lazy(rdd_file.mapPartitions(to_shards), class_name="builtins.dict")
+
+
+def _can_convert_by_arrow(data, cols):
+    from bigdl.orca import OrcaContext
+    if not OrcaContext._arrow_conversion:
+        return False
+    import pyspark
+    if pyspark.version.__version__.split(".")[0] < '3':
+        return False
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+    schema = data.schema
+    return all(_get_arrow_numpy_dtype(schema[col].dataType) is not None for col in cols)
+
+
 def _dataframe_to_xshards(data, feature_cols, label_cols=None,
                           accept_str_col=False, shard_size=None):
+    if _can_convert_by_arrow(data, feature_cols + (label_cols or [])):
+        return _dataframe_to_xshards_by_arrow(data, feature_cols, label_cols, shard_size)
     schema = data.schema
     numpy_rdd = data.rdd.map(lambda row: convert_row_to_numpy(row,
                                                               schema,
@@ -88,6 +88,27 @@ class TestSparkXShards(TestCase):
         partitions = partitioned_shard.rdd.glom().collect()
         assert len(partitions) == 3
 
+    def test_partition_by_keeps_rows_and_dtypes(self):
+        file_path = os.path.join(self.resource_path, "orca/data/csv")
+        data_shard = bigdl.orca.data.pandas.read_csv(file_path)
+        dfs = data_shard.collect()
+        num_rows = sum(len(df) for df in dfs)
+        partitioned_shard = data_shard.partition_by(cols="location", num_partitions=3)
+        partitioned_dfs = partitioned_shard.collect()
+        assert sum(len(df) for df in partitioned_dfs) == num_rows
+        # all the rows of a location are in one partition
+        locations = [set(df["location"]) for df in partitioned_dfs]
+        assert sum(len(l) for l in locations) == len(set.union(*locations))
+        for df in partitioned_dfs:
+            assert list(df.columns) == list(dfs[0].columns)
+            assert (df.dtypes == dfs[0].dtypes).all()
+
+        repartitioned_shard = data_shard.repartition(4)
+        repartitioned_dfs = repartitioned_shard.collect()
+        assert sum(len(df) for df in repartitioned_dfs) == num_rows
+        for df in repartitioned_dfs:
+            assert (df.dtypes == dfs[0].dtypes).all()
+
     def test_unique(self):
         file_path = os.path.join(self.resource_path, "orca/data/csv")
         data_shard = bigdl.orca.data.pandas.read_csv(file_path)
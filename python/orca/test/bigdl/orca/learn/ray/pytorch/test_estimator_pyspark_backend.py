@@ -277,6 +277,111 @@ class TestPyTorchEstimator(TestCase):
                                             label_cols=["label"])
         assert train_worker_stats[0]["num_samples"] == 100
 
+    def test_stream_data_train_eval(self):
+        sc = init_nncontext()
+        spark = SparkSession.builder.getOrCreate()
+        rdd = sc.range(0, 100)
+        data = rdd.map(lambda x: (np.random.randn(50).astype(np.float).tolist(),
+                                  [float(np.random.randint(0, 2, size=()))])
+                       )
+        schema = StructType([
+            StructField("feature", ArrayType(FloatType()), True),
+            StructField("label", ArrayType(FloatType()), True)
+        ])
+        df = spark.createDataFrame(data=data, schema=schema)
+        train_df, val_df = df.randomSplit([0.8, 0.2])
+
+        estimator = Estimator.from_torch(model=get_model,
+                                         optimizer=get_optimizer,
+                                         loss=nn.BCELoss(),
+                                         metrics=Accuracy(),
+                                         config={"lr": 1e-2, "stream_data": True,
+                                                 "shuffle_buffer_size": 16},
+                                         workers_per_node=2,
+                                         backend="spark")
+        train_worker_stats = estimator.fit(train_df, batch_size=4, epochs=2,
+                                           feature_cols=["feature"],
+                                           label_cols=["label"],
+                                           validation_data=val_df)
+        assert train_worker_stats[0]["num_samples"] == train_df.count()
+        eval_stats = estimator.evaluate(df, batch_size=4,
+                                        feature_cols=["feature"],
+                                        label_cols=["label"])
+        assert eval_stats["num_samples"] == 100
+
+    def test_persistent_workers(self):
+        sc = init_nncontext()
+        spark = SparkSession.builder.getOrCreate()
+        rdd = sc.range(0, 100)
+        data = rdd.map(lambda x: (np.random.randn(50).astype(np.float).tolist(),
+                                  [float(np.random.randint(0, 2, size=()))])
+                       )
+        schema = StructType([
+            StructField("feature", ArrayType(FloatType()), True),
+            StructField("label", ArrayType(FloatType()), True)
+        ])
+        df = spark.createDataFrame(data=data, schema=schema).cache()
+
+        estimator = Estimator.from_torch(model=get_model,
+                                         optimizer=get_optimizer,
+                                         loss=nn.BCELoss(),
+                                         metrics=Accuracy(),
+                                         config={"lr": 1e-2},
+                                         workers_per_node=2,
+                                         backend="spark",
+                                         persistent_workers=True)
+        estimator.fit(df, batch_size=4, epochs=1, feature_cols=["feature"],
+                      label_cols=["label"])
+        model_path = os.path.join(self.model_dir, "state.pt")
+        estimator.save(model_path)
+        eval_stats1 = estimator.evaluate(df, batch_size=4, feature_cols=["feature"],
+                                         label_cols=["label"])
+
+        train_stats = estimator.fit(df, batch_size=4, epochs=1, feature_cols=["feature"],
+                                    label_cols=["label"])
+        assert train_stats[0]["num_samples"] == 100
+        # the workers load the state changed on the driver
+        estimator.load(model_path)
+        eval_stats2 = estimator.evaluate(df, batch_size=4, feature_cols=["feature"],
+                                         label_cols=["label"])
+        assert round(eval_stats1["val_loss"], 4) == round(eval_stats2["val_loss"], 4)
+        estimator.shutdown()
+
+    def test_sharded_checkpoint(self):
+        sc = init_nncontext()
+        spark = SparkSession.builder.getOrCreate()
+        rdd = sc.range(0, 100)
+        data = rdd.map(lambda x: (np.random.randn(50).astype(np.float).tolist(),
+                                  [float(np.random.randint(0, 2, size=()))])
+                       )
+        schema = StructType([
+            StructField("feature", ArrayType(FloatType()), True),
+            StructField("label", ArrayType(FloatType()), True)
+        ])
+        df = spark.createDataFrame(data=data, schema=schema).cache()
+
+        estimator = get_estimator(workers_per_node=2)
+        estimator.fit(df, batch_size=4, epochs=1, feature_cols=["feature"],
+                      label_cols=["label"])
+        ckpt_path = os.path.join(self.model_dir, "sharded_ckpt")
+        estimator.save_checkpoint(ckpt_path, sharded=True)
+        assert sorted(os.listdir(ckpt_path)) == ["manifest.json", "meta.pkl",
+                                                 "shard-00000-of-00002.bin",
+                                                 "shard-00001-of-00002.bin"]
+        state = estimator.get_state_dict()
+        eval_stats1 = estimator.evaluate(df, batch_size=4, feature_cols=["feature"],
+                                         label_cols=["label"])
+
+        estimator.fit(df, batch_size=4, epochs=1, feature_cols=["feature"],
+                      label_cols=["label"])
+        estimator.load_checkpoint(ckpt_path)
+        eval_stats2 = estimator.evaluate(df, batch_size=4, feature_cols=["feature"],
+                                         label_cols=["label"])
+        assert round(eval_stats1["val_loss"], 4) == round(eval_stats2["val_loss"], 4)
+        loaded_state = estimator.get_state_dict()
+        for name, tensor in state["models"][0].items():
+            assert torch.equal(tensor, loaded_state["models"][0][name])
+
     def test_tensorboard_callback(self):
         from bigdl.orca.learn.pytorch.callbacks.tensorboard import TensorBoardCallback
         sc = OrcaContext.get_spark_context()
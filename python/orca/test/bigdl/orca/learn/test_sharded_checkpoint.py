@@ -0,0 +1,91 @@
+#
+# Copyright 2016 The BigDL Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import os
+import tempfile
+
+import pytest
+import torch
+
+from bigdl.orca.learn.pytorch.sharded_checkpoint import prepare_sharded_checkpoint, \
+    save_state_dict_shard, is_sharded_checkpoint, load_sharded_state_dict
+
+
+def save(state_dict, path, num_shards):
+    prepare_sharded_checkpoint(path)
+    # the shard 0 with the manifest is the last one, as the workers do
+    for shard in list(range(1, num_shards)) + [0]:
+        save_state_dict_shard(state_dict, path, shard, num_shards)
+
+
+def get_state_dict():
+    weight = torch.randn(4, 3)
+    return {"model": {"w": weight,
+                      "tied": weight,
+                      "b": torch.randn(3).half(),
+                      "steps": torch.tensor(7),
+                      "mask": torch.tensor([True, False]),
+                      "empty": torch.zeros(0, 3)},
+            "epoch": 2,
+            "optimizer": {"lr": 0.1, "ids": torch.arange(5)}}
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_sharded_checkpoint_round_trip(mmap):
+    state_dict = get_state_dict()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "ckpt")
+        # more shards than the large tensors, so some shards are empty
+        save(state_dict, path, num_shards=8)
+        assert is_sharded_checkpoint(path)
+        loaded = load_sharded_state_dict(path, mmap=mmap)
+        assert loaded["epoch"] == 2 and loaded["optimizer"]["lr"] == 0.1
+        for expected, actual in [(state_dict["model"][k], loaded["model"][k])
+                                 for k in state_dict["model"]] + \
+                [(state_dict["optimizer"]["ids"], loaded["optimizer"]["ids"])]:
+            assert actual.dtype == expected.dtype
+            assert actual.shape == expected.shape
+            assert torch.equal(actual, expected)
+        # the tied tensors are saved once and still tied
+        assert loaded["model"]["tied"] is loaded["model"]["w"]
+
+
+def test_sharded_checkpoint_tied_state_dict():
+    # a state dict has different tensors of the same memory for tied weights
+    model = torch.nn.Sequential(torch.nn.Linear(3, 3), torch.nn.Linear(3, 3))
+    model[1].weight = model[0].weight
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "ckpt")
+        save(model.state_dict(), path, num_shards=2)
+        loaded = load_sharded_state_dict(path)
+        assert loaded["1.weight"] is loaded["0.weight"]
+        assert torch.equal(loaded["0.weight"], model[0].weight)
+
+
+def test_sharded_checkpoint_overwrite():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "ckpt")
+        save(get_state_dict(), path, num_shards=3)
+        state_dict = get_state_dict()
+        prepare_sharded_checkpoint(path)
+        # the previous checkpoint is removed before any new shard is written
+        assert not is_sharded_checkpoint(path)
+        assert os.listdir(path) == []
+        save(state_dict, path, num_shards=2)
+        assert sorted(os.listdir(path)) == ["manifest.json", "meta.pkl",
+                                            "shard-00000-of-00002.bin",
+                                            "shard-00001-of-00002.bin"]
+        loaded = load_sharded_state_dict(path)
+        assert torch.equal(loaded["model"]["w"], state_dict["model"]["w"])
@@ -214,6 +214,51 @@ class TestUtil(TestCase):
         assert num_shards == df.rdd.count()
         OrcaContext._shard_size = None
 
+    def test_dataframe_to_xshards_by_arrow(self):
+        from pyspark.ml.linalg import DenseVector, SparseVector, VectorUDT
+        from pyspark.sql.types import StructType, StructField, ArrayType, FloatType, LongType
+        from bigdl.orca import OrcaContext
+        rdd = self.sc.range(0, 100)
+        schema = StructType([StructField("feature", ArrayType(ArrayType(FloatType()))),
+                             StructField("vector", VectorUDT()),
+                             StructField("mixed", VectorUDT()),
+                             StructField("id", LongType()),
+                             StructField("label", ArrayType(FloatType()))])
+        df = rdd.map(lambda x: ([[float(x), float(x + 1)]] * 3,
+                                DenseVector([float(x)] * 4),
+                                SparseVector(4, {0: float(x)}) if x >= 90
+                                else DenseVector([float(x)] * 4),
+                                x,
+                                [float(x % 2)])
+                     ).toDF(schema).cache()
+
+        def collect(shard_size=None):
+            shards = _dataframe_to_xshards(df, feature_cols=["feature", "vector", "mixed", "id"],
+                                           label_cols=["label"], shard_size=shard_size)
+            return shards.collect()
+
+        for shard_size in [None, 30]:
+            arrow_shards = collect(shard_size)
+            OrcaContext._arrow_conversion = False
+            row_shards = collect(shard_size)
+            OrcaContext._arrow_conversion = True
+            assert len(arrow_shards) == len(row_shards)
+            for arrow_shard, row_shard in zip(arrow_shards, row_shards):
+                for arrow_arr, row_arr in zip(arrow_shard["x"] + (arrow_shard["y"],),
+                                              row_shard["x"] + (row_shard["y"],)):
+                    assert np.array_equal(arrow_arr, row_arr)
+                feature, vector, mixed, ids = arrow_shard["x"]
+                # nested lists are float64 and dense vectors are float32 as the row path
+                assert feature.dtype == row_shard["x"][0].dtype == np.float64
+                assert vector.dtype == row_shard["x"][1].dtype == np.float32
+                assert ids.dtype == row_shard["x"][3].dtype
+                assert arrow_shard["y"].dtype == row_shard["y"].dtype == np.float32
+                # sparse vectors are float32 as well, while the row path gives float64
+                assert mixed.dtype == np.float32
+                assert row_shard["x"][2].dtype == \
+                    (np.float64 if (ids >= 90).any() else np.float32)
+        df.unpersist()
+
 
 if __name__ == "__main__":
     pytest.main([__file__])